@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+DATABASE_PATH = 'inventory.db'
+SNAPSHOT_PREFIX = 'inventory-'
+SNAPSHOT_SUFFIX = '.db'
+MAX_REPORT_ITEMS = 10
+
+def snapshot_name(moment=None):
+    """Имя снимка по времени создания (UTC): inventory-20250222-153000.db"""
+    moment = moment or datetime.now(timezone.utc)
+    return f"{SNAPSHOT_PREFIX}{moment:%Y%m%d-%H%M%S}{SNAPSHOT_SUFFIX}"
+
+def list_snapshots(backup_dir):
+    """Снимки каталога от новых к старым: [(путь, размер, время создания)]"""
+    if not os.path.isdir(backup_dir):
+        return []
+    snapshots = []
+    for file_name in os.listdir(backup_dir):
+        if not (file_name.startswith(SNAPSHOT_PREFIX) and file_name.endswith(SNAPSHOT_SUFFIX)):
+            continue
+        stamp = file_name[len(SNAPSHOT_PREFIX):-len(SNAPSHOT_SUFFIX)]
+        try:
+            created = datetime.strptime(stamp, '%Y%m%d-%H%M%S').replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+        path = os.path.join(backup_dir, file_name)
+        snapshots.append((path, os.path.getsize(path), created))
+    snapshots.sort(key=lambda item: item[2], reverse=True)
+    return snapshots
+
+def copy_database(source_path, target_path, pages=256, pause=0.05):
+    """Копирует базу через online backup API SQLite.
+
+    Копирование идет шагами по pages страниц с паузой pause секунд между ними:
+    блокировка на чтение держится только на время шага, и бот продолжает писать.
+    Если база изменилась между шагами, SQLite сам начинает копирование заново,
+    поэтому снимок всегда согласован.
+    """
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target, pages=pages, sleep=pause)
+    finally:
+        target.close()
+        source.close()
+
+def verify_snapshot(path):
+    """Проверяет копию базы: PRAGMA integrity_check и версия схемы.
+
+    Возвращает (ok, описание). Копия открывается только на чтение.
+    """
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    except sqlite3.Error as e:
+        return False, f"не открывается: {e}"
+    try:
+        problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        stamps = conn.execute("SELECT COUNT(*) FROM Stamps").fetchone()[0]
+    except sqlite3.Error as e:
+        return False, f"ошибка чтения: {e}"
+    finally:
+        conn.close()
+    if problems != ['ok']:
+        return False, '; '.join(problems[:MAX_REPORT_ITEMS])
+    return True, f"схема версии {version}, штампов {stamps}"
+
+def prune_snapshots(backup_dir, keep, retention_days):
+    """Удаляет снимки сверх keep последних и старше retention_days дней.
+
+    Самый свежий снимок не удаляется никогда. Возвращает число удаленных.
+    """
+    snapshots = list_snapshots(backup_dir)
+    oldest_allowed = time.time() - retention_days * 24 * 60 * 60
+    removed = 0
+    for index, (path, _, created) in enumerate(snapshots):
+        if index == 0:
+            continue
+        if index >= keep or (retention_days and created.timestamp() < oldest_allowed):
+            os.remove(path)
+            removed += 1
+    return removed
+
+def make_snapshot(backup_dir, pages=256, pause=0.05, source_path=DATABASE_PATH):
+    """Создает проверенный снимок базы; возвращает (путь, размер, секунды, описание проверки).
+
+    Копия пишется во временный файл и получает свое имя только после
+    integrity_check, поэтому в каталоге не бывает недописанных снимков.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    path = os.path.join(backup_dir, snapshot_name())
+    temp_path = path + '.tmp'
+    started = time.perf_counter()
+    try:
+        copy_database(source_path, temp_path, pages, pause)
+        ok, details = verify_snapshot(temp_path)
+        if not ok:
+            raise RuntimeError(f"копия не прошла проверку: {details}")
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return path, os.path.getsize(path), time.perf_counter() - started, details
+
+def restore_snapshot(path, target_path=DATABASE_PATH):
+    """Восстанавливает базу из снимка (бот должен быть остановлен).
+
+    Снимок сначала проверяется; текущая база перед заменой сохраняется рядом
+    с расширением .before-restore.
+    """
+    ok, details = verify_snapshot(path)
+    if not ok:
+        raise RuntimeError(f"Снимок {path} поврежден: {details}")
+    if os.path.exists(target_path):
+        copy_database(target_path, target_path + '.before-restore', pages=-1)
+    copy_database(path, target_path, pages=-1)
+    return details
+
+class DatabaseBackup:
+    """Снимки базы по расписанию с ротацией и по команде администратора"""
+
+    def __init__(self, backup_dir, keep=7, retention_days=30, pages=256, pause=0.05, run_blocking=asyncio.to_thread):
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.retention_days = retention_days
+        self.pages = pages
+        self.pause = pause
+        self.run_blocking = run_blocking
+        self._lock = asyncio.Lock()
+
+    async def run_backup(self):
+        """Снимок и ротация; одновременно выполняется не больше одного копирования"""
+        async with self._lock:
+            path, size, elapsed, details = await self.run_blocking(
+                make_snapshot, self.backup_dir, self.pages, self.pause
+            )
+            removed = await self.run_blocking(prune_snapshots, self.backup_dir, self.keep, self.retention_days)
+        logger.info(
+            f"Резервная копия {path} создана за {elapsed:.1f} с: {size / 1024:.0f} КБ, {details}, "
+            f"удалено старых копий: {removed}"
+        )
+        return path, size, elapsed, details
+
+    def seconds_until_due(self, interval):
+        """Сколько ждать до следующей копии по времени последнего снимка (переживает перезапуск)"""
+        snapshots = list_snapshots(self.backup_dir)
+        if not snapshots:
+            return 0
+        age = time.time() - snapshots[0][2].timestamp()
+        return max(0, interval - age)
+
+def format_snapshots(backup_dir):
+    """Список последних снимков для ответа администратору"""
+    snapshots = list_snapshots(backup_dir)
+    if not snapshots:
+        return "Резервных копий пока нет."
+    message = f"Резервные копии ({len(snapshots)}):\n"
+    for path, size, created in snapshots[:MAX_REPORT_ITEMS]:
+        message += f"• {os.path.basename(path)} - {size / 1024:.0f} КБ, {created:%Y-%m-%d %H:%M} UTC\n"
+    return message
+
+if __name__ == '__main__':
+    # python backup.py [каталог]               - снимок сейчас
+    # python backup.py verify <снимок>         - проверить копию
+    # python backup.py restore <снимок>        - восстановить inventory.db (бот остановлен)
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else 'backups'
+    if command == 'verify' and len(sys.argv) > 2:
+        ok, details = verify_snapshot(sys.argv[2])
+        print(f"{'OK' if ok else 'ОШИБКА'}: {details}")
+        sys.exit(0 if ok else 1)
+    elif command == 'restore' and len(sys.argv) > 2:
+        print(f"База восстановлена: {restore_snapshot(sys.argv[2])}")
+    else:
+        path, size, elapsed, details = make_snapshot(command)
+        print(f"{path}: {size / 1024:.0f} КБ за {elapsed:.1f} с, {details}")
@@ -0,0 +1,272 @@
+import asyncio
+import itertools
+import json
+import logging
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from urllib.parse import parse_qsl
+
+logger = logging.getLogger(__name__)
+
+BOT_INFO = {
+    'id': 1,
+    'is_bot': True,
+    'first_name': 'Homut Bench',
+    'username': 'homut_bench_bot',
+    'can_join_groups': False,
+    'can_read_all_group_messages': False,
+    'supports_inline_queries': True,
+}
+
+# Методы, которыми бот отвечает пользователю: по первому из них считается задержка шага
+CONTENT_METHODS = {
+    'sendMessage', 'editMessageText', 'editMessageReplyMarkup', 'editMessageCaption',
+    'sendDocument', 'sendPhoto', 'sendMediaGroup',
+}
+
+class OutboundCall:
+    """Запрос бота к Bot API, записанный фейковым сервером"""
+
+    def __init__(self, seq, method, params):
+        self.seq = seq
+        self.method = method
+        self.params = params
+        self.time = time.perf_counter()
+        self.chat_id = params.get('chat_id')
+        self.message_id = params.get('message_id')
+
+    @property
+    def reply_markup(self):
+        markup = self.params.get('reply_markup')
+        return markup.get('inline_keyboard', []) if isinstance(markup, dict) else []
+
+def _decode_value(value):
+    # Бот передает вложенные объекты и числа как JSON-строки
+    try:
+        return json.loads(value)
+    except (ValueError, TypeError):
+        return value
+
+class FakeBotAPI:
+    """Локальная замена Bot API для нагрузочных тестов.
+
+    Отдает обновления через getUpdates (long polling) или отправляет их на
+    webhook бота, записывает все исходящие запросы бота и отдает файлы
+    для getFile. Бот подключается к нему через TELEGRAM_API_BASE_URL и
+    TELEGRAM_API_BASE_FILE_URL.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8081):
+        self.host = host
+        self.port = port
+        self.calls = []
+        self.method_counts = {}
+        self._seq = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1000)
+        self._updates = []
+        self._updates_changed = asyncio.Event()
+        self._calls_changed = asyncio.Event()
+        self._files = {}
+        self._server = None
+        self._connections = {}
+        self._closing = False
+        self.ready = asyncio.Event()
+        self.webhook = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        logger.info(f"Фейковый Bot API слушает {self.host}:{self.port}")
+
+    async def stop(self):
+        if self._server:
+            self._closing = True
+            self._server.close()
+            for writer in list(self._connections):
+                writer.close()
+            # Будим незавершенные long polling запросы, чтобы их соединения закрылись
+            self._updates_changed.set()
+            await asyncio.gather(*self._connections.values(), return_exceptions=True)
+            await self._server.wait_closed()
+
+    # --- Обновления от «пользователей» ---
+
+    def next_message_id(self):
+        return next(self._message_ids)
+
+    def add_file(self, file_id, content):
+        self._files[file_id] = content
+
+    async def push_update(self, update):
+        """Передает обновление боту; возвращает номер последнего записанного запроса бота"""
+        update['update_id'] = next(self._update_ids)
+        mark = len(self.calls)
+        if self.webhook:
+            await self._post_webhook(update)
+        else:
+            self._updates.append(update)
+            self._updates_changed.set()
+        return mark
+
+    async def _post_webhook(self, update):
+        url, secret = self.webhook
+        host, _, rest = url.removeprefix('http://').partition('/')
+        hostname, _, port = host.partition(':')
+        body = json.dumps(update).encode()
+        reader, writer = await asyncio.open_connection(hostname, int(port or 80))
+        try:
+            writer.write(
+                f"POST /{rest} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\nContent-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+            await reader.read()
+        finally:
+            writer.close()
+
+    async def wait_for_reply(self, chat_id, after, timeout):
+        """Первый ответ бота в чат chat_id после записи номер after (или None по таймауту)"""
+        deadline = time.perf_counter() + timeout
+        position = after
+        while True:
+            for call in self.calls[position:]:
+                if call.method in CONTENT_METHODS and call.chat_id == chat_id:
+                    return call
+            position = len(self.calls)
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None
+            self._calls_changed.clear()
+            try:
+                await asyncio.wait_for(self._calls_changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return None
+
+    # --- HTTP ---
+
+    async def _handle_connection(self, reader, writer):
+        if self._closing:
+            writer.close()
+            return
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                body = await reader.readexactly(length) if length else b''
+
+                status, content_type, payload = await self._route(path, headers, body)
+                writer.write(
+                    f"HTTP/1.1 {status} OK\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def _route(self, path, headers, body):
+        if path.startswith('/file/bot'):
+            file_id = path.rsplit('/', 1)[-1]
+            content = self._files.get(file_id)
+            if content is None:
+                return 404, 'text/plain', b''
+            return 200, 'application/octet-stream', content
+
+        api_method = path.split('?', 1)[0].rsplit('/', 1)[-1]
+        params = self._parse_params(headers.get('content-type', ''), body)
+        result = await self._call(api_method, params)
+        return 200, 'application/json', json.dumps({'ok': True, 'result': result}).encode()
+
+    @staticmethod
+    def _parse_params(content_type, body):
+        if not body:
+            return {}
+        if content_type.startswith('application/json'):
+            return json.loads(body)
+        if content_type.startswith('multipart/form-data'):
+            message = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {content_type}\r\n\r\n".encode() + body
+            )
+            params = {}
+            for part in message.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                if part.get_filename():
+                    params[name] = {'filename': part.get_filename(), 'size': len(part.get_payload(decode=True) or b'')}
+                else:
+                    params[name] = _decode_value(part.get_content())
+            return params
+        return {key: _decode_value(value) for key, value in parse_qsl(body.decode())}
+
+    async def _call(self, api_method, params):
+        if api_method == 'getUpdates':
+            return await self._get_updates(params)
+
+        if api_method == 'getMe':
+            return BOT_INFO
+        if api_method == 'setWebhook':
+            self.webhook = (params['url'], params.get('secret_token', ''))
+            self.ready.set()
+            return True
+        if api_method == 'deleteWebhook':
+            self.webhook = None
+            return True
+        if api_method == 'getFile':
+            file_id = params['file_id']
+            return {
+                'file_id': file_id,
+                'file_unique_id': file_id,
+                'file_size': len(self._files.get(file_id, b'')),
+                'file_path': f"documents/{file_id}",
+            }
+
+        call = OutboundCall(next(self._seq), api_method, params)
+        self.calls.append(call)
+        self.method_counts[api_method] = self.method_counts.get(api_method, 0) + 1
+        self._calls_changed.set()
+
+        if api_method in CONTENT_METHODS:
+            if api_method.startswith('edit') and 'inline_message_id' in params:
+                return True
+            call.message_id = call.message_id or self.next_message_id()
+            message = {
+                'message_id': call.message_id,
+                'date': int(time.time()),
+                'chat': {'id': call.chat_id, 'type': 'private'},
+                'from': BOT_INFO,
+                'text': params.get('text', ''),
+            }
+            if isinstance(params.get('reply_markup'), dict):
+                message['reply_markup'] = params['reply_markup']
+            if api_method == 'sendMediaGroup':
+                return [message]
+            return message
+        return True
+
+    async def _get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        self._updates = [update for update in self._updates if update['update_id'] >= offset]
+        if not self._updates and timeout:
+            self._updates_changed.clear()
+            try:
+                await asyncio.wait_for(self._updates_changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.ready.set()
+        limit = int(params.get('limit') or 100)
+        return self._updates[:limit]
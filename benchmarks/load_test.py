@@ -0,0 +1,215 @@
+"""Нагрузочный тест бота на фейковом Bot API.
+
+Запускает бота отдельным процессом на копии базы, подключает его к
+локальному фейковому Bot API и прогоняет сценарии N виртуальными
+пользователями одновременно. Печатает p50/p95/p99 задержки по шагам
+(обработчикам) и число обновлений в секунду, сохраняет результат в JSON
+для сравнения с прошлыми прогонами:
+
+    python benchmarks/load_test.py --users 20 --iterations 5
+    python benchmarks/load_test.py --users 20 --compare benchmarks/results/<прошлый>.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from fake_bot_api import FakeBotAPI
+from virtual_users import VirtualUser, StepFailed, FLOWS, pick_flow
+
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BENCH_TOKEN = '123456:bench'
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+
+def percentile(values, share):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+class Recorder:
+    """Задержки и ошибки по шагам"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.failures = {}
+
+    def record(self, name, seconds):
+        self.latencies.setdefault(name, []).append(seconds)
+
+    def failure(self, name):
+        self.failures[name] = self.failures.get(name, 0) + 1
+
+    def summary(self):
+        steps = {}
+        for name in sorted(set(self.latencies) | set(self.failures)):
+            values = self.latencies.get(name, [])
+            steps[name] = {
+                'count': len(values),
+                'failures': self.failures.get(name, 0),
+                'p50_ms': percentile(values, 0.50) * 1000,
+                'p95_ms': percentile(values, 0.95) * 1000,
+                'p99_ms': percentile(values, 0.99) * 1000,
+                'max_ms': max(values) * 1000 if values else 0.0,
+            }
+        return steps
+
+def prepare_workdir():
+    """Копия базы во временном каталоге: тест не трогает рабочие данные"""
+    workdir = tempfile.mkdtemp(prefix='homut_bench_')
+    shutil.copy(os.path.join(REPO_DIR, 'inventory.db'), workdir)
+    os.makedirs(os.path.join(workdir, 'drawings'), exist_ok=True)
+    return workdir
+
+def start_bot(workdir, api_port, mode, webhook_port):
+    env = dict(os.environ)
+    env.update({
+        'TELEGRAM_TOKEN': BENCH_TOKEN,
+        'TELEGRAM_API_BASE_URL': f"http://127.0.0.1:{api_port}/bot",
+        'TELEGRAM_API_BASE_FILE_URL': f"http://127.0.0.1:{api_port}/file/bot",
+        'BOT_MODE': mode,
+        'WEBHOOK_URL': f"http://127.0.0.1:{webhook_port}/telegram",
+        'WEBHOOK_LISTEN': '127.0.0.1',
+        'WEBHOOK_PORT': str(webhook_port),
+        'WEBHOOK_PATH': '/telegram',
+        'WEBHOOK_SECRET': 'bench-secret',
+        'ADMIN_IDS': '',
+    })
+    log = open(os.path.join(workdir, 'bot.log'), 'w')
+    return subprocess.Popen(
+        [sys.executable, os.path.join(REPO_DIR, 'homut.py')],
+        cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+async def run_user(api, recorder, user_id, args, deadline):
+    user = VirtualUser(api, user_id, recorder, args.think_time)
+    runs = 0
+    while (args.iterations and runs < args.iterations) or (not args.iterations and time.perf_counter() < deadline):
+        runs += 1
+        flow_name, flow = pick_flow(args.flows)
+        try:
+            await flow(user)
+        except StepFailed as e:
+            logger.warning(f"Пользователь {user_id}, сценарий {flow_name}: {e}")
+
+def print_report(result, baseline=None):
+    print(f"\nПользователей: {result['users']}, режим: {result['mode']}, "
+          f"длительность: {result['duration_s']:.1f} с, обновлений: {result['updates']}, "
+          f"обновлений/с: {result['updates_per_second']:.1f}")
+    header = f"{'шаг':36} {'n':>6} {'ошиб':>5} {'p50 мс':>9} {'p95 мс':>9} {'p99 мс':>9}"
+    if baseline:
+        header += f" {'p95 было':>9} {'Δ p95':>8}"
+    print(header)
+    for name, step in result['steps'].items():
+        line = (f"{name:36} {step['count']:>6} {step['failures']:>5} "
+                f"{step['p50_ms']:>9.1f} {step['p95_ms']:>9.1f} {step['p99_ms']:>9.1f}")
+        previous = baseline['steps'].get(name) if baseline else None
+        if previous and previous['p95_ms']:
+            change = (step['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] * 100
+            line += f" {previous['p95_ms']:>9.1f} {change:>+7.0f}%"
+        print(line)
+    if baseline:
+        change = (result['updates_per_second'] - baseline['updates_per_second']) / baseline['updates_per_second'] * 100
+        print(f"Обновлений/с: было {baseline['updates_per_second']:.1f}, изменение {change:+.0f}%")
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return ''
+
+async def main(args):
+    random.seed(args.seed)
+    api = FakeBotAPI(port=args.api_port)
+    await api.start()
+
+    bot = None
+    workdir = None
+    if not args.no_spawn:
+        workdir = prepare_workdir()
+        bot = start_bot(workdir, args.api_port, args.mode, args.webhook_port)
+        logger.info(f"Бот запущен (pid {bot.pid}), рабочий каталог {workdir}")
+    try:
+        await asyncio.wait_for(api.ready.wait(), args.startup_timeout)
+        logger.info("Бот готов, запускаю виртуальных пользователей")
+
+        recorder = Recorder()
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(
+            run_user(api, recorder, 100000 + index, args, deadline) for index in range(args.users)
+        ))
+        duration = time.perf_counter() - started
+    finally:
+        if bot:
+            bot.terminate()
+            try:
+                bot.wait(15)
+            except subprocess.TimeoutExpired:
+                bot.kill()
+        await api.stop()
+
+    steps = recorder.summary()
+    updates = sum(step['count'] + step['failures'] for step in steps.values())
+    result = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'mode': args.mode,
+        'users': args.users,
+        'flows': sorted(args.flows),
+        'duration_s': duration,
+        'updates': updates,
+        'updates_per_second': updates / duration if duration else 0.0,
+        'api_calls': api.method_counts,
+        'steps': steps,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{datetime.now():%Y%m%d-%H%M%S}-{args.mode}-{args.users}u.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультат сохранен: {path}")
+    if workdir:
+        print(f"Лог бота: {os.path.join(workdir, 'bot.log')}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на фейковом Bot API")
+    parser.add_argument('--users', type=int, default=10, help="число одновременных виртуальных пользователей")
+    parser.add_argument('--iterations', type=int, default=3, help="сценариев на пользователя (0 - по времени)")
+    parser.add_argument('--duration', type=float, default=60, help="длительность при --iterations 0, с")
+    parser.add_argument('--flows', nargs='+', default=list(FLOWS), choices=list(FLOWS))
+    parser.add_argument('--mode', choices=['polling', 'webhook'], default='polling')
+    parser.add_argument('--think-time', type=float, default=0.0, help="пауза пользователя перед шагом (до), с")
+    parser.add_argument('--api-port', type=int, default=8081)
+    parser.add_argument('--webhook-port', type=int, default=8443)
+    parser.add_argument('--startup-timeout', type=float, default=60)
+    parser.add_argument('--no-spawn', action='store_true', help="не запускать бота (уже запущен вручную)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=RESULTS_DIR)
+    parser.add_argument('--compare', help="JSON прошлого прогона для сравнения")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
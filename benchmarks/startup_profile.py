@@ -0,0 +1,110 @@
+"""Профиль холодного запуска бота.
+
+Время импорта по модулям (python -X importtime для import homut) и время
+от запуска процесса до первого ответа на /start на фейковом Bot API:
+
+    python benchmarks/startup_profile.py
+    python benchmarks/startup_profile.py --first-response --runs 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from fake_bot_api import FakeBotAPI
+from virtual_users import VirtualUser, StepFailed
+from load_test import Recorder, prepare_workdir, start_bot
+
+def import_times():
+    """[(модуль, собственное время, с вложенными, глубина)] в микросекундах"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import homut'],
+        cwd=REPO_DIR, capture_output=True, text=True,
+    )
+    if result.returncode:
+        sys.exit(f"import homut завершился с ошибкой:\n{result.stderr[-2000:]}")
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+def project_modules():
+    return {name[:-3] for name in os.listdir(REPO_DIR) if name.endswith('.py')}
+
+def print_import_report(entries, top):
+    total = sum(self_us for _, self_us, _, _ in entries)
+    print(f"Импорт homut: {total / 1000:.0f} мс, модулей {len(entries)}\n")
+
+    # Пакеты верхнего уровня: telegram.ext.* -> telegram
+    packages = {}
+    for name, self_us, _, _ in entries:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+    print(f"{'пакет':30} {'мс':>8} {'доля':>6}")
+    for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"{package:30} {self_us / 1000:>8.1f} {self_us / total:>6.0%}")
+
+    local = project_modules()
+    print(f"\n{'модуль проекта':30} {'свое мс':>8} {'с вложенными мс':>16}")
+    for name, self_us, cumulative_us, _ in sorted(entries, key=lambda item: item[2], reverse=True):
+        if name in local:
+            print(f"{name:30} {self_us / 1000:>8.1f} {cumulative_us / 1000:>16.1f}")
+
+async def first_response(api_port):
+    """Секунды от запуска процесса бота до готовности и до ответа на /start"""
+    api = FakeBotAPI(port=api_port)
+    await api.start()
+    workdir = prepare_workdir()
+    started = time.perf_counter()
+    bot = start_bot(workdir, api_port, 'polling', 0)
+    try:
+        await asyncio.wait_for(api.ready.wait(), 120)
+        ready = time.perf_counter() - started
+        user = VirtualUser(api, 100000, Recorder())
+        await user.command('start', '/start')
+        return ready, time.perf_counter() - started
+    finally:
+        bot.terminate()
+        try:
+            bot.wait(15)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+        await api.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Профиль холодного запуска бота")
+    parser.add_argument('--top', type=int, default=15, help="сколько пакетов показать")
+    parser.add_argument('--first-response', action='store_true',
+                        help="измерить время до первого ответа на /start (запускает бота)")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--api-port', type=int, default=8081)
+    args = parser.parse_args()
+
+    print_import_report(import_times(), args.top)
+
+    if args.first_response:
+        results = []
+        for run in range(args.runs):
+            try:
+                results.append(asyncio.run(first_response(args.api_port)))
+            except (StepFailed, asyncio.TimeoutError) as e:
+                sys.exit(f"Запуск {run + 1}: бот не ответил ({e})")
+        ready = [item[0] for item in results]
+        answered = [item[1] for item in results]
+        print(f"\nЗапусков: {args.runs}")
+        print(f"До опроса обновлений: медиана {statistics.median(ready):.2f} с, максимум {max(ready):.2f} с")
+        print(f"До ответа на /start: медиана {statistics.median(answered):.2f} с, максимум {max(answered):.2f} с")
+
+if __name__ == '__main__':
+    main()
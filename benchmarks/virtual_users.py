@@ -0,0 +1,159 @@
+import asyncio
+import itertools
+import random
+import re
+import time
+
+# Сколько ждать ответа бота на один шаг
+STEP_TIMEOUT_SECONDS = 30
+
+class StepFailed(Exception):
+    pass
+
+class VirtualUser:
+    """Пользователь, который нажимает кнопки из последнего ответа бота.
+
+    Каждый шаг - одно обновление; его задержка - время от передачи
+    обновления до первого ответа бота в этот чат.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, api, user_id, recorder, think_time=0.0):
+        self.api = api
+        self.user_id = user_id
+        self.recorder = recorder
+        self.think_time = think_time
+        self.keyboard = []
+        self.message_id = None
+        self.last_text = ''
+
+    @property
+    def _user(self):
+        return {'id': self.user_id, 'is_bot': False, 'first_name': f"User{self.user_id}"}
+
+    @property
+    def _chat(self):
+        return {'id': self.user_id, 'type': 'private', 'first_name': f"User{self.user_id}"}
+
+    def _message(self, **fields):
+        message = {
+            'message_id': self.api.next_message_id(),
+            'date': int(time.time()),
+            'chat': self._chat,
+            'from': self._user,
+        }
+        message.update(fields)
+        return message
+
+    async def _step(self, name, update):
+        if self.think_time:
+            await asyncio.sleep(random.uniform(0, self.think_time))
+        started = time.perf_counter()
+        mark = await self.api.push_update(update)
+        reply = await self.api.wait_for_reply(self.user_id, mark, STEP_TIMEOUT_SECONDS)
+        if reply is None:
+            self.recorder.failure(name)
+            raise StepFailed(f"{name}: бот не ответил за {STEP_TIMEOUT_SECONDS} с")
+        self.recorder.record(name, reply.time - started)
+
+        self.last_text = reply.params.get('text', '')
+        if reply.reply_markup or reply.method == 'sendMessage':
+            self.keyboard = reply.reply_markup
+        if reply.message_id:
+            self.message_id = reply.message_id
+        return reply
+
+    async def command(self, name, text):
+        entities = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return await self._step(name, {'message': self._message(text=text, entities=entities)})
+
+    async def text(self, name, text):
+        return await self._step(name, {'message': self._message(text=text)})
+
+    async def document(self, name, file_name, content):
+        file_id = f"bench{next(self._ids)}_{self.user_id}"
+        self.api.add_file(file_id, content)
+        document = {
+            'file_id': file_id,
+            'file_unique_id': file_id,
+            'file_name': file_name,
+            'mime_type': 'application/pdf',
+            'file_size': len(content),
+        }
+        return await self._step(name, {'message': self._message(document=document)})
+
+    def buttons(self, pattern):
+        return [
+            button['callback_data'] for row in self.keyboard for button in row
+            if 'callback_data' in button and re.match(pattern, button['callback_data'])
+        ]
+
+    async def click(self, name, pattern, choose=random.choice):
+        options = self.buttons(pattern)
+        if not options:
+            self.recorder.failure(name)
+            raise StepFailed(f"{name}: нет кнопки {pattern} в ответе «{self.last_text[:60]}»")
+        message = {
+            'message_id': self.message_id or self.api.next_message_id(),
+            'date': int(time.time()),
+            'chat': self._chat,
+            'from': {'id': 1, 'is_bot': True, 'first_name': 'Homut Bench'},
+            'text': self.last_text,
+            'reply_markup': {'inline_keyboard': self.keyboard},
+        }
+        callback_query = {
+            'id': f"{self.user_id}{next(self._ids)}",
+            'from': self._user,
+            'message': message,
+            'chat_instance': str(self.user_id),
+            'data': choose(options),
+        }
+        return await self._step(name, {'callback_query': callback_query})
+
+# --- Сценарии ---
+
+async def balance_flow(user):
+    """Меню -> остаток пуансонов штампа -> +1 три раза -> Готово"""
+    await user.command('start', '/start')
+    await user.click('menu:inventory_stamps', '^inventory_stamps$')
+    await user.click('menu:inventory', '^inventory_')
+    await user.click('menu:stamp', '^stamp_')
+    await user.click('menu:punches', '^punches_')
+    await user.click('show_balance', '^showbalance')
+    await user.click('change_quantity_callback', '^changequantity')
+    if not user.buttons('^item_'):
+        return
+    await user.click('item_name_received', '^item_')
+    for _ in range(3):
+        await user.click('adjust_quantity_callback', r'^adjust_quantity:\+1$')
+    await user.click('done_adjustment', '^done_adjustment$')
+
+async def compatibility_flow(user):
+    """Меню совместимости -> проверка совместимости для штампа"""
+    await user.command('start', '/start')
+    await user.click('show_compatibility_menu', '^compatibility_parts$')
+    await user.click('check_compatibility', '^check_compatibility$')
+    await user.click('show_compatible_parts', '^check_stamp_')
+
+async def drawing_upload_flow(user):
+    """Меню чертежей -> загрузка небольшого PDF на случайный штамп"""
+    await user.command('start', '/start')
+    await user.click('show_drawings_menu', '^drawings$')
+    await user.click('start_drawing_upload', '^upload_drawing$')
+    await user.click('handle_drawing_file:stamp', '^upload_for_stamp_')
+    content = b'%PDF-1.4\n' + random.randbytes(32 * 1024)
+    await user.document('handle_drawing_file:document', f"bench_{user.user_id}.pdf", content)
+
+# Сценарий и его доля среди прогонов виртуального пользователя
+FLOWS = {
+    'balance': (balance_flow, 6),
+    'compatibility': (compatibility_flow, 3),
+    'drawing_upload': (drawing_upload_flow, 1),
+}
+
+def pick_flow(enabled):
+    names = [name for name in FLOWS if name in enabled]
+    weights = [FLOWS[name][1] for name in names]
+    name = random.choices(names, weights)[0]
+    return name, FLOWS[name][0]
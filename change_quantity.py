@@ -10,6 +10,9 @@ import logging
 from menu import menu, create_inventory_submenus, inventory_list, get_menu_keyboard, back_to_menu_keyboard
 from database import get_stamp_id_by_action
 from showballance import show_balance
+from substitutes import invalidate_substitutes
+from part_search import part_search_index
+from timeutil import now_epoch
 from constants import States
 
 logger = logging.getLogger(__name__)
@@ -86,7 +89,7 @@ async def change_quantity_callback(update: Update, context: ContextTypes.DEFAULT
 
         # Получаем список позиций для данного штампа и категории
         items = await get_items_in_category(context.application.db, item_type, stamp_id)
-        logger.info(f"Retrieved items: {items}")
+        logger.debug("Retrieved items: %s", items)
 
         if not items:
             await query.message.reply_text(
@@ -99,7 +102,6 @@ async def change_quantity_callback(update: Update, context: ContextTypes.DEFAULT
         keyboard = []
         for item in items:
             callback_data = f"item_{item['id']}"  # Убедимся, что формат callback_data соответствует pattern в ConversationHandler
-            logger.info(f"Creating button with callback_data: {callback_data}")
             keyboard.append([InlineKeyboardButton(item['name'], callback_data=callback_data)])
         keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data='go_back')])
 
@@ -219,6 +221,7 @@ async def item_name_received(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
         # Save item data in context
         context.user_data.update({
+            'selected_item_id': item_id,
             'selected_item_name': item_name,
             'current_quantity': current_quantity,
             'new_quantity': current_quantity,
@@ -256,7 +259,7 @@ async def adjust_quantity_callback(update: Update, context: ContextTypes.DEFAULT
 
     data = query.data  # Например, 'adjust_quantity:+1'
     logger.info(f"Callback data received: {data}")
-    logger.info(f"Context user_data: {context.user_data}")
+    logger.debug("Context user_data: %s", context.user_data)
 
     pattern = r'^adjust_quantity:([+-]\d+)$'
     match = re.match(pattern, data)
@@ -318,13 +321,14 @@ async def done_adjustment(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await query.message.reply_text("Количество уже изменено, можете нажать кнопку 'Назад'.")
         return States.CHANGE_QTY_ADJUSTING_QUANTITY  # Остаёмся в текущем состоянии
 
+    item_id = context.user_data.get('selected_item_id')
     item_name = context.user_data.get('selected_item_name')
     new_quantity = context.user_data.get('new_quantity')
     item_type = context.user_data.get('item_type')
     action = context.user_data.get('action')
     db = context.application.db
 
-    if item_name is None or new_quantity is None or item_type is None or action is None:
+    if item_id is None or item_name is None or new_quantity is None or item_type is None or action is None:
         await query.message.reply_text("Не удалось получить информацию о выбранном элементе.")
         return ConversationHandler.END
 
@@ -350,18 +354,20 @@ async def done_adjustment(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await query.message.reply_text("Штамп не найден.")
         return ConversationHandler.END
 
-    # Обновляем количество в базе данных с учетом московского времени
+    # Обновляем количество в базе данных
     try:
         await db.execute(
             f"""
             UPDATE {table} 
             SET quantity = ?, 
-                last_modified = datetime('now', '+3 hours') 
-            WHERE stamp_id = ? AND name = ?
+                last_modified = ?
+            WHERE id = ? AND stamp_id = ?
             """,
-            (new_quantity, stamp_id, item_name),
+            (new_quantity, now_epoch(), item_id, stamp_id),
         )
         await db.commit()
+        invalidate_substitutes()
+        await part_search_index.refresh_stamp(table, stamp_id)
     except Exception as e:
         logger.exception("Ошибка при обновлении базы данных: %s", e)
         await query.message.reply_text("Ошибка при обновлении данных.")
@@ -416,7 +422,7 @@ async def save_and_exit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     await query.answer()
 
     # Проверяем наличие всех необходимых данных
-    required_data = ['selected_item_name', 'new_quantity', 'item_type', 'action']
+    required_data = ['selected_item_id', 'selected_item_name', 'new_quantity', 'item_type', 'action']
     if not all(key in context.user_data for key in required_data):
         await query.message.reply_text(
             "Не удалось получить информацию о выбранном элементе.",
@@ -426,7 +432,7 @@ async def save_and_exit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 
     # Если изменения еще не сохранены
     if not context.user_data.get('changes_saved'):
-        item_name = context.user_data['selected_item_name']
+        item_id = context.user_data['selected_item_id']
         new_quantity = context.user_data['new_quantity']
         item_type = context.user_data['item_type']
         action = context.user_data['action']
@@ -463,10 +469,12 @@ async def save_and_exit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         # Обновляем количество в базе данных
         try:
             await db.execute(
-                f"UPDATE {table} SET quantity = ? WHERE stamp_id = ? AND name = ?",
-                (new_quantity, stamp_id, item_name),
+                f"UPDATE {table} SET quantity = ? WHERE id = ? AND stamp_id = ?",
+                (new_quantity, item_id, stamp_id),
             )
             await db.commit()
+            invalidate_substitutes()
+            await part_search_index.refresh_stamp(table, stamp_id)
             await query.message.reply_text("Изменения успешно сохранены.")
         except Exception as e:
             logger.exception("Ошибка при обновлении базы данных: %s", e)
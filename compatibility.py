@@ -2,11 +2,18 @@ import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from database import get_connection
+from compatibility_graph import compatibility_graph
 from menu import back_to_menu_keyboard
 from constants import States
+from pickers import open_picker, PICKER_PARTS
 
 logger = logging.getLogger(__name__)
 
+def _compatibility_sort_key(compatibility):
+    """Порядок вывода: штамп, деталь, тип связи, заметки (их может не быть)"""
+    target_stamp, part_type, direct, notes = compatibility
+    return target_stamp, part_type, direct, notes or ''
+
 async def show_compatibility_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает главное меню совместимости деталей"""
     query = update.callback_query
@@ -45,27 +52,12 @@ async def check_compatibility(update: Update, context: ContextTypes.DEFAULT_TYPE
     query = update.callback_query
     await query.answer()
 
-    # Получаем список штампов из базы данных
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name FROM Stamps ORDER BY name")
-    stamps = cursor.fetchall()
-    conn.close()
-
-    keyboard = []
-    for stamp_id, stamp_name in stamps:
-        keyboard.append([InlineKeyboardButton(
-            stamp_name, 
-            callback_data=f"check_stamp_{stamp_id}"
-        )])
-    
-    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="back_to_compatibility")])
-
-    await query.message.edit_text(
+    return await open_picker(
+        query, context, States.CHECKING_COMPATIBILITY,
         "Выберите штамп, для которого хотите проверить совместимость деталей:",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        "check_stamp_", "back_to_compatibility",
+        flow="compatibility"
     )
-    return States.CHECKING_COMPATIBILITY
 
 async def show_compatible_parts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает список совместимых деталей для выбранного штампа"""
@@ -78,36 +70,33 @@ async def show_compatible_parts(update: Update, context: ContextTypes.DEFAULT_TY
     cursor = conn.cursor()
 
     try:
-        # Получаем информацию о выбранном штампе
-        cursor.execute("SELECT name FROM Stamps WHERE id = ?", (stamp_id,))
-        stamp_name = cursor.fetchone()[0]
-
-        # Получаем список совместимых деталей
-        cursor.execute("""
-            SELECT 
-                s.name as target_stamp,
-                pc.part_type,
-                pc.notes
-            FROM Parts_Compatibility pc
-            JOIN Stamps s ON s.id = pc.target_stamp_id
-            WHERE pc.source_stamp_id = ?
-            ORDER BY s.name, pc.part_type
-        """, (stamp_id,))
-
-        compatibilities = cursor.fetchall()
+        cursor.execute("SELECT id, name FROM Stamps")
+        stamp_names = dict(cursor.fetchall())
+        stamp_name = stamp_names[stamp_id]
+
+        # Прямые связи и связи через цепочку берем из графа совместимости
+        compatibilities = sorted(
+            (
+                (stamp_names.get(other_id, str(other_id)), compatibility_graph.get_label(key), direct, notes)
+                for key, other_id, direct, notes in compatibility_graph.compatible_with_stamp(stamp_id)
+            ),
+            key=_compatibility_sort_key
+        )
 
         if not compatibilities:
             message = f"Для штампа {stamp_name} не найдено совместимых деталей."
         else:
             message = f"Совместимые детали для штампа {stamp_name}:\n\n"
             current_stamp = None
-            for target_stamp, part_type, notes in compatibilities:
+            for target_stamp, part_type, direct, notes in compatibilities:
                 if current_stamp != target_stamp:
                     message += f"\n🔹 {target_stamp}:\n"
                     current_stamp = target_stamp
                 message += f"  • {part_type}"
                 if notes:
                     message += f" ({notes})"
+                if not direct:
+                    message += " ⛓ через цепочку"
                 message += "\n"
 
         keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="back_to_stamp_list")]]
@@ -133,26 +122,12 @@ async def add_compatibility_start(update: Update, context: ContextTypes.DEFAULT_
     query = update.callback_query
     await query.answer()
 
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name FROM Stamps ORDER BY name")
-    stamps = cursor.fetchall()
-    conn.close()
-
-    keyboard = []
-    for stamp_id, stamp_name in stamps:
-        keyboard.append([InlineKeyboardButton(
-            stamp_name, 
-            callback_data=f"source_stamp_{stamp_id}"
-        )])
-    
-    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="back_to_compatibility")])
-
-    await query.message.edit_text(
+    return await open_picker(
+        query, context, States.ADDING_COMPATIBILITY_SOURCE,
         "Выберите исходный штамп для добавления совместимости:",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        "source_stamp_", "back_to_compatibility",
+        flow="compatibility"
     )
-    return States.ADDING_COMPATIBILITY_SOURCE
 
 async def select_target_stamp(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Выбор целевого штампа для совместимости"""
@@ -162,34 +137,14 @@ async def select_target_stamp(update: Update, context: ContextTypes.DEFAULT_TYPE
     source_stamp_id = int(query.data.split('_')[2])
     context.user_data['source_stamp_id'] = source_stamp_id
 
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Получаем все штампы кроме исходного
-    cursor.execute("""
-        SELECT id, name 
-        FROM Stamps 
-        WHERE id != ? 
-        ORDER BY name
-    """, (source_stamp_id,))
-    
-    stamps = cursor.fetchall()
-    conn.close()
-
-    keyboard = []
-    for stamp_id, stamp_name in stamps:
-        keyboard.append([InlineKeyboardButton(
-            stamp_name, 
-            callback_data=f"target_stamp_{stamp_id}"
-        )])
-    
-    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="back_to_source_selection")])
-
-    await query.message.edit_text(
+    # Все штампы кроме исходного
+    return await open_picker(
+        query, context, States.ADDING_COMPATIBILITY_TARGET,
         "Выберите штамп, с которым есть совместимые детали:",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        "target_stamp_", "back_to_source_selection",
+        exclude=[source_stamp_id],
+        flow="compatibility"
     )
-    return States.ADDING_COMPATIBILITY_TARGET
 
 async def select_part_type_and_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Выбор типа детали и указание имени"""
@@ -230,7 +185,7 @@ async def handle_part_name_input(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     await query.answer()
 
-    part_type = query.data.split('_')[2]
+    part_type = query.data.split('_', 2)[2]  # part_type_Disc_Parts -> Disc_Parts
     context.user_data['part_type'] = part_type
 
     # Используем точное имя таблицы из базы данных
@@ -240,18 +195,11 @@ async def handle_part_name_input(update: Update, context: ContextTypes.DEFAULT_T
     cursor = conn.cursor()
 
     try:
-        # Получаем список деталей для выбранного штампа
+        # Проверяем, есть ли детали выбранного типа у штампа
         source_stamp_id = context.user_data.get('source_stamp_id')
-        cursor.execute(f"""
-            SELECT id, name, size, description 
-            FROM {table_name} 
-            WHERE stamp_id = ?
-            ORDER BY name
-        """, (source_stamp_id,))
-
-        parts = cursor.fetchall()
+        cursor.execute(f"SELECT 1 FROM {table_name} WHERE stamp_id = ? LIMIT 1", (source_stamp_id,))
 
-        if not parts:
+        if not cursor.fetchone():
             await query.message.edit_text(
                 f"❌ В базе нет деталей типа '{table_name}' для выбранного штампа.\n"
                 "Сначала добавьте детали в инвентарь штампа.",
@@ -261,25 +209,13 @@ async def handle_part_name_input(update: Update, context: ContextTypes.DEFAULT_T
             )
             return States.ADDING_COMPATIBILITY_TYPE
 
-        keyboard = []
-        for part_id, name, size, description in parts:
-            display_text = name
-            if size:
-                display_text += f" ({size})"
-            if description:
-                display_text += f" - {description}"
-            keyboard.append([InlineKeyboardButton(
-                display_text,
-                callback_data=f"select_part_{name}"
-            )])
-
-        keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="back_to_type_selection")])
-
-        await query.message.edit_text(
+        return await open_picker(
+            query, context, States.ADDING_COMPATIBILITY_NAME,
             "Выберите существующую деталь из списка:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            "select_part_", "back_to_type_selection",
+            source=[PICKER_PARTS, table_name, source_stamp_id],
+            flow="compatibility"
         )
-        return States.ADDING_COMPATIBILITY_NAME
     
     except Exception as e:
         logger.error(f"Ошибка при получении списка деталей: {e}")
@@ -298,8 +234,29 @@ async def handle_part_selection(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
 
-    part_name = query.data.split('_', 2)[2]  # select_part_NAME -> NAME
-    context.user_data['part_name'] = part_name
+    part_id = int(query.data.split('_')[2])  # select_part_ID -> ID
+    part_type = context.user_data.get('part_type')
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT name, stamp_id FROM {part_type} WHERE id = ?", (part_id,))
+        part = cursor.fetchone()
+    finally:
+        conn.close()
+
+    if not part:
+        await query.message.edit_text(
+            "❌ Деталь не найдена. Возможно, она была удалена.",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("🔙 Назад", callback_data="back_to_type_selection")
+            ]])
+        )
+        return States.ADDING_COMPATIBILITY_TYPE
+
+    context.user_data['part_id'] = part_id
+    context.user_data['part_name'] = part[0]
+    context.user_data['part_owner_id'] = part[1]
 
     keyboard = [[InlineKeyboardButton("Пропустить", callback_data="skip_notes")]]
 
@@ -373,6 +330,7 @@ async def save_compatibility(update: Update, context: ContextTypes.DEFAULT_TYPE)
     target_stamp_id = context.user_data['target_stamp_id']
     part_type = context.user_data['part_type']
     part_name = context.user_data.get('part_name', '')
+    part_id = context.user_data.get('part_id')
 
     conn = get_connection()
     cursor = conn.cursor()
@@ -380,28 +338,31 @@ async def save_compatibility(update: Update, context: ContextTypes.DEFAULT_TYPE)
     try:
         # Формируем полное описание типа детали с именем
         full_part_type = f"{part_type} - {part_name}" if part_name else part_type
+        stamp_a_id, stamp_b_id = sorted((source_stamp_id, target_stamp_id))
 
+        # Связь симметрична и хранится одной строкой с упорядоченной парой штампов
         cursor.execute("""
             INSERT INTO Parts_Compatibility 
-            (source_stamp_id, target_stamp_id, part_type, notes) 
-            VALUES (?, ?, ?, ?)
-        """, (source_stamp_id, target_stamp_id, full_part_type, notes))
-
-        # Добавляем обратную совместимость
-        cursor.execute("""
-            INSERT INTO Parts_Compatibility 
-            (source_stamp_id, target_stamp_id, part_type, notes) 
-            VALUES (?, ?, ?, ?)
-        """, (target_stamp_id, source_stamp_id, full_part_type, notes))
+            (category, part_id, stamp_a_id, stamp_b_id, notes) 
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(stamp_a_id, stamp_b_id, category, part_id) DO UPDATE SET
+                notes = COALESCE(excluded.notes, notes),
+                updatedAt = CURRENT_TIMESTAMP
+        """, (part_type, part_id, stamp_a_id, stamp_b_id, notes))
 
         conn.commit()
 
+        compatibility_graph.add_link(
+            (part_type, part_id), stamp_a_id, stamp_b_id,
+            context.user_data.get('part_owner_id'), full_part_type, notes
+        )
+
         # Получаем названия штампов для сообщения
-        cursor.execute("SELECT name FROM Stamps WHERE id IN (?, ?)", 
+        cursor.execute("SELECT id, name FROM Stamps WHERE id IN (?, ?)", 
                       (source_stamp_id, target_stamp_id))
-        stamps = cursor.fetchall()
-        source_stamp_name = stamps[0][0]
-        target_stamp_name = stamps[1][0]
+        stamps = dict(cursor.fetchall())
+        source_stamp_name = stamps[source_stamp_id]
+        target_stamp_name = stamps[target_stamp_id]
 
         message = (f"✅ Совместимость успешно добавлена!\n\n"
                   f"Штампы: {source_stamp_name} ⟷ {target_stamp_name}\n"
@@ -445,28 +406,24 @@ async def edit_compatibility_start(update: Update, context: ContextTypes.DEFAULT
     cursor = conn.cursor()
 
     try:
-        # Получаем список существующих совместимостей с уникальными комбинациями
+        # Каждая связь хранится одной строкой, зеркальные дубли отсеивать не нужно
         cursor.execute("""
-            SELECT DISTINCT 
-                pc1.id,
+            SELECT 
+                pc.id,
                 s1.name as source_stamp,
                 s2.name as target_stamp,
-                pc1.part_type,
-                pc1.notes
-            FROM Parts_Compatibility pc1
-            JOIN Stamps s1 ON s1.id = pc1.source_stamp_id
-            JOIN Stamps s2 ON s2.id = pc1.target_stamp_id
-            WHERE NOT EXISTS (
-                SELECT 1 
-                FROM Parts_Compatibility pc2
-                WHERE pc2.source_stamp_id = pc1.target_stamp_id
-                AND pc2.target_stamp_id = pc1.source_stamp_id
-                AND pc2.id < pc1.id
-            )
-            ORDER BY s1.name, s2.name, pc1.part_type
+                pc.category,
+                pc.part_id,
+                pc.notes
+            FROM Parts_Compatibility pc
+            JOIN Stamps s1 ON s1.id = pc.stamp_a_id
+            JOIN Stamps s2 ON s2.id = pc.stamp_b_id
         """)
 
-        compatibilities = cursor.fetchall()
+        compatibilities = sorted(
+            (source, target, compatibility_graph.get_label((category, part_id)), comp_id, notes)
+            for comp_id, source, target, category, part_id, notes in cursor.fetchall()
+        )
 
         if not compatibilities:
             keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="back_to_compatibility")]]
@@ -477,7 +434,7 @@ async def edit_compatibility_start(update: Update, context: ContextTypes.DEFAULT
             return States.COMPATIBILITY_MENU
 
         keyboard = []
-        for comp_id, source, target, part_type, notes in compatibilities:
+        for source, target, part_type, comp_id, notes in compatibilities:
             display_text = f"{source} ↔ {target}: {part_type}"
             if notes:
                 display_text += f" ({notes})"
@@ -517,12 +474,12 @@ async def handle_edit_compatibility_choice(update: Update, context: ContextTypes
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("""
-        SELECT pc.part_type, pc.notes,
+        SELECT pc.category, pc.part_id, pc.notes,
                s1.name as source_stamp,
                s2.name as target_stamp
         FROM Parts_Compatibility pc
-        JOIN Stamps s1 ON s1.id = pc.source_stamp_id
-        JOIN Stamps s2 ON s2.id = pc.target_stamp_id
+        JOIN Stamps s1 ON s1.id = pc.stamp_a_id
+        JOIN Stamps s2 ON s2.id = pc.stamp_b_id
         WHERE pc.id = ?
     """, (comp_id,))
 
@@ -538,7 +495,8 @@ async def handle_edit_compatibility_choice(update: Update, context: ContextTypes
         )
         return States.COMPATIBILITY_MENU
 
-    part_type, notes, source_stamp, target_stamp = compatibility
+    category, part_id, notes, source_stamp, target_stamp = compatibility
+    part_type = compatibility_graph.get_label((category, part_id))
     message = (f"Текущая совместимость:\n"
               f"Штампы: {source_stamp} ↔ {target_stamp}\n"
               f"Тип детали: {part_type}\n")
@@ -581,26 +539,25 @@ async def handle_edit_compatibility_delete(update: Update, context: ContextTypes
         # Получаем информацию о совместимости перед удалением
         cursor.execute("""
             SELECT 
-                s1.name, s2.name, pc.part_type,
-                pc.source_stamp_id, pc.target_stamp_id
+                s1.name, s2.name, pc.category, pc.part_id,
+                pc.stamp_a_id, pc.stamp_b_id
             FROM Parts_Compatibility pc
-            JOIN Stamps s1 ON s1.id = pc.source_stamp_id
-            JOIN Stamps s2 ON s2.id = pc.target_stamp_id
+            JOIN Stamps s1 ON s1.id = pc.stamp_a_id
+            JOIN Stamps s2 ON s2.id = pc.stamp_b_id
             WHERE pc.id = ?
         """, (comp_id,))
         compatibility = cursor.fetchone()
 
         if compatibility:
-            source_stamp, target_stamp, part_type, source_id, target_id = compatibility
+            source_stamp, target_stamp, category, part_id, stamp_a_id, stamp_b_id = compatibility
+            key = (category, part_id)
+            part_type = compatibility_graph.get_label(key)
 
-            # Удаляем прямую и обратную записи о совместимости
-            cursor.execute("""
-                DELETE FROM Parts_Compatibility 
-                WHERE (source_stamp_id = ? AND target_stamp_id = ?) 
-                OR (source_stamp_id = ? AND target_stamp_id = ?)
-            """, (source_id, target_id, target_id, source_id))
+            # Удаляем только выбранную связь, остальные детали этой пары штампов остаются
+            cursor.execute("DELETE FROM Parts_Compatibility WHERE id = ?", (comp_id,))
 
             conn.commit()
+            compatibility_graph.remove_link(key, stamp_a_id, stamp_b_id)
 
             message = (f"✅ Совместимость успешно удалена:\n"
                       f"Штампы: {source_stamp} ↔ {target_stamp}\n"
@@ -662,6 +619,14 @@ async def save_edited_notes(update: Update, context: ContextTypes.DEFAULT_TYPE):
             WHERE id = ?
         """, (new_notes, comp_id))
         conn.commit()
+
+        cursor.execute(
+            "SELECT category, part_id, stamp_a_id, stamp_b_id FROM Parts_Compatibility WHERE id = ?",
+            (comp_id,)
+        )
+        link = cursor.fetchone()
+        if link:
+            compatibility_graph.set_notes((link[0], link[1]), link[2], link[3], new_notes)
         message = "✅ Заметки успешно обновлены!"
     except Exception as e:
         logger.error(f"Ошибка при обновлении заметок: {e}")
@@ -717,36 +682,21 @@ async def back_to_stamp_list(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
 
     # Очищаем временные данные
-    for key in ['editing_compatibility_id', 'editing_notes', 'source_stamp_id', 'target_stamp_id', 'part_type', 'part_name']:
+    for key in ['editing_compatibility_id', 'editing_notes', 'source_stamp_id', 'target_stamp_id', 'part_type', 'part_name', 'part_id', 'part_owner_id']:
         if key in context.user_data:
             del context.user_data[key]
 
-    # Получаем список штампов из базы данных
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name FROM Stamps ORDER BY name")
-    stamps = cursor.fetchall()
-    conn.close()
-
-    keyboard = []
-    for stamp_id, stamp_name in stamps:
-        keyboard.append([InlineKeyboardButton(
-            stamp_name, 
-            callback_data=f"check_stamp_{stamp_id}"
-        )])
-
-    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="back_to_compatibility")])
-
-    await query.message.edit_text(
+    return await open_picker(
+        query, context, States.CHECKING_COMPATIBILITY,
         "Выберите штамп, для которого хотите проверить совместимость деталей:",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        "check_stamp_", "back_to_compatibility",
+        flow="compatibility"
     )
-    return States.CHECKING_COMPATIBILITY
 
 async def back_to_source_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Возврат к выбору исходного штампа"""
     # Очищаем временные данные, кроме необходимых для навигации
-    for key in ['target_stamp_id', 'part_type', 'part_name']:
+    for key in ['target_stamp_id', 'part_type', 'part_name', 'part_id', 'part_owner_id']:
         if key in context.user_data:
             del context.user_data[key]
     return await add_compatibility_start(update, context)
@@ -754,7 +704,7 @@ async def back_to_source_selection(update: Update, context: ContextTypes.DEFAULT
 async def back_to_target_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Возврат к выбору целевого штампа"""
     # Очищаем временные данные, сохраняя source_stamp_id
-    for key in ['part_type', 'part_name']:
+    for key in ['part_type', 'part_name', 'part_id', 'part_owner_id']:
         if key in context.user_data:
             del context.user_data[key]
     return await select_target_stamp(update, context)
@@ -762,8 +712,9 @@ async def back_to_target_selection(update: Update, context: ContextTypes.DEFAULT
 async def back_to_type_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Возврат к выбору типа детали"""
     # Очищаем временные данные, сохраняя stamp_ids
-    if 'part_name' in context.user_data:
-        del context.user_data['part_name']
+    for key in ['part_name', 'part_id', 'part_owner_id']:
+        if key in context.user_data:
+            del context.user_data[key]
     return await select_part_type_and_name(update, context)
 
 async def back_to_compat_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -0,0 +1,186 @@
+import logging
+from collections import defaultdict, deque
+from database import get_connection
+
+logger = logging.getLogger(__name__)
+
+class CompatibilityGraph:
+    """Граф совместимости деталей в памяти.
+
+    Ключ детали - (category, part_id) из Parts_Compatibility; part_id = None
+    означает связь на уровне всей категории. Для каждой детали хранится неориентированный граф штампов, на которых
+    она применима, и заранее посчитанные компоненты связности, так что
+    вопрос «на какие штампы подходит деталь, в том числе по цепочке»
+    решается одним обращением к словарю.
+    """
+
+    def __init__(self):
+        # Растет при каждом изменении графа, по нему сбрасываются зависимые кэши
+        self.version = 0
+        self._reset()
+
+    def _reset(self):
+        self.version += 1
+        # key -> stamp_id -> соседние штампы
+        self._adjacency = defaultdict(lambda: defaultdict(set))
+        # key -> frozenset({a, b}) -> заметки
+        self._notes = defaultdict(dict)
+        self._labels = {}
+        self._owners = {}
+        # key -> stamp_id -> frozenset штампов компоненты
+        self._components = {}
+        # stamp_id -> ключи деталей, в графах которых участвует штамп
+        self._stamp_keys = defaultdict(set)
+
+    def load(self):
+        """Полностью перестраивает граф из Parts_Compatibility"""
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT category, part_id, stamp_a_id, stamp_b_id, notes
+                FROM Parts_Compatibility
+            """)
+            rows = cursor.fetchall()
+            parts = self._load_parts(cursor, {(row[0], row[1]) for row in rows if row[1] is not None})
+        finally:
+            conn.close()
+
+        self._reset()
+        for category, part_id, stamp_a_id, stamp_b_id, notes in rows:
+            key = (category, part_id)
+            owner, label = parts.get(key, (None, category))
+            self._add_edge(key, stamp_a_id, stamp_b_id, owner, label, notes)
+
+        for key in self._adjacency:
+            self._rebuild_components(key)
+        logger.info(f"Граф совместимости загружен: деталей {len(self._adjacency)}, связей {len(rows)}")
+
+    @staticmethod
+    def _load_parts(cursor, keys):
+        """Возвращает key -> (штамп-владелец, подпись) для существующих деталей"""
+        by_category = defaultdict(list)
+        for category, part_id in keys:
+            by_category[category].append(part_id)
+
+        parts = {}
+        for category, part_ids in by_category.items():
+            placeholders = ', '.join('?' for _ in part_ids)
+            cursor.execute(
+                f"SELECT id, stamp_id, name FROM {category} WHERE id IN ({placeholders})",
+                part_ids
+            )
+            for part_id, stamp_id, name in cursor.fetchall():
+                parts[(category, part_id)] = (stamp_id, f"{category} - {name}")
+        return parts
+
+    def _add_edge(self, key, stamp_a, stamp_b, owner, label, notes):
+        self._adjacency[key][stamp_a].add(stamp_b)
+        self._adjacency[key][stamp_b].add(stamp_a)
+        if notes:
+            self._notes[key][frozenset((stamp_a, stamp_b))] = notes
+        self._labels[key] = label
+        if owner is not None:
+            self._owners[key] = owner
+            self._adjacency[key][owner]
+        for stamp_id in self._adjacency[key]:
+            self._stamp_keys[stamp_id].add(key)
+
+    def _rebuild_components(self, key):
+        """Пересчитывает компоненты связности графа одной детали"""
+        graph = self._adjacency.get(key)
+        if not graph:
+            self._components.pop(key, None)
+            return
+
+        components = {}
+        for start in graph:
+            if start in components:
+                continue
+            seen = {start}
+            queue = deque([start])
+            while queue:
+                stamp_id = queue.popleft()
+                for neighbour in graph[stamp_id]:
+                    if neighbour not in seen:
+                        seen.add(neighbour)
+                        queue.append(neighbour)
+            component = frozenset(seen)
+            for stamp_id in component:
+                components[stamp_id] = component
+        self._components[key] = components
+
+    def add_link(self, key, stamp_a, stamp_b, owner=None, label=None, notes=None):
+        """Добавляет связь после записи в Parts_Compatibility"""
+        self._add_edge(key, stamp_a, stamp_b, owner, label or self.get_label(key), notes)
+        self._rebuild_components(key)
+        self.version += 1
+
+    def remove_link(self, key, stamp_a, stamp_b):
+        """Убирает связь после удаления из Parts_Compatibility"""
+        graph = self._adjacency.get(key)
+        if not graph or stamp_b not in graph.get(stamp_a, ()):
+            return
+
+        self.version += 1
+        graph[stamp_a].discard(stamp_b)
+        graph[stamp_b].discard(stamp_a)
+        self._notes[key].pop(frozenset((stamp_a, stamp_b)), None)
+
+        # Штамп без связей остается в графе, только если это владелец детали
+        for stamp_id in (stamp_a, stamp_b):
+            if not graph[stamp_id] and stamp_id != self._owners.get(key):
+                del graph[stamp_id]
+                self._stamp_keys[stamp_id].discard(key)
+
+        if all(not neighbours for neighbours in graph.values()):
+            self.remove_part(key)
+        else:
+            self._rebuild_components(key)
+
+    def set_notes(self, key, stamp_a, stamp_b, notes):
+        self.version += 1
+        if notes:
+            self._notes[key][frozenset((stamp_a, stamp_b))] = notes
+        else:
+            self._notes[key].pop(frozenset((stamp_a, stamp_b)), None)
+
+    def remove_part(self, key):
+        """Забывает деталь целиком (например, после ее удаления из инвентаря)"""
+        self.version += 1
+        for stamp_id in self._adjacency.pop(key, {}):
+            self._stamp_keys[stamp_id].discard(key)
+        self._components.pop(key, None)
+        self._notes.pop(key, None)
+        self._labels.pop(key, None)
+        self._owners.pop(key, None)
+
+    def get_owner(self, key):
+        """Штамп, которому принадлежит деталь (None для связи на уровне категории)"""
+        return self._owners.get(key)
+
+    def get_label(self, key):
+        return self._labels.get(key, key[0])
+
+    def stamps_for_part(self, key):
+        """Все штампы, на которых применима деталь, включая связи через цепочку"""
+        owner = self._owners.get(key)
+        components = self._components.get(key, {})
+        if owner is not None:
+            return components.get(owner, frozenset((owner,)))
+        return frozenset().union(*components.values()) if components else frozenset()
+
+    def compatible_with_stamp(self, stamp_id):
+        """Совместимости штампа: список (key, другой штамп, прямая связь, заметки)"""
+        result = []
+        for key in self._stamp_keys.get(stamp_id, ()):
+            component = self._components.get(key, {}).get(stamp_id, frozenset())
+            direct = self._adjacency[key].get(stamp_id, set())
+            for other_id in component:
+                if other_id == stamp_id:
+                    continue
+                notes = self._notes[key].get(frozenset((stamp_id, other_id)))
+                result.append((key, other_id, other_id in direct, notes))
+        return result
+
+compatibility_graph = CompatibilityGraph()
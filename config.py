@@ -1,4 +1,5 @@
 import os
+import re
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -8,4 +9,98 @@ load_dotenv()
 BOT_TOKEN = os.getenv('TELEGRAM_TOKEN')
 
 if not BOT_TOKEN:
-    raise ValueError("Bot token not found in environment variables!")
\ No newline at end of file
+    raise ValueError("Bot token not found in environment variables!")
+
+# Telegram user IDs allowed to run admin commands
+ADMIN_IDS = {
+    int(admin_id) for admin_id in os.getenv('ADMIN_IDS', '').split(',')
+    if admin_id.strip().isdigit()
+}
+
+# Drawing storage scrubber: read rate limit and pause between passes
+SCRUB_BYTES_PER_SECOND = int(os.getenv('SCRUB_BYTES_PER_SECOND', str(4 * 1024 * 1024)))
+SCRUB_BATCH_SIZE = int(os.getenv('SCRUB_BATCH_SIZE', '50'))
+SCRUB_INTERVAL_SECONDS = int(os.getenv('SCRUB_INTERVAL_SECONDS', str(6 * 60 * 60)))
+
+# Time zone for displaying timestamps; the database stores UTC epoch seconds
+TIMEZONE = os.getenv('TIMEZONE', 'Europe/Moscow')
+
+# Online database backups: snapshot directory, pause between scheduled snapshots (0 disables
+# the schedule), rotation (newest snapshots kept, max age in days) and copy step size in pages
+# with a pause in seconds between steps
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+BACKUP_INTERVAL_SECONDS = int(os.getenv('BACKUP_INTERVAL_SECONDS', str(24 * 60 * 60)))
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '7'))
+BACKUP_RETENTION_DAYS = int(os.getenv('BACKUP_RETENTION_DAYS', '30'))
+BACKUP_PAGES_PER_STEP = int(os.getenv('BACKUP_PAGES_PER_STEP', '256'))
+BACKUP_STEP_PAUSE = float(os.getenv('BACKUP_STEP_PAUSE', '0.05'))
+
+# Background jobs (run on the application's JobQueue): how many may run at once and in their
+# own thread pool, random start offset as a share of the interval, and maintenance intervals
+# (0 disables a job). WARM_HOT_STAMPS recently changed stamps are read into the SQLite cache
+# after a restart
+JOBS_MAX_CONCURRENT = int(os.getenv('JOBS_MAX_CONCURRENT', '2'))
+JOBS_JITTER = float(os.getenv('JOBS_JITTER', '0.1'))
+OPTIMIZE_INTERVAL_SECONDS = int(os.getenv('OPTIMIZE_INTERVAL_SECONDS', str(24 * 60 * 60)))
+WAL_CHECKPOINT_INTERVAL_SECONDS = int(os.getenv('WAL_CHECKPOINT_INTERVAL_SECONDS', '300'))
+WARM_HOT_STAMPS = int(os.getenv('WARM_HOT_STAMPS', '5'))
+
+# Daily stock digest for subscribed chats (/digest on): local send time HH:MM in TIMEZONE
+# (empty disables sending) and the quantity at or below which a part is flagged
+DIGEST_TIME = os.getenv('DIGEST_TIME', '08:00')
+DIGEST_LOW_STOCK = int(os.getenv('DIGEST_LOW_STOCK', '1'))
+if DIGEST_TIME and not re.fullmatch(r'([01]?\d|2[0-3]):[0-5]\d', DIGEST_TIME):
+    raise ValueError(f"DIGEST_TIME must be HH:MM, got {DIGEST_TIME!r}")
+
+# Stocktake (batch quantity recount): seconds without input after which it is abandoned (0 - never)
+STOCKTAKE_TIMEOUT_SECONDS = int(os.getenv('STOCKTAKE_TIMEOUT_SECONDS', '1800'))
+
+# Conversation state and user_data persistence: how often pending changes are written,
+# how long untouched user_data and conversations are kept and how often expired ones
+# are removed (0 - only at startup)
+PERSISTENCE_UPDATE_INTERVAL = int(os.getenv('PERSISTENCE_UPDATE_INTERVAL', '10'))
+USER_DATA_TTL_DAYS = int(os.getenv('USER_DATA_TTL_DAYS', '30'))
+PERSISTENCE_EXPIRE_INTERVAL_SECONDS = int(os.getenv('PERSISTENCE_EXPIRE_INTERVAL_SECONDS', str(6 * 60 * 60)))
+
+# Updates from different chats are handled in parallel, at most this many at once
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '16'))
+
+# Per-handler metrics: Prometheus text endpoint (port 0 disables it) and periodic log summary
+# (interval 0 disables it)
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_LOG_INTERVAL = int(os.getenv('METRICS_LOG_INTERVAL', '600'))
+# Queries slower than this are logged together with their EXPLAIN QUERY PLAN
+SLOW_QUERY_MS = int(os.getenv('SLOW_QUERY_MS', '100'))
+
+# Logging: records go through a queue to a background writer. homut.log gets JSON lines
+# ('json') or the plain format ('text'); per-module levels and sampling rates for
+# records below WARNING are given as 'module=value,module=value'
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FILE_FORMAT = os.getenv('LOG_FILE_FORMAT', 'json').lower()
+LOG_MODULE_LEVELS = os.getenv('LOG_MODULE_LEVELS', 'httpx=WARNING')
+LOG_SAMPLING = os.getenv('LOG_SAMPLING', '')
+if LOG_FILE_FORMAT not in ('json', 'text'):
+    raise ValueError(f"LOG_FILE_FORMAT must be 'json' or 'text', got {LOG_FILE_FORMAT!r}")
+
+# Feature modules are imported on first use; this many seconds after startup the rest are
+# preloaded in the background (0 disables preloading)
+LAZY_WARMUP_DELAY = int(os.getenv('LAZY_WARMUP_DELAY', '30'))
+
+# Update delivery: 'polling' (default) or 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+# Bot API server; override to point the bot at a local fake server for testing
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', 'https://api.telegram.org/bot')
+TELEGRAM_API_BASE_FILE_URL = os.getenv('TELEGRAM_API_BASE_FILE_URL', 'https://api.telegram.org/file/bot')
+
+# Webhook mode: public HTTPS URL registered with Telegram and the local endpoint behind it
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+
+if BOT_MODE not in ('polling', 'webhook'):
+    raise ValueError(f"Unknown BOT_MODE: {BOT_MODE}")
+if BOT_MODE == 'webhook' and not (WEBHOOK_URL and WEBHOOK_SECRET):
+    raise ValueError("WEBHOOK_URL and WEBHOOK_SECRET are required in webhook mode!")
@@ -1,5 +1,8 @@
 from enum import Enum, auto
 
+# Наибольшее допустимое количество детали
+MAX_QUANTITY = 10000
+
 class States(Enum):
     # Состояния для изменения количества
     CHANGE_QTY_CHOOSING_ITEM = auto()
@@ -36,4 +39,8 @@ class States(Enum):
     VIEWING_DRAWINGS = auto()             # Просмотр списка чертежей
     SEARCHING_DRAWINGS = auto()           # Поиск чертежей
     DRAWING_PREVIEW = auto()              # Предпросмотр чертежа
-    DRAWING_DOWNLOAD = auto()             # Скачивание чертежа
\ No newline at end of file
+    DRAWING_DOWNLOAD = auto()             # Скачивание чертежа
+
+    # Состояния инвентаризации (новые состояния добавляются в конец:
+    # сохраненные диалоги хранят значения состояний)
+    STOCKTAKE_ENTERING_COUNTS = auto()    # Ввод пересчитанных количеств
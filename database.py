@@ -3,6 +3,9 @@ import sqlite3
 import re
 import aiosqlite
 from menu import menu, create_inventory_submenus, inventory_list, get_menu_keyboard, back_to_menu_keyboard
+from name_matching import normalize_name
+from instrumentation import TimedConnection, connect_async
+from timeutil import now_epoch
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -10,7 +13,7 @@ logger = logging.getLogger(__name__)
 def get_connection():
     """Получение соединения с базой данных"""
     try:
-        conn = sqlite3.connect('inventory.db')
+        conn = sqlite3.connect('inventory.db', factory=TimedConnection)
         # Включаем поддержку внешних ключей
         conn.execute("PRAGMA foreign_keys = ON")
         return conn
@@ -21,7 +24,7 @@ def get_connection():
 async def get_async_connection():
     """Получение асинхронного соединения с базой данных"""
     try:
-        conn = await aiosqlite.connect('inventory.db')
+        conn = await connect_async('inventory.db')
         await conn.execute("PRAGMA foreign_keys = ON")
         return conn
     except aiosqlite.Error as e:
@@ -34,7 +37,7 @@ async def get_stamp_id_by_action(action):
         logger.info(f"Получен action для обработки: {action}")
 
         # Извлекаем категорию и inv_id из action
-        pattern = r'^(?:addnewitem|showbalance|updatedb|changequantity|editdelete)([a-z]+)(\d+(?:_\d+)?(?:_[a-z]+(?:_\d+)?)?)'
+        pattern = r'^(?:addnewitem|showbalance|updatedb|changequantity|editdelete|stocktake)([a-z]+)(\d+(?:_\d+)?(?:_[a-z]+(?:_\d+)?)?)'
         match = re.match(pattern, action)
 
         if not match:
@@ -58,7 +61,7 @@ async def get_stamp_id_by_action(action):
             return None
 
         # Получаем stamp_id из базы данных
-        db = await aiosqlite.connect('inventory.db')
+        db = await connect_async('inventory.db')
         try:
             await db.execute("PRAGMA foreign_keys = ON")
             async with db.execute("SELECT id FROM Stamps WHERE name = ?", (inv_name,)) as cursor:
@@ -176,8 +179,13 @@ async def update_item_field(category, item_id, field, value):
 
     try:
         async with await get_async_connection() as conn:
-            query = f"UPDATE {table_name} SET {field} = ?, updatedAt = CURRENT_TIMESTAMP WHERE id = ?"
-            await conn.execute(query, (value, item_id))
+            query = f"UPDATE {table_name} SET {field} = ?, updatedAt = ? WHERE id = ?"
+            await conn.execute(query, (value, now_epoch(), item_id))
+            if field == 'name':
+                await conn.execute(
+                    f"UPDATE {table_name} SET name_key = ? WHERE id = ?",
+                    (normalize_name(value), item_id)
+                )
             await conn.commit()
             logger.info(f"Обновлено поле {field} для позиции id {item_id} в таблице {table_name}")
             return True
@@ -197,6 +205,11 @@ async def delete_item_from_database(category, item_id):
             query = f"DELETE FROM {table_name} WHERE id = ?"
             await conn.execute(query, (item_id,))
             await conn.commit()
+            # Импорт здесь: эти модули сами зависят от database
+            from compatibility_graph import compatibility_graph
+            from part_search import part_search_index
+            compatibility_graph.remove_part((table_name, item_id))
+            await part_search_index.refresh_part(table_name, item_id)
             logger.info(f"Удалена позиция id {item_id} из таблицы {table_name}")
             return True
     except Exception as e:
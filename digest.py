@@ -0,0 +1,157 @@
+import asyncio
+import html
+import logging
+from telegram import Update
+from telegram.error import Forbidden, TelegramError
+from telegram.ext import ContextTypes
+from database import get_connection
+from rate_limiter import LANE_BULK
+from timeutil import day_window
+
+logger = logging.getLogger(__name__)
+
+MAX_PARTS_PER_STAMP = 10
+TOP_CONSUMED = 3
+# Лимит Telegram - 4096 символов
+MAX_MESSAGE_LENGTH = 4000
+
+def collect_changes(start, end):
+    """Изменения остатков за окно [start, end) одним проходом по журналу.
+
+    Возвращает {stamp_id: (имя штампа, {(category, part_id): [имя, было, стало, расход, приход]})}.
+    'Было' - остаток до первого изменения в окне (None - деталь создана),
+    'стало' - после последнего (None - деталь удалена).
+    """
+    conn = get_connection()
+    try:
+        rows = conn.execute("""
+            SELECT l.stamp_id, s.name, l.category, l.part_id, l.name, l.quantity_before, l.quantity_after
+            FROM Quantity_Ledger l
+            LEFT JOIN Stamps s ON s.id = l.stamp_id
+            WHERE l.changed_at >= ? AND l.changed_at < ?
+            ORDER BY l.changed_at, l.id
+        """, (start, end)).fetchall()
+    finally:
+        conn.close()
+
+    stamps = {}
+    for stamp_id, stamp_name, category, part_id, name, before, after in rows:
+        parts = stamps.setdefault(stamp_id, (stamp_name or f"#{stamp_id}", {}))[1]
+        part = parts.get((category, part_id))
+        if part is None:
+            part = parts[(category, part_id)] = [name, before, after, 0, 0]
+        part[0] = name or part[0]
+        part[2] = after
+        # Добавление и удаление позиции - не расход и не приход
+        if before is not None and after is not None:
+            if after < before:
+                part[3] += before - after
+            else:
+                part[4] += after - before
+    return stamps
+
+def _format_quantity(value):
+    return '—' if value is None else str(value)
+
+def format_digest(day, stamps, low_stock):
+    from showballance import CATEGORY_EMOJI
+
+    title = f"📋 Сводка остатков за {day:%d.%m.%Y}"
+    if not stamps:
+        return title + "\n\nИзменений не было."
+
+    sections = []
+    for stamp_name, parts in sorted(stamps.values(), key=lambda item: item[0]):
+        lines = [f"\n\n<b>Штамп {html.escape(stamp_name)}</b> - изменено позиций: {len(parts)}"]
+        # Сначала то, что опустилось до порога, затем самые большие изменения
+        ordered = sorted(
+            parts.items(),
+            key=lambda item: (item[1][2] is None or item[1][2] > low_stock, -(item[1][3] + item[1][4]))
+        )
+        for (category, _), (name, before, after, consumed, added) in ordered[:MAX_PARTS_PER_STAMP]:
+            marker = '⚠️ ' if after is not None and after <= low_stock else ''
+            changes = [value for value in (consumed and f"-{consumed}", added and f"+{added}") if value]
+            if before is None:
+                changes.append("новая")
+            if after is None:
+                changes.append("удалена")
+            lines.append(
+                f"{marker}{CATEGORY_EMOJI.get(category, '📦')} {html.escape(name or '')}: "
+                f"{_format_quantity(before)} → {_format_quantity(after)} ({', '.join(changes)})"
+            )
+        if len(ordered) > MAX_PARTS_PER_STAMP:
+            lines.append(f"… и еще {len(ordered) - MAX_PARTS_PER_STAMP}")
+
+        top = sorted((part for part in parts.values() if part[3]), key=lambda part: part[3], reverse=True)[:TOP_CONSUMED]
+        if top:
+            lines.append("Больше всего расход: " + ", ".join(f"{html.escape(part[0] or '')} ({part[3]})" for part in top))
+        sections.append('\n'.join(lines))
+
+    message = title
+    for index, section in enumerate(sections):
+        if len(message) + len(section) > MAX_MESSAGE_LENGTH:
+            message += f"\n\n… и еще штампов: {len(sections) - index}"
+            break
+        message += section
+    return message
+
+def build_digest(days_ago=1, low_stock=1):
+    start, end, day = day_window(days_ago)
+    return format_digest(day, collect_changes(start, end), low_stock)
+
+def _subscribed_chats():
+    conn = get_connection()
+    try:
+        return [row[0] for row in conn.execute("SELECT chat_id FROM Digest_Subscriptions")]
+    finally:
+        conn.close()
+
+def _set_subscription(chat_id, subscribed):
+    conn = get_connection()
+    try:
+        if subscribed:
+            conn.execute("INSERT OR IGNORE INTO Digest_Subscriptions (chat_id) VALUES (?)", (chat_id,))
+        else:
+            conn.execute("DELETE FROM Digest_Subscriptions WHERE chat_id = ?", (chat_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+async def send_daily_digest(scheduler, low_stock):
+    """Рассылает сводку за вчера всем подписанным чатам; сводка строится один раз"""
+    chats = await scheduler.run_blocking(_subscribed_chats)
+    if not chats:
+        return
+    message = await scheduler.run_blocking(build_digest, 1, low_stock)
+    bot = scheduler.application.bot
+    sent = 0
+    for chat_id in chats:
+        try:
+            await bot.send_message(chat_id, message, parse_mode='HTML', rate_limit_args={'lane': LANE_BULK})
+            sent += 1
+        except Forbidden as e:
+            # Бота заблокировали или удалили из чата
+            logger.warning(f"Сводка не доставлена в чат {chat_id}, подписка снята: {e}")
+            await scheduler.run_blocking(_set_subscription, chat_id, False)
+        except TelegramError as e:
+            logger.error(f"Не удалось отправить сводку в чат {chat_id}: {e}")
+    logger.info(f"Ежедневная сводка отправлена в {sent} из {len(chats)} чатов")
+
+async def digest_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/digest - сводка за вчера; /digest on и /digest off - подписка чата на утреннюю рассылку"""
+    from config import DIGEST_LOW_STOCK, DIGEST_TIME
+
+    chat_id = update.effective_chat.id
+    argument = context.args[0].lower() if context.args else ''
+    if argument in ('on', 'off'):
+        await asyncio.to_thread(_set_subscription, chat_id, argument == 'on')
+        if argument == 'off':
+            await update.message.reply_text("Ежедневная сводка отключена.")
+        elif DIGEST_TIME:
+            await update.message.reply_text(f"Сводка за прошедший день будет приходить каждый день в {DIGEST_TIME}.")
+        else:
+            await update.message.reply_text("Подписка сохранена, но рассылка сейчас отключена в настройках.")
+        return
+
+    message = await asyncio.to_thread(build_digest, 1, DIGEST_LOW_STOCK)
+    await update.message.reply_text(message, parse_mode='HTML')
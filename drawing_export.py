@@ -0,0 +1,166 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import zipfile
+from database import get_connection
+
+logger = logging.getLogger(__name__)
+
+ARCHIVES_DIR = os.path.join('drawings', '.archives')
+# Ограничение Bot API на размер отправляемого файла - 50 МБ, оставляем запас
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024
+VOLUME_SIZE_LIMIT = TELEGRAM_UPLOAD_LIMIT - 1024 * 1024
+# Эти форматы уже сжаты, повторное сжатие только тратит процессор
+STORED_FILE_TYPES = ('.pdf', '.jpg', '.jpeg', '.png', '.gif', '.zip')
+# Заголовки ZIP на один файл с запасом (локальный + центральный каталог)
+ZIP_ENTRY_OVERHEAD = 256
+
+# Блокировки по штампу: [блокировка, число запросов, ожидающих ее или держащих]
+_build_locks = {}
+# Ключи архивов, тома которых сейчас отправляются: ключ -> число отправок
+_archives_in_use = {}
+
+def get_latest_drawings(stamp_id):
+    """Возвращает название штампа и последние версии его чертежей"""
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT s.name, d.id, d.name, d.file_type, d.file_path, d.content_hash
+            FROM Stamps s
+            LEFT JOIN Drawings d ON d.stamp_id = s.id AND d.is_latest = 1
+            WHERE s.id = ?
+            ORDER BY d.name
+        """, (stamp_id,))
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+
+    if not rows:
+        return None, []
+    return rows[0][0], [row[1:] for row in rows if row[1] is not None]
+
+def get_archive_key(stamp_id, drawings):
+    """Ключ кэша архива: меняется при любом изменении чертежей штампа"""
+    digest = hashlib.sha256()
+    for drawing_id, name, _, file_path, content_hash in drawings:
+        if not content_hash and os.path.exists(file_path):
+            stat = os.stat(file_path)
+            content_hash = f"{stat.st_size}:{stat.st_mtime_ns}"
+        digest.update(f"{drawing_id}|{name}|{content_hash}\n".encode('utf-8'))
+    return f"{stamp_id}_{digest.hexdigest()[:16]}"
+
+def _manifest_path(key):
+    return os.path.join(ARCHIVES_DIR, f"{key}.json")
+
+def _load_manifest(key):
+    try:
+        with open(_manifest_path(key), encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+    if all(os.path.exists(path) for path in manifest['volumes']):
+        return manifest
+    return None
+
+def _remove_stale_archives(stamp_id, key, keep_keys=()):
+    """Удаляет архивы штампа, собранные для предыдущих версий чертежей.
+    Архивы из keep_keys еще отправляются и будут удалены при следующей сборке"""
+    prefix = f"{stamp_id}_"
+    for entry in os.scandir(ARCHIVES_DIR):
+        if not entry.name.startswith(prefix) or entry.name.startswith(key):
+            continue
+        if not any(entry.name.startswith(kept) for kept in keep_keys):
+            os.remove(entry.path)
+            logger.info(f"Удален устаревший архив {entry.name}")
+
+def _plan_volumes(drawings):
+    """Раскладывает файлы по томам так, чтобы каждый том помещался в лимит Telegram"""
+    volumes, current, current_size = [], [], 0
+    missing, oversized = [], []
+
+    for _, name, file_type, file_path, _ in drawings:
+        if not os.path.exists(file_path):
+            missing.append(name)
+            continue
+
+        size = os.path.getsize(file_path) + ZIP_ENTRY_OVERHEAD + 2 * len(name.encode('utf-8'))
+        if size > VOLUME_SIZE_LIMIT:
+            oversized.append(name)
+            continue
+
+        if current and current_size + size > VOLUME_SIZE_LIMIT:
+            volumes.append(current)
+            current, current_size = [], 0
+        current.append((name, file_type, file_path))
+        current_size += size
+
+    if current:
+        volumes.append(current)
+    return volumes, missing, oversized
+
+def build_stamp_archive(stamp_id, drawings, keep_keys=()):
+    """Собирает ZIP-архивы с чертежами штампа (выполняется в отдельном потоке)"""
+    os.makedirs(ARCHIVES_DIR, exist_ok=True)
+    key = get_archive_key(stamp_id, drawings)
+    _remove_stale_archives(stamp_id, key, keep_keys)
+
+    manifest = _load_manifest(key)
+    if manifest:
+        logger.info(f"Архив {key} взят из кэша")
+        return manifest
+
+    volumes, missing, oversized = _plan_volumes(drawings)
+
+    volume_paths = []
+    for number, volume in enumerate(volumes, start=1):
+        volume_path = os.path.join(ARCHIVES_DIR, f"{key}_part{number}.zip")
+        tmp_path = f"{volume_path}.tmp"
+        with zipfile.ZipFile(tmp_path, 'w') as archive:
+            for name, file_type, file_path in volume:
+                if (file_type or '').lower() in STORED_FILE_TYPES:
+                    archive.write(file_path, arcname=name, compress_type=zipfile.ZIP_STORED)
+                else:
+                    archive.write(file_path, arcname=name, compress_type=zipfile.ZIP_DEFLATED, compresslevel=6)
+        os.replace(tmp_path, volume_path)
+        volume_paths.append(volume_path)
+
+    manifest = {'volumes': volume_paths, 'missing': missing, 'oversized': oversized}
+    with open(_manifest_path(key), 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, ensure_ascii=False)
+
+    logger.info(f"Собран архив {key}: томов {len(volume_paths)}, пропущено {len(missing) + len(oversized)}")
+    return manifest
+
+@contextlib.asynccontextmanager
+async def stamp_archive(stamp_id):
+    """Дает (название штампа, манифест архива) для всех последних чертежей штампа.
+    Пока контекст открыт, тома архива не удаляются другими сборками"""
+    stamp_name, drawings = await asyncio.to_thread(get_latest_drawings, stamp_id)
+    if not drawings:
+        yield stamp_name, None
+        return
+
+    key = get_archive_key(stamp_id, drawings)
+    entry = _build_locks.setdefault(stamp_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            manifest = await asyncio.to_thread(
+                build_stamp_archive, stamp_id, drawings, tuple(_archives_in_use)
+            )
+            _archives_in_use[key] = _archives_in_use.get(key, 0) + 1
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            _build_locks.pop(stamp_id, None)
+
+    try:
+        yield stamp_name, manifest
+    finally:
+        _archives_in_use[key] -= 1
+        if not _archives_in_use[key]:
+            del _archives_in_use[key]
@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from database import get_connection
+
+logger = logging.getLogger(__name__)
+
+THUMBNAILS_DIR = os.path.join('drawings', '.thumbnails')
+THUMBNAIL_MAX_SIDE = 1024
+RASTER_FILE_TYPES = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+PDF_FILE_TYPES = ('.pdf',)
+HASH_CHUNK_SIZE = 1024 * 1024
+# Через сколько секунд повторять рендер после сбоя (нет библиотеки, упал процесс, ошибка чтения)
+RENDER_RETRY_SECONDS = 10 * 60
+
+_executor = None
+# Миниатюры, которые сейчас рендерятся, чтобы не запускать один рендер дважды
+_pending_renders = {}
+# Время последнего сбоя рендера по хэшу: такие сбои не записываются в базу
+_failed_renders = {}
+
+def compute_file_hash(file_path):
+    """Вычисляет SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def can_render(file_type):
+    """Проверяет, умеем ли мы строить миниатюру для данного типа файла"""
+    return (file_type or '').lower() in RASTER_FILE_TYPES + PDF_FILE_TYPES
+
+def render_thumbnail(source_path, file_type, target_path):
+    """Растеризует первую страницу/изображение в PNG.
+
+    Выполняется в отдельном процессе, поэтому тяжелые библиотеки импортируются здесь.
+    Возвращает True, если миниатюра построена, и False, если документ пустой или
+    библиотека не смогла его распознать - такой результат не изменится при повторе.
+    Остальные ошибки (в том числе ImportError) пробрасываются.
+    """
+    file_type = (file_type or '').lower()
+    tmp_path = f"{target_path}.tmp"
+
+    try:
+        if file_type in PDF_FILE_TYPES:
+            import fitz  # PyMuPDF
+
+            try:
+                with fitz.open(source_path) as document:
+                    if document.page_count == 0:
+                        return False
+                    page = document[0]
+                    zoom = THUMBNAIL_MAX_SIDE / max(page.rect.width, page.rect.height)
+                    pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+                    pixmap.save(tmp_path, output='png')
+            except fitz.FileDataError:
+                return False
+        elif file_type in RASTER_FILE_TYPES:
+            from PIL import Image, UnidentifiedImageError
+
+            try:
+                with Image.open(source_path) as image:
+                    image.seek(0)
+                    image = image.convert('RGB')
+                    image.thumbnail((THUMBNAIL_MAX_SIDE, THUMBNAIL_MAX_SIDE))
+                    image.save(tmp_path, format='PNG', optimize=True)
+            except UnidentifiedImageError:
+                return False
+        else:
+            return False
+
+        os.replace(tmp_path, target_path)
+        return True
+    finally:
+        # Недописанный файл после сбоя не должен остаться рядом с миниатюрами
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=max(1, min(2, os.cpu_count() or 1)))
+    return _executor
+
+def shutdown():
+    """Останавливает пул процессов рендеринга"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def get_thumbnail_path(content_hash):
+    return os.path.join(THUMBNAILS_DIR, f"{content_hash}.png")
+
+def save_content_hash(drawing_id, content_hash):
+    conn = get_connection()
+    try:
+        conn.execute("UPDATE Drawings SET content_hash = ? WHERE id = ?", (content_hash, drawing_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+def save_telegram_file_id(content_hash, file_id):
+    """Запоминает file_id отправленной миниатюры для повторной отправки без загрузки"""
+    conn = get_connection()
+    try:
+        conn.execute("""
+            INSERT INTO Drawing_Thumbnails (content_hash, thumbnail_path, telegram_file_id)
+            VALUES (?, ?, ?)
+            ON CONFLICT(content_hash) DO UPDATE SET telegram_file_id = excluded.telegram_file_id
+        """, (content_hash, get_thumbnail_path(content_hash), file_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+def _save_thumbnail_record(content_hash, thumbnail_path):
+    conn = get_connection()
+    try:
+        conn.execute("""
+            INSERT INTO Drawing_Thumbnails (content_hash, thumbnail_path)
+            VALUES (?, ?)
+            ON CONFLICT(content_hash) DO UPDATE SET thumbnail_path = excluded.thumbnail_path
+        """, (content_hash, thumbnail_path))
+        conn.commit()
+    finally:
+        conn.close()
+
+async def _render_and_record(content_hash, source_path, file_type):
+    thumbnail_path = get_thumbnail_path(content_hash)
+    os.makedirs(THUMBNAILS_DIR, exist_ok=True)
+
+    loop = asyncio.get_running_loop()
+    try:
+        rendered = await loop.run_in_executor(
+            _get_executor(), render_thumbnail, source_path, file_type, thumbnail_path
+        )
+    except BrokenProcessPool as e:
+        # Процесс рендера упал - следующий рендер получит новый пул
+        logger.error(f"Пул рендеринга миниатюр сломан: {e}")
+        shutdown()
+        _failed_renders[content_hash] = time.monotonic()
+        return None
+    except Exception as e:
+        # Нет библиотеки или ошибка чтения - не запоминаем в базе, повторим позже
+        logger.error(f"Ошибка при построении миниатюры {source_path}: {e}", exc_info=not isinstance(e, ImportError))
+        _failed_renders[content_hash] = time.monotonic()
+        return None
+
+    # Пустой или нераспознанный документ фиксируем, чтобы не повторять его при каждом просмотре
+    _failed_renders.pop(content_hash, None)
+    result_path = thumbnail_path if rendered else None
+    await asyncio.to_thread(_save_thumbnail_record, content_hash, result_path)
+    logger.info(f"Миниатюра для {content_hash[:12]}: {result_path or 'не поддерживается'}")
+    return result_path
+
+async def ensure_thumbnail(content_hash, source_path, file_type):
+    """Возвращает путь к миниатюре, строя её один раз на версию содержимого"""
+    thumbnail_path = get_thumbnail_path(content_hash)
+    if os.path.exists(thumbnail_path):
+        return thumbnail_path
+    if not can_render(file_type):
+        return None
+    failed_at = _failed_renders.get(content_hash)
+    if failed_at is not None and time.monotonic() - failed_at < RENDER_RETRY_SECONDS:
+        return None
+
+    task = _pending_renders.get(content_hash)
+    if task is None:
+        task = asyncio.ensure_future(_render_and_record(content_hash, source_path, file_type))
+        _pending_renders[content_hash] = task
+        task.add_done_callback(lambda _: _pending_renders.pop(content_hash, None))
+    return await asyncio.shield(task)
@@ -0,0 +1,332 @@
+import asyncio
+import hashlib
+import itertools
+import logging
+import os
+import time
+from database import get_connection
+
+logger = logging.getLogger(__name__)
+
+DRAWINGS_DIR = 'drawings'
+# Служебные каталоги с производными файлами, которые не являются чертежами
+SKIPPED_DIRS = {'.thumbnails', '.archives', 'tmp'}
+READ_CHUNK_SIZE = 1024 * 1024
+MAX_REPORT_ITEMS = 20
+
+STATUS_OK = 'ok'
+STATUS_MISSING = 'missing'
+STATUS_SIZE_MISMATCH = 'size_mismatch'
+STATUS_HASH_MISMATCH = 'hash_mismatch'
+
+STATUS_NAMES = {
+    STATUS_OK: 'в порядке',
+    STATUS_MISSING: 'файл отсутствует',
+    STATUS_SIZE_MISMATCH: 'не совпадает размер',
+    STATUS_HASH_MISMATCH: 'не совпадает хэш',
+}
+
+class ByteRateLimiter:
+    """Ограничитель скорости чтения с диска (token bucket в байтах)"""
+
+    def __init__(self, bytes_per_second):
+        self.rate = bytes_per_second
+        self.capacity = bytes_per_second
+        self.tokens = bytes_per_second
+        self.updated = time.monotonic()
+
+    async def consume(self, amount):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= amount or self.tokens >= self.capacity:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+def _load_state(name, default):
+    conn = get_connection()
+    try:
+        row = conn.execute("SELECT value FROM Drawing_Scrub_State WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+    finally:
+        conn.close()
+
+def _save_state(name, value):
+    conn = get_connection()
+    try:
+        conn.execute("""
+            INSERT INTO Drawing_Scrub_State (name, value) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET value = excluded.value
+        """, (name, value))
+        conn.commit()
+    finally:
+        conn.close()
+
+def _fetch_drawings_batch(after_id, batch_size):
+    conn = get_connection()
+    try:
+        return conn.execute("""
+            SELECT id, file_path, file_size, content_hash
+            FROM Drawings
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+        """, (after_id, batch_size)).fetchall()
+    finally:
+        conn.close()
+
+def _save_drawing_results(results, baselines):
+    conn = get_connection()
+    try:
+        conn.executemany("""
+            INSERT INTO Drawing_Scrub_Results (drawing_id, file_path, status, details, checked_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(drawing_id) DO UPDATE SET
+                file_path = excluded.file_path,
+                status = excluded.status,
+                details = excluded.details,
+                checked_at = excluded.checked_at
+        """, results)
+        # Для старых записей без размера и хэша первая проверка задает эталон
+        conn.executemany("""
+            UPDATE Drawings
+            SET file_size = COALESCE(file_size, ?), content_hash = COALESCE(content_hash, ?)
+            WHERE id = ?
+        """, baselines)
+        conn.commit()
+    finally:
+        conn.close()
+
+def _walk_key(path):
+    """Ключ сортировки, совпадающий с порядком обхода: сначала файлы каталога, потом подкаталоги"""
+    parts = path.split('/')
+    return tuple((1, part) for part in parts[:-1]) + ((0, parts[-1]),)
+
+def _iter_files(directory, after_key):
+    """Файлы поддерева directory в порядке обхода, идущие после after_key.
+
+    Каталоги, целиком лежащие до after_key, не читаются: продолжение прохода
+    стоит столько же, сколько чтение оставшейся части архива.
+    """
+    prefix = tuple((1, part) for part in directory.split('/'))
+    files, dirs = [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in SKIPPED_DIRS:
+                    dirs.append(entry.name)
+            else:
+                files.append(entry.name)
+
+    for file_name in sorted(files):
+        if after_key is None or prefix + ((0, file_name),) > after_key:
+            yield f"{directory}/{file_name}"
+    for dir_name in sorted(dirs):
+        dir_key = prefix + ((1, dir_name),)
+        if after_key is not None:
+            if dir_key < after_key[:len(dir_key)]:
+                continue
+            # Сравнивать с позицией нужно только внутри каталога, в котором она лежит
+            if dir_key != after_key[:len(dir_key)]:
+                after_key = None
+        yield from _iter_files(f"{directory}/{dir_name}", after_key)
+
+def _list_files_batch(after_path, batch_size):
+    """Возвращает следующий пакет файлов каталога чертежей после after_path"""
+    after_key = _walk_key(after_path) if after_path else None
+    return list(itertools.islice(_iter_files(DRAWINGS_DIR, after_key), batch_size))
+
+def _reconcile_orphans(paths):
+    """Записывает файлы без записи в Drawings и убирает найденные ранее, если запись появилась"""
+    conn = get_connection()
+    try:
+        placeholders = ', '.join('?' for _ in paths)
+        known = {
+            row[0] for row in conn.execute(
+                f"SELECT file_path FROM Drawings WHERE file_path IN ({placeholders})", paths
+            )
+        }
+        orphans = [(path, os.path.getsize(path)) for path in paths if path not in known and os.path.exists(path)]
+        conn.executemany("""
+            INSERT INTO Drawing_Orphan_Files (file_path, file_size) VALUES (?, ?)
+            ON CONFLICT(file_path) DO UPDATE SET file_size = excluded.file_size
+        """, orphans)
+        conn.executemany(
+            "DELETE FROM Drawing_Orphan_Files WHERE file_path = ?",
+            [(path,) for path in paths if path in known]
+        )
+        conn.commit()
+        return len(orphans)
+    finally:
+        conn.close()
+
+def _forget_missing_orphans():
+    """Удаляет из отчета файлы-сироты, которых больше нет на диске"""
+    conn = get_connection()
+    try:
+        paths = [row[0] for row in conn.execute("SELECT file_path FROM Drawing_Orphan_Files")]
+        gone = [(path,) for path in paths if not os.path.exists(path)]
+        conn.executemany("DELETE FROM Drawing_Orphan_Files WHERE file_path = ?", gone)
+        conn.commit()
+    finally:
+        conn.close()
+
+class DrawingScrubber:
+    """Фоновая проверка файлов чертежей и поиск файлов без записи в базе.
+
+    Работает пакетами и ограничивает скорость чтения, чтобы не мешать боту.
+    """
+
+    def __init__(self, bytes_per_second, batch_size=50, batch_pause=1.0, run_blocking=asyncio.to_thread):
+        self.limiter = ByteRateLimiter(bytes_per_second)
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        # Чтение файлов и запросы к базе - в пуле потоков фоновых задач
+        self.run_blocking = run_blocking
+        self._hash_cache = {}
+
+    async def _hash_file(self, file_path):
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            while True:
+                chunk = await self.run_blocking(file.read, READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await self.limiter.consume(len(chunk))
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    async def _check_drawing(self, file_path, expected_size, expected_hash):
+        """Возвращает (status, details, actual_size, actual_hash)"""
+        try:
+            stat = await self.run_blocking(os.stat, file_path)
+        except FileNotFoundError:
+            return STATUS_MISSING, None, None, None
+
+        if expected_size is not None and stat.st_size != expected_size:
+            return STATUS_SIZE_MISMATCH, f"ожидалось {expected_size}, на диске {stat.st_size}", stat.st_size, None
+
+        # Один объект может принадлежать нескольким версиям - не читаем его повторно за проход
+        cache_key = (file_path, stat.st_size, stat.st_mtime_ns)
+        actual_hash = self._hash_cache.get(cache_key)
+        if actual_hash is None:
+            actual_hash = await self._hash_file(file_path)
+            self._hash_cache[cache_key] = actual_hash
+
+        if expected_hash is not None and actual_hash != expected_hash:
+            return STATUS_HASH_MISMATCH, f"ожидался {expected_hash[:12]}, на диске {actual_hash[:12]}", stat.st_size, actual_hash
+        return STATUS_OK, None, stat.st_size, actual_hash
+
+    async def scrub_drawings(self):
+        """Проверяет записи Drawings пакетами, продолжая с сохраненной позиции"""
+        after_id = int(await self.run_blocking(_load_state, 'last_drawing_id', '0'))
+        checked = 0
+
+        while True:
+            batch = await self.run_blocking(_fetch_drawings_batch, after_id, self.batch_size)
+            if not batch:
+                break
+
+            results, baselines = [], []
+            for drawing_id, file_path, file_size, content_hash in batch:
+                status, details, actual_size, actual_hash = await self._check_drawing(file_path, file_size, content_hash)
+                results.append((drawing_id, file_path, status, details))
+                if status == STATUS_OK and (file_size is None or content_hash is None):
+                    baselines.append((actual_size, actual_hash, drawing_id))
+                if status != STATUS_OK:
+                    logger.warning(f"Чертёж {drawing_id}: {STATUS_NAMES[status]} ({file_path})")
+
+            after_id = batch[-1][0]
+            await self.run_blocking(_save_drawing_results, results, baselines)
+            await self.run_blocking(_save_state, 'last_drawing_id', str(after_id))
+            checked += len(batch)
+            await asyncio.sleep(self.batch_pause)
+
+        await self.run_blocking(_save_state, 'last_drawing_id', '0')
+        return checked
+
+    async def scrub_directory(self):
+        """Ищет в каталоге drawings/ файлы, на которые нет записей в Drawings"""
+        if not os.path.isdir(DRAWINGS_DIR):
+            return 0
+
+        after_path = await self.run_blocking(_load_state, 'last_file_path', '')
+        orphans = 0
+
+        while True:
+            paths = await self.run_blocking(_list_files_batch, after_path, self.batch_size)
+            if not paths:
+                break
+            orphans += await self.run_blocking(_reconcile_orphans, paths)
+            after_path = paths[-1]
+            await self.run_blocking(_save_state, 'last_file_path', after_path)
+            await asyncio.sleep(self.batch_pause)
+
+        await self.run_blocking(_forget_missing_orphans)
+        await self.run_blocking(_save_state, 'last_file_path', '')
+        return orphans
+
+    async def run_pass(self):
+        started = time.monotonic()
+        self._hash_cache.clear()
+        checked = await self.scrub_drawings()
+        orphans = await self.scrub_directory()
+        logger.info(
+            f"Проверка чертежей завершена за {time.monotonic() - started:.1f} с: "
+            f"записей {checked}, файлов без записи {orphans}"
+        )
+
+def get_scrub_report():
+    """Формирует текстовый отчет о последней проверке файлов чертежей"""
+    conn = get_connection()
+    try:
+        counts = conn.execute("""
+            SELECT status, COUNT(*), MAX(checked_at)
+            FROM Drawing_Scrub_Results
+            GROUP BY status
+        """).fetchall()
+        problems = conn.execute("""
+            SELECT r.drawing_id, d.name, r.file_path, r.status, r.details
+            FROM Drawing_Scrub_Results r
+            LEFT JOIN Drawings d ON d.id = r.drawing_id
+            WHERE r.status != ?
+            ORDER BY r.checked_at DESC
+            LIMIT ?
+        """, (STATUS_OK, MAX_REPORT_ITEMS)).fetchall()
+        orphan_count, orphan_size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(file_size), 0) FROM Drawing_Orphan_Files"
+        ).fetchone()
+        orphans = conn.execute(
+            "SELECT file_path, file_size FROM Drawing_Orphan_Files ORDER BY file_path LIMIT ?",
+            (MAX_REPORT_ITEMS,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    if not counts and not orphan_count:
+        return "Проверка файлов чертежей ещё не выполнялась."
+
+    message = "🧾 Проверка файлов чертежей\n\n"
+    last_checked = max((row[2] for row in counts), default=None)
+    if last_checked:
+        message += f"Последняя проверка: {last_checked}\n"
+    for status, count, _ in counts:
+        message += f"• {STATUS_NAMES.get(status, status)}: {count}\n"
+    message += f"• файлов без записи в базе: {orphan_count} ({orphan_size / 1024 / 1024:.1f} МБ)\n"
+
+    if problems:
+        message += "\nПроблемные чертежи:\n"
+        for drawing_id, name, file_path, status, details in problems:
+            message += f"❌ #{drawing_id} {name or file_path}: {STATUS_NAMES.get(status, status)}"
+            if details:
+                message += f" ({details})"
+            message += "\n"
+
+    if orphans:
+        message += "\nФайлы без записи:\n"
+        for file_path, file_size in orphans:
+            message += f"• {file_path} ({file_size} байт)\n"
+
+    return message
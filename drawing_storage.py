@@ -0,0 +1,100 @@
+import logging
+import os
+from database import get_connection
+from drawing_previews import compute_file_hash
+
+logger = logging.getLogger(__name__)
+
+DRAWINGS_DIR = 'drawings'
+OBJECTS_DIR = os.path.join(DRAWINGS_DIR, 'objects')
+UPLOADS_DIR = os.path.join(DRAWINGS_DIR, 'tmp')
+
+def get_object_path(content_hash, file_type):
+    """Путь к файлу в хранилище, адресуемом по содержимому"""
+    return os.path.join(OBJECTS_DIR, content_hash[:2], f"{content_hash}{file_type}")
+
+def get_upload_path(file_unique_id):
+    """Временный путь для скачивания файла из Telegram"""
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    return os.path.join(UPLOADS_DIR, file_unique_id)
+
+def store_drawing_file(upload_path, file_type):
+    """Перемещает загруженный файл в хранилище.
+
+    Одинаковое содержимое хранится один раз: если объект уже есть,
+    временный файл просто удаляется. Возвращает (content_hash, object_path).
+    """
+    content_hash = compute_file_hash(upload_path)
+    object_path = get_object_path(content_hash, file_type)
+
+    if os.path.exists(object_path):
+        os.remove(upload_path)
+        logger.info(f"Объект {content_hash[:12]} уже есть в хранилище")
+    else:
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        os.replace(upload_path, object_path)
+        logger.info(f"Файл сохранен в хранилище: {object_path}")
+
+    return content_hash, object_path
+
+def save_drawing_revision(stamp_id, name, file_type, content_hash, file_path, description=""):
+    """Добавляет новую версию чертежа в цепочку (штамп, название).
+
+    Возвращает (drawing_id, version, created). Если содержимое совпадает
+    с последней версией, новая запись не создается и created = False.
+    """
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("""
+            SELECT id, CAST(version AS INTEGER), content_hash
+            FROM Drawings
+            WHERE stamp_id = ? AND name = ? AND is_latest = 1
+        """, (stamp_id, name))
+        latest = cursor.fetchone()
+
+        if latest and latest[2] == content_hash:
+            conn.rollback()
+            return latest[0], latest[1], False
+
+        version = (latest[1] or 0) + 1 if latest else 1
+        if latest:
+            cursor.execute(
+                "UPDATE Drawings SET is_latest = 0, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (latest[0],)
+            )
+
+        cursor.execute("""
+            INSERT INTO Drawings (stamp_id, name, file_type, file_path, description, version,
+                                  content_hash, file_size, is_latest)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)
+        """, (stamp_id, name, file_type, file_path, description, str(version),
+              content_hash, os.path.getsize(file_path)))
+        drawing_id = cursor.lastrowid
+        conn.commit()
+
+        logger.info(f"Сохранена версия {version} чертежа {name} для штампа {stamp_id}")
+        return drawing_id, version, True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def get_drawing_history(drawing_id):
+    """Возвращает все версии чертежа, к цепочке которого относится drawing_id"""
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT h.id, h.name, h.version, h.file_type, h.created_at, h.is_latest, s.id, s.name
+            FROM Drawings d
+            JOIN Drawings h ON h.stamp_id = d.stamp_id AND h.name = d.name
+            JOIN Stamps s ON s.id = d.stamp_id
+            WHERE d.id = ?
+            ORDER BY h.id DESC
+        """, (drawing_id,))
+        return cursor.fetchall()
+    finally:
+        conn.close()
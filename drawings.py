@@ -1,15 +1,40 @@
 import logging
+import asyncio
 import os
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, filters
 from database import get_connection, get_stamp_id_by_action
 from menu import back_to_menu_keyboard
 from constants import States
+from drawing_previews import (
+    compute_file_hash,
+    ensure_thumbnail,
+    save_content_hash,
+    save_telegram_file_id
+)
+from drawing_export import stamp_archive
+from pickers import get_stamp_catalog, open_picker
+from drawing_storage import (
+    get_drawing_history,
+    get_upload_path,
+    save_drawing_revision,
+    store_drawing_file
+)
 
 # Настройка логирования
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Ограничение Telegram на длину подписи к фото
+MAX_CAPTION_LENGTH = 1024
+
+async def edit_or_reply(query, text, reply_markup):
+    """Редактирует сообщение, а если это фото с превью - отправляет новое"""
+    if query.message.photo:
+        await query.message.reply_text(text, reply_markup=reply_markup)
+    else:
+        await query.message.edit_text(text, reply_markup=reply_markup)
+
 async def show_drawings_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает главное меню чертежей"""
     query = update.callback_query
@@ -48,17 +73,12 @@ async def start_drawing_upload(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
 
     logger.info("Начало процесса загрузки чертежа")
-    conn = None
 
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
+        logger.info("Получение каталога штампов")
+        stamps = get_stamp_catalog()
 
-        logger.info("Получение списка штампов из базы данных")
-        cursor.execute("SELECT id, name FROM Stamps ORDER BY name")
-        stamps = cursor.fetchall()
-
-        if not stamps:
+        if not len(stamps):
             logger.warning("Список штампов пуст")
             await query.message.edit_text(
                 "В базе данных нет доступных штампов.",
@@ -69,22 +89,14 @@ async def start_drawing_upload(update: Update, context: ContextTypes.DEFAULT_TYP
             return States.DRAWINGS_MENU
 
         logger.info(f"Найдено штампов: {len(stamps)}")
-        keyboard = []
-        for stamp_id, stamp_name in stamps:
-            keyboard.append([InlineKeyboardButton(
-                stamp_name, 
-                callback_data=f"upload_for_stamp_{stamp_id}"
-            )])
-            logger.debug(f"Добавлена кнопка для штампа: {stamp_name} (ID: {stamp_id})")
-
-        keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="back_to_drawings")])
-
-        await query.message.edit_text(
+        state = await open_picker(
+            query, context, States.UPLOADING_DRAWING_STAMP,
             "Выберите штамп, для которого загружаете чертёж:",
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            "upload_for_stamp_", "back_to_drawings",
+            flow="drawings"
         )
         logger.info("Меню выбора штампа успешно отображено")
-        return States.UPLOADING_DRAWING_STAMP
+        return state
 
     except Exception as e:
         logger.error(f"Ошибка при получении списка штампов: {e}", exc_info=True)
@@ -95,10 +107,6 @@ async def start_drawing_upload(update: Update, context: ContextTypes.DEFAULT_TYP
             ]])
         )
         return States.DRAWINGS_MENU
-    finally:
-        if conn:
-            logger.debug("Закрытие соединения с базой данных")
-            conn.close()
 
 async def handle_drawing_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает загруженный файл чертежа или выбор штампа"""
@@ -131,40 +139,45 @@ async def handle_drawing_file(update: Update, context: ContextTypes.DEFAULT_TYPE
                 os.makedirs('drawings', exist_ok=True)
                 logger.info("Папка drawings создана или уже существует")
 
-                # Загружаем файл
+                # Загружаем файл во временную папку
                 new_file = await file.get_file()
-                file_path = f"drawings/{stamp_id}_{file_name}"
-                logger.info(f"Попытка сохранения файла по пути: {file_path}")
+                upload_path = get_upload_path(file.file_unique_id)
+                file_type = os.path.splitext(file_name)[1].lower()
+                logger.info(f"Попытка сохранения файла по пути: {upload_path}")
 
-                await new_file.download_to_drive(file_path)
-                logger.info(f"Файл успешно сохранен: {file_path}")
+                await new_file.download_to_drive(upload_path)
+                logger.info(f"Файл успешно скачан: {upload_path}")
 
-                # Сохраняем информацию в базу данных
-                conn = get_connection()
-                cursor = conn.cursor()
+                # Одинаковое содержимое хранится в одном экземпляре
+                content_hash, file_path = await asyncio.to_thread(store_drawing_file, upload_path, file_type)
 
+                # Сохраняем новую версию в базу данных
                 try:
-                    cursor.execute("""
-                        INSERT INTO Drawings (stamp_id, name, file_type, file_path, description)
-                        VALUES (?, ?, ?, ?, ?)
-                    """, (stamp_id, file_name, os.path.splitext(file_name)[1].lower(), file_path, ""))
-                    conn.commit()
-                    logger.info("Информация о файле успешно добавлена в базу данных")
-
-                    await update.message.reply_text(
-                        "✅ Чертёж успешно загружен!",
-                        reply_markup=InlineKeyboardMarkup([[
-                            InlineKeyboardButton("🔙 В меню чертежей", callback_data="back_to_drawings")
-                        ]])
+                    drawing_id, version, created = await asyncio.to_thread(
+                        save_drawing_revision, stamp_id, file_name, file_type, content_hash, file_path
                     )
-                    return States.DRAWINGS_MENU
-
                 except Exception as db_error:
                     logger.error(f"Ошибка при сохранении в базу данных: {db_error}", exc_info=True)
                     raise
-                finally:
-                    if conn:
-                        conn.close()
+
+                if created:
+                    logger.info(f"Информация о файле успешно добавлена в базу данных, версия {version}")
+                    # Миниатюра строится в фоне, чтобы первый просмотр был быстрым
+                    context.application.create_task(
+                        ensure_thumbnail(content_hash, file_path, file_type)
+                    )
+                    message = f"✅ Чертёж успешно загружен! Версия: {version}"
+                else:
+                    logger.info(f"Чертёж {file_name} не изменился, версия {version}")
+                    message = f"ℹ️ Чертёж не изменился, текущая версия: {version}"
+
+                await update.message.reply_text(
+                    message,
+                    reply_markup=InlineKeyboardMarkup([[
+                        InlineKeyboardButton("🔙 В меню чертежей", callback_data="back_to_drawings")
+                    ]])
+                )
+                return States.DRAWINGS_MENU
 
             except Exception as save_error:
                 logger.error(f"Ошибка при сохранении файла: {save_error}", exc_info=True)
@@ -248,26 +261,12 @@ async def view_drawings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name FROM Stamps ORDER BY name")
-    stamps = cursor.fetchall()
-    conn.close()
-
-    keyboard = []
-    for stamp_id, stamp_name in stamps:
-        keyboard.append([InlineKeyboardButton(
-            stamp_name, 
-            callback_data=f"view_drawings_stamp_{stamp_id}"
-        )])
-
-    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="back_to_drawings")])
-
-    await query.message.edit_text(
+    return await open_picker(
+        query, context, States.VIEWING_DRAWINGS,
         "Выберите штамп для просмотра чертежей:",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        "view_drawings_stamp_", "back_to_drawings",
+        flow="drawings"
     )
-    return States.VIEWING_DRAWINGS
 
 async def show_stamp_drawings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает список чертежей для конкретного штампа"""
@@ -280,19 +279,18 @@ async def show_stamp_drawings(update: Update, context: ContextTypes.DEFAULT_TYPE
     cursor = conn.cursor()
 
     try:
-        # Получаем название штампа
-        cursor.execute("SELECT name FROM Stamps WHERE id = ?", (stamp_id,))
-        stamp_name = cursor.fetchone()[0]
-
-        # Получаем список чертежей
+        # Название штампа и последние версии чертежей одним запросом по индексу idx_drawings_latest
         cursor.execute("""
-            SELECT id, name, file_type, file_path, description, version
-            FROM Drawings
-            WHERE stamp_id = ?
-            ORDER BY name
+            SELECT s.name, d.id, d.name, d.file_type, d.description, d.version
+            FROM Stamps s
+            LEFT JOIN Drawings d ON d.stamp_id = s.id AND d.is_latest = 1
+            WHERE s.id = ?
+            ORDER BY d.name
         """, (stamp_id,))
 
-        drawings = cursor.fetchall()
+        rows = cursor.fetchall()
+        stamp_name = rows[0][0]
+        drawings = [row[1:] for row in rows if row[1] is not None]
 
         if not drawings:
             message = f"Для штампа {stamp_name} нет загруженных чертежей."
@@ -301,7 +299,7 @@ async def show_stamp_drawings(update: Update, context: ContextTypes.DEFAULT_TYPE
             message = f"Чертежи для штампа {stamp_name}:\n\n"
             keyboard = []
 
-            for drawing_id, name, file_type, _, description, version in drawings:
+            for drawing_id, name, file_type, description, version in drawings:
                 message += f"📄 {name}"
                 if version:
                     message += f" (Версия: {version})"
@@ -311,17 +309,18 @@ async def show_stamp_drawings(update: Update, context: ContextTypes.DEFAULT_TYPE
                 message += "\n\n"
 
                 # Добавляем кнопки действий для каждого чертежа
-                keyboard.append([
+                buttons = [
                     InlineKeyboardButton(f"📥 Скачать {name}", callback_data=f"download_drawing_{drawing_id}"),
                     InlineKeyboardButton(f"👀 Просмотр {name}", callback_data=f"preview_drawing_{drawing_id}")
-                ])
+                ]
+                if version and int(version) > 1:
+                    buttons.append(InlineKeyboardButton("🕘 История", callback_data=f"drawing_history_{drawing_id}"))
+                keyboard.append(buttons)
 
+            keyboard.append([InlineKeyboardButton("📦 Скачать все", callback_data=f"download_all_drawings_{stamp_id}")])
             keyboard.append([InlineKeyboardButton("🔙 Назад к списку штампов", callback_data="view_drawings")])
 
-        await query.message.edit_text(
-            message,
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
+        await edit_or_reply(query, message, InlineKeyboardMarkup(keyboard))
         return States.VIEWING_DRAWINGS
 
     except Exception as e:
@@ -335,6 +334,55 @@ async def show_stamp_drawings(update: Update, context: ContextTypes.DEFAULT_TYPE
     finally:
         conn.close()
 
+async def show_drawing_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает все версии чертежа"""
+    query = update.callback_query
+    await query.answer()
+
+    drawing_id = int(query.data.split('_')[-1])
+
+    try:
+        history = await asyncio.to_thread(get_drawing_history, drawing_id)
+        if not history:
+            await edit_or_reply(
+                query,
+                "❌ Чертёж не найден.",
+                InlineKeyboardMarkup([[
+                    InlineKeyboardButton("🔙 Назад", callback_data="back_to_drawings")
+                ]])
+            )
+            return States.VIEWING_DRAWINGS
+
+        drawing_name, stamp_id, stamp_name = history[0][1], history[0][6], history[0][7]
+        message = f"🕘 История версий {drawing_name} (штамп {stamp_name}):\n\n"
+        keyboard = []
+
+        for revision_id, _, version, file_type, created_at, is_latest, _, _ in history:
+            message += f"Версия {version} - {created_at}"
+            if is_latest:
+                message += " (текущая)"
+            message += "\n"
+            keyboard.append([InlineKeyboardButton(
+                f"📥 Скачать версию {version}",
+                callback_data=f"download_drawing_{revision_id}"
+            )])
+
+        keyboard.append([InlineKeyboardButton("🔙 К списку чертежей", callback_data=f"view_drawings_stamp_{stamp_id}")])
+
+        await edit_or_reply(query, message, InlineKeyboardMarkup(keyboard))
+        return States.VIEWING_DRAWINGS
+
+    except Exception as e:
+        logger.error(f"Ошибка при получении истории чертежа: {e}", exc_info=True)
+        await edit_or_reply(
+            query,
+            "❌ Произошла ошибка при получении истории чертежа.",
+            InlineKeyboardMarkup([[
+                InlineKeyboardButton("🔙 Назад", callback_data="back_to_drawings")
+            ]])
+        )
+        return States.VIEWING_DRAWINGS
+
 async def search_drawings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начинает процесс поиска чертежей"""
     query = update.callback_query
@@ -365,7 +413,7 @@ async def handle_drawing_search(update: Update, context: ContextTypes.DEFAULT_TY
             SELECT d.name, d.file_type, s.name as stamp_name
             FROM Drawings d
             JOIN Stamps s ON s.id = d.stamp_id
-            WHERE d.name LIKE ? OR d.description LIKE ?
+            WHERE d.is_latest = 1 AND (d.name LIKE ? OR d.description LIKE ?)
             ORDER BY d.name
         """, (f"%{search_query}%", f"%{search_query}%"))
 
@@ -416,10 +464,11 @@ async def back_to_drawings_menu(update: Update, context: ContextTypes.DEFAULT_TY
         [InlineKeyboardButton("🔙 В главное меню", callback_data="back")]
     ]
 
-    await query.message.edit_text(
+    await edit_or_reply(
+        query,
         "Меню управления чертежами:\n"
         "Выберите необходимое действие:",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        InlineKeyboardMarkup(keyboard)
     )
     return States.DRAWINGS_MENU
 
@@ -435,7 +484,7 @@ async def download_drawing(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         cursor.execute("""
-            SELECT d.file_path, d.name, s.name as stamp_name, s.id as stamp_id
+            SELECT d.file_path, d.name, s.name as stamp_name, s.id as stamp_id, d.version, d.is_latest
             FROM Drawings d
             JOIN Stamps s ON s.id = d.stamp_id
             WHERE d.id = ?
@@ -446,7 +495,7 @@ async def download_drawing(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.message.reply_text("❌ Чертёж не найден.")
             return States.VIEWING_DRAWINGS
 
-        file_path, drawing_name, stamp_name, stamp_id = result
+        file_path, drawing_name, stamp_name, stamp_id, version, is_latest = result
 
         if not os.path.exists(file_path):
             await query.message.reply_text("❌ Файл чертежа не найден на сервере.")
@@ -457,7 +506,11 @@ async def download_drawing(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.message.reply_document(
                 document=file,
                 filename=drawing_name,
-                caption=f"Чертёж для штампа {stamp_name}",
+                caption=(
+                    f"Чертёж для штампа {stamp_name}"
+                    + (f", версия {version}" if version else "")
+                    + ("" if is_latest else " (устаревшая)")
+                ),
                 reply_markup=InlineKeyboardMarkup([
                     [InlineKeyboardButton("🔙 Назад к списку чертежей", callback_data=f"view_drawings_stamp_{stamp_id}")],
                     [InlineKeyboardButton("🏠 В главное меню чертежей", callback_data="back_to_drawings")]
@@ -472,6 +525,52 @@ async def download_drawing(update: Update, context: ContextTypes.DEFAULT_TYPE):
     finally:
         conn.close()
 
+async def download_all_drawings(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отправляет все чертежи штампа одним ZIP-архивом (или несколькими томами)"""
+    query = update.callback_query
+    await query.answer("Готовлю архив...")
+
+    stamp_id = int(query.data.split('_')[-1])
+    back_keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("🔙 Назад к списку чертежей", callback_data=f"view_drawings_stamp_{stamp_id}")],
+        [InlineKeyboardButton("🏠 В главное меню чертежей", callback_data="back_to_drawings")]
+    ])
+
+    try:
+        async with stamp_archive(stamp_id) as (stamp_name, manifest):
+            if not manifest or not manifest['volumes']:
+                await query.message.reply_text("❌ Нет файлов чертежей для архива.", reply_markup=back_keyboard)
+                return States.VIEWING_DRAWINGS
+
+            volumes = manifest['volumes']
+            for number, volume_path in enumerate(volumes, start=1):
+                if len(volumes) > 1:
+                    file_name = f"Чертежи {stamp_name} (часть {number} из {len(volumes)}).zip"
+                else:
+                    file_name = f"Чертежи {stamp_name}.zip"
+
+                caption = f"Чертежи для штампа {stamp_name}"
+                if number == len(volumes):
+                    skipped = manifest['missing'] + manifest['oversized']
+                    if skipped:
+                        caption += "\n\nНе вошли в архив: " + ", ".join(skipped)
+
+                with open(volume_path, 'rb') as archive:
+                    await query.message.reply_document(
+                        document=archive,
+                        filename=file_name,
+                        caption=caption[:MAX_CAPTION_LENGTH],
+                        reply_markup=back_keyboard if number == len(volumes) else None
+                    )
+
+            logger.info(f"Архив чертежей штампа {stamp_name} отправлен, томов: {len(volumes)}")
+            return States.VIEWING_DRAWINGS
+
+    except Exception as e:
+        logger.error(f"Ошибка при выгрузке архива чертежей: {e}", exc_info=True)
+        await query.message.reply_text("❌ Произошла ошибка при подготовке архива.", reply_markup=back_keyboard)
+        return States.VIEWING_DRAWINGS
+
 async def preview_drawing(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает превью чертежа"""
     query = update.callback_query
@@ -486,65 +585,98 @@ async def preview_drawing(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         try:
             cursor.execute("""
-                SELECT d.file_path, d.name, d.file_type, s.name as stamp_name, s.id as stamp_id, d.description
+                SELECT d.file_path, d.name, d.file_type, s.name as stamp_name, s.id as stamp_id, d.description,
+                       d.content_hash, t.content_hash IS NOT NULL, t.thumbnail_path, t.telegram_file_id
                 FROM Drawings d
                 JOIN Stamps s ON s.id = d.stamp_id
+                LEFT JOIN Drawing_Thumbnails t ON t.content_hash = d.content_hash
                 WHERE d.id = ?
             """, (drawing_id,))
 
             result = cursor.fetchone()
-            if not result:
-                logger.warning(f"Чертёж с ID {drawing_id} не найден в базе данных")
-                await query.message.edit_text(
-                    "❌ Чертёж не найден.",
-                    reply_markup=InlineKeyboardMarkup([[
-                        InlineKeyboardButton("🔙 Назад", callback_data="back_to_drawings")
-                    ]])
-                )
-                return States.DRAWINGS_MENU
-
-            file_path, drawing_name, file_type, stamp_name, stamp_id, description = result
-            logger.info(f"Получены данные для чертежа: {drawing_name}, штамп: {stamp_name}")
-
-            if not os.path.exists(file_path):
-                logger.error(f"Файл не найден по пути: {file_path}")
-                await query.message.edit_text(
-                    "❌ Файл чертежа не найден на сервере.",
-                    reply_markup=InlineKeyboardMarkup([[
-                        InlineKeyboardButton("🔙 Назад", callback_data="back_to_drawings")
-                    ]])
-                )
-                return States.DRAWINGS_MENU
+        except Exception as db_error:
+            logger.error(f"Ошибка при работе с базой данных: {db_error}", exc_info=True)
+            raise
+        finally:
+            if conn:
+                conn.close()
 
-            # Формируем информацию о чертеже
-            message = (
-                f"📄 Информация о чертеже\n\n"
-                f"Название: {drawing_name}\n"
-                f"Тип файла: {file_type}\n"
-                f"Штамп: {stamp_name}"
+        if not result:
+            logger.warning(f"Чертёж с ID {drawing_id} не найден в базе данных")
+            await edit_or_reply(
+                query,
+                "❌ Чертёж не найден.",
+                InlineKeyboardMarkup([[
+                    InlineKeyboardButton("🔙 Назад", callback_data="back_to_drawings")
+                ]])
             )
-            if description:
-                message += f"\n\nОписание: {description}"
+            return States.DRAWINGS_MENU
 
-            keyboard = [
-                [InlineKeyboardButton("📥 Скачать", callback_data=f"download_drawing_{drawing_id}")],
-                [InlineKeyboardButton("🔙 К списку чертежей", callback_data=f"view_drawings_stamp_{stamp_id}")],
-                [InlineKeyboardButton("🏠 В главное меню чертежей", callback_data="back_to_drawings")]
-            ]
+        (file_path, drawing_name, file_type, stamp_name, stamp_id, description,
+         content_hash, thumbnail_known, thumbnail_path, telegram_file_id) = result
+        logger.info(f"Получены данные для чертежа: {drawing_name}, штамп: {stamp_name}")
 
-            await query.message.edit_text(
-                message,
-                reply_markup=InlineKeyboardMarkup(keyboard)
+        if not os.path.exists(file_path):
+            logger.error(f"Файл не найден по пути: {file_path}")
+            await edit_or_reply(
+                query,
+                "❌ Файл чертежа не найден на сервере.",
+                InlineKeyboardMarkup([[
+                    InlineKeyboardButton("🔙 Назад", callback_data="back_to_drawings")
+                ]])
             )
-            logger.info("Превью чертежа успешно отображено")
             return States.DRAWINGS_MENU
 
-        except Exception as db_error:
-            logger.error(f"Ошибка при работе с базой данных: {db_error}", exc_info=True)
-            raise
-        finally:
-            if conn:
-                conn.close()
+        # Формируем информацию о чертеже
+        message = (
+            f"📄 Информация о чертеже\n\n"
+            f"Название: {drawing_name}\n"
+            f"Тип файла: {file_type}\n"
+            f"Штамп: {stamp_name}"
+        )
+        if description:
+            message += f"\n\nОписание: {description}"
+
+        keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("📥 Скачать", callback_data=f"download_drawing_{drawing_id}")],
+            [InlineKeyboardButton("🔙 К списку чертежей", callback_data=f"view_drawings_stamp_{stamp_id}")],
+            [InlineKeyboardButton("🏠 В главное меню чертежей", callback_data="back_to_drawings")]
+        ])
+
+        # Миниатюра уже есть в Telegram - отправляем её по file_id одним запросом
+        if telegram_file_id:
+            await query.message.reply_photo(
+                photo=telegram_file_id,
+                caption=message[:MAX_CAPTION_LENGTH],
+                reply_markup=keyboard
+            )
+            logger.info("Превью чертежа отправлено из кэша Telegram")
+            return States.VIEWING_DRAWINGS
+
+        if not content_hash:
+            content_hash = await asyncio.to_thread(compute_file_hash, file_path)
+            await asyncio.to_thread(save_content_hash, drawing_id, content_hash)
+            thumbnail_known = False
+
+        if not thumbnail_known:
+            thumbnail_path = await ensure_thumbnail(content_hash, file_path, file_type)
+
+        if thumbnail_path and os.path.exists(thumbnail_path):
+            with open(thumbnail_path, 'rb') as photo:
+                sent_message = await query.message.reply_photo(
+                    photo=photo,
+                    caption=message[:MAX_CAPTION_LENGTH],
+                    reply_markup=keyboard
+                )
+            if sent_message.photo:
+                await asyncio.to_thread(save_telegram_file_id, content_hash, sent_message.photo[-1].file_id)
+            logger.info("Превью чертежа отправлено с миниатюрой")
+            return States.VIEWING_DRAWINGS
+
+        # Для форматов без миниатюры (например, .dwg) показываем только описание
+        await edit_or_reply(query, message, keyboard)
+        logger.info("Превью чертежа успешно отображено")
+        return States.VIEWING_DRAWINGS
 
     except Exception as e:
         logger.error(f"Общая ошибка при предпросмотре чертежа: {e}", exc_info=True)
@@ -563,4 +695,4 @@ async def preview_drawing(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     InlineKeyboardButton("🔙 Назад", callback_data="back_to_drawings")
                 ]])
             )
-        return States.DRAWINGS_MENU
\ No newline at end of file
+        return States.DRAWINGS_MENU
@@ -6,6 +6,10 @@ import logging
 from constants import States
 from menu import back_to_menu_keyboard, menu, get_menu_keyboard
 from database import get_stamp_id_by_action
+from compatibility_graph import compatibility_graph
+from substitutes import invalidate_substitutes
+from part_search import part_search_index
+from name_matching import normalize_name
 
 logger = logging.getLogger(__name__)
 
@@ -211,6 +215,9 @@ async def handle_delete_confirm(update: Update, context: ContextTypes.DEFAULT_TY
         db = context.application.db
         await db.execute(f"DELETE FROM {table_name} WHERE id = ?", (item_id,))
         await db.commit()
+        compatibility_graph.remove_part((table_name, item_id))
+        invalidate_substitutes()
+        await part_search_index.refresh_part(table_name, item_id)
 
         current_menu = context.user_data.get('current_menu', 'main_menu')
         keyboard = InlineKeyboardMarkup([[
@@ -275,7 +282,14 @@ async def handle_edit_value(update: Update, context: ContextTypes.DEFAULT_TYPE)
             f"UPDATE {table_name} SET {field} = ? WHERE id = ?",
             (new_value, item_id)
         )
+        if field == 'name':
+            await db.execute(
+                f"UPDATE {table_name} SET name_key = ? WHERE id = ?",
+                (normalize_name(new_value), item_id)
+            )
         await db.commit()
+        invalidate_substitutes()
+        await part_search_index.refresh_part(table_name, item_id)
 
         current_menu = context.user_data.get('current_menu', 'main_menu')
         keyboard = InlineKeyboardMarkup([[
@@ -434,7 +448,14 @@ async def handle_exit_options(update: Update, context: ContextTypes.DEFAULT_TYPE
                     f"UPDATE {table_name} SET {field} = ? WHERE id = ?",
                     (new_value, item_id)
                 )
+                if field == 'name':
+                    await db.execute(
+                        f"UPDATE {table_name} SET name_key = ? WHERE id = ?",
+                        (normalize_name(new_value), item_id)
+                    )
                 await db.commit()
+                invalidate_substitutes()
+                await part_search_index.refresh_part(table_name, item_id)
 
                 await query.message.reply_text(
                     "✅ Изменения сохранены.",
@@ -1,9 +1,17 @@
+import time
+# Отсчет времени запуска - до импорта остальных модулей
+PROCESS_STARTED = time.monotonic()
+
 import logging
-import aiosqlite
 import re
 import asyncio
+import sys
+import os
+import functools
+import datetime
 from constants import States
 from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import RetryAfter
 from telegram.ext import (
     Application,
     CallbackQueryHandler,
@@ -11,13 +19,35 @@ from telegram.ext import (
     filters,
     ConversationHandler,
     ContextTypes,
-    MessageHandler
+    InlineQueryHandler,
+    MessageHandler,
+    TypeHandler,
 )
 
 from menu import menu, create_inventory_submenus, inventory_list, get_menu_keyboard, back_to_menu_keyboard, process_main_menu_action
-from showballance import show_balance
-from new_item import add_new_item, handle_new_item_input, invalid_input, go_back
-from change_quantity import (
+from drawing_scrubber import DrawingScrubber, get_scrub_report
+from backup import DatabaseBackup, format_snapshots
+from scheduler import JobScheduler, optimize_database, checkpoint_wal, warm_hot_stamps, journal_mode
+from digest import digest_command, send_daily_digest
+from timeutil import display_zone
+from compatibility_graph import compatibility_graph
+from migrations import migrate
+from persistence import SQLitePersistence
+from update_processor import ChatOrderedUpdateProcessor, format_update_stats
+from webhook import run_webhook
+from rate_limiter import PriorityRateLimiter, format_rate_limiter_stats
+from instrumentation import instrument_application, connect_async, MetricsServer, log_metrics_summary
+from query_profiler import query_profiler
+from logging_setup import setup_logging, parse_module_settings
+from lazy_handlers import lazy_callbacks, warm_up
+
+# Модули функций загружаются при первом обращении к их обработчикам,
+# чтобы бот начинал отвечать сразу после перезапуска
+show_balance, show_substitutes = lazy_callbacks('showballance', 'show_balance', 'show_substitutes')
+add_new_item, handle_new_item_input, invalid_input, go_back = lazy_callbacks(
+    'new_item', 'add_new_item', 'handle_new_item_input', 'invalid_input', 'go_back'
+)
+(
     change_quantity_callback,
     item_name_received,
     adjust_quantity_callback,
@@ -27,19 +57,37 @@ from change_quantity import (
     cancel,
     invalid_input_in_choosing,
     invalid_input_in_adjusting,
+) = lazy_callbacks(
+    'change_quantity',
+    'change_quantity_callback',
+    'item_name_received',
+    'adjust_quantity_callback',
+    'done_adjustment',
+    'save_and_exit',
+    'exit_without_saving',
+    'cancel',
+    'invalid_input_in_choosing',
+    'invalid_input_in_adjusting',
 )
-
-from edit_delete_item import (
+(
     show_edit_delete_menu,
     handle_edit_choice,
     handle_edit_field,
     handle_edit_value,
     handle_delete_confirm,
     handle_exit_options,
-    handle_action_selection
+    handle_action_selection,
+) = lazy_callbacks(
+    'edit_delete_item',
+    'show_edit_delete_menu',
+    'handle_edit_choice',
+    'handle_edit_field',
+    'handle_edit_value',
+    'handle_delete_confirm',
+    'handle_exit_options',
+    'handle_action_selection',
 )
-
-from compatibility import (
+(
     show_compatibility_menu,
     check_compatibility,
     show_compatible_parts,
@@ -60,10 +108,32 @@ from compatibility import (
     handle_edit_compatibility_delete,
     handle_edit_compatibility_notes,
     save_edited_notes,
-    back_to_compat_list
+    back_to_compat_list,
+) = lazy_callbacks(
+    'compatibility',
+    'show_compatibility_menu',
+    'check_compatibility',
+    'show_compatible_parts',
+    'add_compatibility_start',
+    'select_target_stamp',
+    'select_part_type_and_name',
+    'handle_part_name_input',
+    'handle_part_selection',
+    'add_compatibility_notes',
+    'save_compatibility',
+    'back_to_compatibility_menu',
+    'back_to_stamp_list',
+    'back_to_source_selection',
+    'back_to_target_selection',
+    'back_to_type_selection',
+    'edit_compatibility_start',
+    'handle_edit_compatibility_choice',
+    'handle_edit_compatibility_delete',
+    'handle_edit_compatibility_notes',
+    'save_edited_notes',
+    'back_to_compat_list',
 )
-
-from drawings import (
+(
     show_drawings_menu,
     start_drawing_upload,
     handle_drawing_file,
@@ -73,22 +143,70 @@ from drawings import (
     handle_drawing_search,
     back_to_drawings_menu,
     download_drawing,
-    preview_drawing
+    download_all_drawings,
+    preview_drawing,
+    show_drawing_history,
+) = lazy_callbacks(
+    'drawings',
+    'show_drawings_menu',
+    'start_drawing_upload',
+    'handle_drawing_file',
+    'view_drawings',
+    'show_stamp_drawings',
+    'search_drawings',
+    'handle_drawing_search',
+    'back_to_drawings_menu',
+    'download_drawing',
+    'download_all_drawings',
+    'preview_drawing',
+    'show_drawing_history',
 )
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('homut.log'),
-        logging.StreamHandler()
-    ]
+stocktake_start, stocktake_page, stocktake_counts, stocktake_done, end_stocktake = lazy_callbacks(
+    'stocktake', 'stocktake_start', 'stocktake_page', 'stocktake_counts', 'stocktake_done', 'end_stocktake'
 )
+handle_picker_page, handle_picker_filter = lazy_callbacks('pickers', 'handle_picker_page', 'handle_picker_filter')
+inline_part_search, adjust_part_quantity = lazy_callbacks('part_search', 'inline_part_search', 'adjust_part_quantity')
 
 logger = logging.getLogger(__name__)
 
+def picker_handlers(flow):
+    """Листание и фильтр списка выбора в диалоге flow (у каждого диалога свой выбор)"""
+    @functools.wraps(handle_picker_page)
+    async def page(update, context):
+        return await handle_picker_page(update, context, flow)
+
+    @functools.wraps(handle_picker_filter)
+    async def filter_by_text(update, context):
+        return await handle_picker_filter(update, context, flow)
+
+    return [
+        CallbackQueryHandler(page, pattern='^picker_(next_\d+|prev_\d+|clear)$'),
+        MessageHandler(filters.TEXT & ~filters.COMMAND, filter_by_text),
+    ]
+
+def clear_picker_on_end(conversation):
+    """Удаляет выбор диалога из user_data, когда диалог завершается"""
+    def wrap(callback):
+        @functools.wraps(callback)
+        async def wrapper(update, context):
+            state = await callback(update, context)
+            if state == ConversationHandler.END and isinstance(context.user_data.get('picker'), dict):
+                context.user_data['picker'].pop(conversation.name, None)
+            return state
+        return wrapper
+
+    handlers = conversation.entry_points + conversation.fallbacks
+    for state_handlers in conversation.states.values():
+        handlers += state_handlers
+    for handler in handlers:
+        handler.callback = wrap(handler.callback)
+    return conversation
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if isinstance(context.error, RetryAfter):
+        # Лимит Telegram исчерпан и после повторов - еще одно сообщение только усугубит его
+        logger.warning(f"Превышен лимит запросов к Telegram: {context.error}")
+        return
     logger.error(msg="Exception while handling an update:", exc_info=context.error)
     if update and update.effective_chat:
         await context.bot.send_message(
@@ -197,7 +315,11 @@ async def button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             'part_type_',
             'skip_notes',
             'edit_compat_',
+            'find_substitute_',
+            'picker_',
+            'part_qty_',
             'view_drawings_stamp_',
+            'drawing_history_',
             'upload_for_stamp_'
         ]):
             logger.info(f"Пропуск обработчика кнопок для callback конверсации: {data}")
@@ -258,7 +380,7 @@ async def button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return ConversationHandler.END
 
 # Обновляем ConversationHandler для совместимости
-compatibility_handler = ConversationHandler(
+compatibility_handler = clear_picker_on_end(ConversationHandler(
     entry_points=[
         CallbackQueryHandler(show_compatibility_menu, pattern='^compatibility_parts$')
     ],
@@ -275,17 +397,20 @@ compatibility_handler = ConversationHandler(
         ],
         States.CHECKING_COMPATIBILITY: [
             CallbackQueryHandler(show_compatible_parts, pattern='^check_stamp_\d+$'),
+            *picker_handlers('compatibility'),
             CallbackQueryHandler(back_to_stamp_list, pattern='^back_to_stamp_list$'),
             CallbackQueryHandler(back_to_compatibility_menu, pattern='^back_to_compatibility$'),
             CallbackQueryHandler(button, pattern='^back$')
         ],
         States.ADDING_COMPATIBILITY_SOURCE: [
             CallbackQueryHandler(select_target_stamp, pattern='^source_stamp_\d+$'),
+            *picker_handlers('compatibility'),
             CallbackQueryHandler(back_to_compatibility_menu, pattern='^back_to_compatibility$'),
             CallbackQueryHandler(button, pattern='^back$')
         ],
         States.ADDING_COMPATIBILITY_TARGET: [
             CallbackQueryHandler(select_part_type_and_name, pattern='^target_stamp_\d+$'),
+            *picker_handlers('compatibility'),
             CallbackQueryHandler(back_to_source_selection, pattern='^back_to_source_selection$'),
             CallbackQueryHandler(button, pattern='^back$')
         ],
@@ -295,7 +420,8 @@ compatibility_handler = ConversationHandler(
             CallbackQueryHandler(button, pattern='^back$')
         ],
         States.ADDING_COMPATIBILITY_NAME: [
-            CallbackQueryHandler(handle_part_selection, pattern='^select_part_.*$'),
+            CallbackQueryHandler(handle_part_selection, pattern='^select_part_\d+$'),
+            *picker_handlers('compatibility'),
             CallbackQueryHandler(back_to_type_selection, pattern='^back_to_type_selection$'),
             CallbackQueryHandler(button, pattern='^back$')
         ],
@@ -329,12 +455,12 @@ compatibility_handler = ConversationHandler(
         CallbackQueryHandler(button, pattern='^back$')
     ],
     name="compatibility",
-    persistent=False,
+    persistent=True,
     allow_reentry=True
-)
+))
 
 # Обновляем обработчик для работы с чертежами
-drawings_handler = ConversationHandler(
+drawings_handler = clear_picker_on_end(ConversationHandler(
     entry_points=[
         CallbackQueryHandler(show_drawings_menu, pattern='^drawings$')
     ],
@@ -348,6 +474,7 @@ drawings_handler = ConversationHandler(
         ],
         States.UPLOADING_DRAWING_STAMP: [
             CallbackQueryHandler(handle_drawing_file, pattern='^upload_for_stamp_\d+$'),
+            *picker_handlers('drawings'),
             CallbackQueryHandler(back_to_drawings_menu, pattern='^back_to_drawings$'),
             CallbackQueryHandler(button, pattern='^back$')
         ],
@@ -361,8 +488,11 @@ drawings_handler = ConversationHandler(
         ],
         States.VIEWING_DRAWINGS: [
             CallbackQueryHandler(show_stamp_drawings, pattern='^view_drawings_stamp_\d+$'),
+            *picker_handlers('drawings'),
             CallbackQueryHandler(download_drawing, pattern='^download_drawing_\d+$'),
+            CallbackQueryHandler(download_all_drawings, pattern='^download_all_drawings_\d+$'),
             CallbackQueryHandler(preview_drawing, pattern='^preview_drawing_\d+$'),
+            CallbackQueryHandler(show_drawing_history, pattern='^drawing_history_\d+$'),
             CallbackQueryHandler(view_drawings, pattern='^view_drawings$'),
             CallbackQueryHandler(back_to_drawings_menu, pattern='^back_to_drawings$'),
             CallbackQueryHandler(button, pattern='^back$')
@@ -378,36 +508,239 @@ drawings_handler = ConversationHandler(
         CallbackQueryHandler(button, pattern='^back$')
     ],
     name="drawings",
-    persistent=False,
+    persistent=True,
     allow_reentry=True
-)
+))
 
 ALLOWED_FILE_TYPES = ('.pdf', '.jpg', '.jpeg', '.png', '.bmp', '.gif', '.dwg')
 
+async def drawings_check(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Отчет о целостности файлов чертежей (только для администраторов)"""
+    from config import ADMIN_IDS
+
+    user_id = update.effective_user.id
+    if user_id not in ADMIN_IDS:
+        logger.warning(f"Пользователь {user_id} запросил отчет о чертежах без прав администратора")
+        await update.message.reply_text("Команда доступна только администраторам.")
+        return
+
+    report = await asyncio.to_thread(get_scrub_report)
+    await update.message.reply_text(report)
+
+async def updates_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Метрики очередей обновлений и отправки и фоновых задач (только для администраторов)"""
+    from config import ADMIN_IDS
+
+    user_id = update.effective_user.id
+    if user_id not in ADMIN_IDS:
+        logger.warning(f"Пользователь {user_id} запросил метрики без прав администратора")
+        await update.message.reply_text("Команда доступна только администраторам.")
+        return
+
+    report = format_update_stats(context.application.update_processor.get_stats())
+    report += "\n\n" + format_rate_limiter_stats(context.bot.rate_limiter.get_stats())
+    report += "\n\n" + context.application.scheduler.metrics.format_report()
+    await update.message.reply_text(report)
+
+async def query_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Самые затратные запросы к базе (только для администраторов); /query_stats reset - обнулить"""
+    from config import ADMIN_IDS
+
+    user_id = update.effective_user.id
+    if user_id not in ADMIN_IDS:
+        logger.warning(f"Пользователь {user_id} запросил профиль запросов без прав администратора")
+        await update.message.reply_text("Команда доступна только администраторам.")
+        return
+
+    if context.args and context.args[0] == 'reset':
+        query_profiler.reset()
+        await update.message.reply_text("Статистика запросов обнулена.")
+        return
+    await update.message.reply_text(query_profiler.format_report())
+
+async def backup(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Резервная копия базы по запросу (только для администраторов); /backup list - список копий"""
+    from config import ADMIN_IDS
+
+    user_id = update.effective_user.id
+    if user_id not in ADMIN_IDS:
+        logger.warning(f"Пользователь {user_id} запросил резервную копию без прав администратора")
+        await update.message.reply_text("Команда доступна только администраторам.")
+        return
+
+    database_backup = context.application.database_backup
+    if context.args and context.args[0] == 'list':
+        await update.message.reply_text(format_snapshots(database_backup.backup_dir))
+        return
+
+    await update.message.reply_text("Создаю резервную копию базы...")
+    try:
+        path, size, elapsed, details = await database_backup.run_backup()
+    except Exception as e:
+        logger.error(f"Ошибка при резервном копировании по команде: {e}", exc_info=True)
+        await update.message.reply_text(f"Не удалось создать резервную копию: {e}")
+        return
+    await update.message.reply_text(
+        f"✅ Резервная копия {os.path.basename(path)}: {size / 1024:.0f} КБ за {elapsed:.1f} с, "
+        f"проверка целостности пройдена ({details})."
+    )
+
+async def expire_persistence(application: Application) -> None:
+    """Удаляет user_data и диалоги, не менявшиеся дольше срока хранения, из базы и из памяти"""
+    user_ids, conversations = await application.persistence.expire(application.scheduler.run_blocking)
+    for user_id in user_ids:
+        application.drop_user_data(user_id)
+
+    # У ConversationHandler нет открытого способа завершить чужой диалог; запись в базе уже
+    # удалена, поэтому достаточно забыть состояние в памяти
+    handlers = {
+        handler.name: handler
+        for group in application.handlers.values() for handler in group
+        if isinstance(handler, ConversationHandler) and handler.persistent
+    }
+    for name, key in conversations:
+        if name in handlers:
+            handlers[name]._conversations.pop(key, None)
+
 async def on_startup(application: Application) -> None:
-    application.db = await aiosqlite.connect('inventory.db')
+    from config import (
+        SCRUB_BYTES_PER_SECOND, SCRUB_BATCH_SIZE, SCRUB_INTERVAL_SECONDS,
+        BACKUP_DIR, BACKUP_INTERVAL_SECONDS, BACKUP_KEEP, BACKUP_RETENTION_DAYS,
+        BACKUP_PAGES_PER_STEP, BACKUP_STEP_PAUSE,
+        METRICS_LISTEN, METRICS_PORT, METRICS_LOG_INTERVAL, SLOW_QUERY_MS, LAZY_WARMUP_DELAY,
+        JOBS_MAX_CONCURRENT, JOBS_JITTER, OPTIMIZE_INTERVAL_SECONDS, WAL_CHECKPOINT_INTERVAL_SECONDS,
+        WARM_HOT_STAMPS, DIGEST_TIME, DIGEST_LOW_STOCK, PERSISTENCE_EXPIRE_INTERVAL_SECONDS,
+    )
+    from part_search import part_search_index
+
+    query_profiler.slow_threshold = SLOW_QUERY_MS / 1000
+
+    application.db = await connect_async('inventory.db')
     logger.info("Подключение к базе данных установлено.")
 
+    await asyncio.gather(
+        asyncio.to_thread(compatibility_graph.load),
+        asyncio.to_thread(part_search_index.load),
+    )
+
+    # Фоновые задачи запускает JobQueue после старта приложения
+    scheduler = application.scheduler = JobScheduler(application, JOBS_MAX_CONCURRENT, JOBS_JITTER)
+
+    application.drawing_scrubber = DrawingScrubber(
+        SCRUB_BYTES_PER_SECOND, SCRUB_BATCH_SIZE, run_blocking=scheduler.run_blocking
+    )
+    if SCRUB_INTERVAL_SECONDS:
+        scheduler.add_job('drawing_scrub', application.drawing_scrubber.run_pass, SCRUB_INTERVAL_SECONDS, first=60)
+
+    application.database_backup = DatabaseBackup(
+        BACKUP_DIR, BACKUP_KEEP, BACKUP_RETENTION_DAYS, BACKUP_PAGES_PER_STEP, BACKUP_STEP_PAUSE,
+        run_blocking=scheduler.run_blocking,
+    )
+    if BACKUP_INTERVAL_SECONDS:
+        scheduler.add_job(
+            'backup', application.database_backup.run_backup, BACKUP_INTERVAL_SECONDS,
+            first=application.database_backup.seconds_until_due(BACKUP_INTERVAL_SECONDS),
+        )
+
+    if OPTIMIZE_INTERVAL_SECONDS:
+        scheduler.add_job('optimize', functools.partial(optimize_database, scheduler), OPTIMIZE_INTERVAL_SECONDS)
+    if WAL_CHECKPOINT_INTERVAL_SECONDS and await asyncio.to_thread(journal_mode) == 'wal':
+        scheduler.add_job(
+            'wal_checkpoint', functools.partial(checkpoint_wal, scheduler), WAL_CHECKPOINT_INTERVAL_SECONDS
+        )
+    if WARM_HOT_STAMPS:
+        scheduler.add_once('warm_hot_stamps', functools.partial(warm_hot_stamps, scheduler, WARM_HOT_STAMPS), 5)
+    if DIGEST_TIME:
+        hour, minute = (int(value) for value in DIGEST_TIME.split(':'))
+        scheduler.add_daily(
+            'daily_digest', functools.partial(send_daily_digest, scheduler, DIGEST_LOW_STOCK),
+            datetime.time(hour, minute, tzinfo=display_zone()),
+        )
+    if METRICS_LOG_INTERVAL:
+        scheduler.add_job('metrics_summary', log_metrics_summary, METRICS_LOG_INTERVAL)
+    if PERSISTENCE_EXPIRE_INTERVAL_SECONDS and application.persistence:
+        scheduler.add_job(
+            'persistence_expire', functools.partial(expire_persistence, application),
+            PERSISTENCE_EXPIRE_INTERVAL_SECONDS,
+        )
+
+    if METRICS_PORT:
+        application.metrics_server = MetricsServer(METRICS_LISTEN, METRICS_PORT, collectors=(scheduler.metrics,))
+        await application.metrics_server.start()
+    if LAZY_WARMUP_DELAY:
+        application.warm_up = asyncio.create_task(warm_up(LAZY_WARMUP_DELAY))
+
+    logger.info(f"Бот готов к работе через {time.monotonic() - PROCESS_STARTED:.2f} с после запуска процесса")
+
 async def on_shutdown(application: Application) -> None:
     try:
+        if hasattr(application, 'scheduler'):
+            await application.scheduler.shutdown()
+
+        if hasattr(application, 'warm_up'):
+            application.warm_up.cancel()
+        if hasattr(application, 'metrics_server'):
+            await application.metrics_server.stop()
+
         if hasattr(application, 'db'):
             await application.db.close()
             logger.info("Соединение с базой данных закрыто.")
 
+        # Пул отрисовки превью есть, только если модуль чертежей успел загрузиться
+        if 'drawing_previews' in sys.modules:
+            sys.modules['drawing_previews'].shutdown()
+        logger.info(query_profiler.format_report())
         logger.info("Бот успешно остановлен.")
     except Exception as e:
         logger.error(f"Ошибка при остановке бота: {e}")
 
 def main() -> None:
-    from config import BOT_TOKEN
+    from config import (
+        BOT_TOKEN, BOT_MODE, TELEGRAM_API_BASE_URL, TELEGRAM_API_BASE_FILE_URL,
+        PERSISTENCE_UPDATE_INTERVAL, USER_DATA_TTL_DAYS, MAX_CONCURRENT_UPDATES,
+        WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+        LOG_LEVEL, LOG_FILE_FORMAT, LOG_MODULE_LEVELS, LOG_SAMPLING, STOCKTAKE_TIMEOUT_SECONDS,
+    )
+
+    # Запись в файл и на консоль идет в фоновом потоке, а не в цикле событий
+    setup_logging(
+        level=LOG_LEVEL,
+        file_format=LOG_FILE_FORMAT,
+        module_levels=parse_module_settings(LOG_MODULE_LEVELS, str.upper),
+        sampling=parse_module_settings(LOG_SAMPLING, float),
+    )
 
     logger.info("Запуск бота...")
     try:
-        application = Application.builder().token(BOT_TOKEN).build()
+        # Схема обновляется до загрузки сохраненного состояния: его таблицы создает миграция
+        migrate('inventory.db')
+
+        # Незавершенные диалоги и user_data переживают перезапуск бота
+        persistence = SQLitePersistence(
+            update_interval=PERSISTENCE_UPDATE_INTERVAL,
+            user_data_ttl_days=USER_DATA_TTL_DAYS,
+        )
+        # Разные чаты обрабатываются параллельно, обновления одного чата - по порядку
+        update_processor = ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES)
+        application = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .base_url(TELEGRAM_API_BASE_URL)
+            .base_file_url(TELEGRAM_API_BASE_FILE_URL)
+            .persistence(persistence)
+            .concurrent_updates(update_processor)
+            .rate_limiter(PriorityRateLimiter())
+            .build()
+        )
         logger.info("Успешно создано приложение с токеном")
 
         # Настройка обработчиков
         application.add_handler(CommandHandler("start", start))
+        application.add_handler(CommandHandler("drawings_check", drawings_check))
+        application.add_handler(CommandHandler("updates_stats", updates_stats))
+        application.add_handler(CommandHandler("query_stats", query_stats))
+        application.add_handler(CommandHandler("backup", backup))
+        application.add_handler(CommandHandler("digest", digest_command))
 
         # Обработчик изменения количества
         conv_handler = ConversationHandler(
@@ -436,7 +769,7 @@ def main() -> None:
                 CommandHandler('start', start)
             ],
             name="change_quantity",
-            persistent=False,
+            persistent=True,
             allow_reentry=True
         )
         application.add_handler(conv_handler)
@@ -458,7 +791,7 @@ def main() -> None:
                 CommandHandler('start', start)
             ],
             name="add_item",
-            persistent=False,
+            persistent=True,
             allow_reentry=True
         )
         application.add_handler(add_item_conv_handler)
@@ -496,7 +829,7 @@ def main() -> None:
                 CallbackQueryHandler(go_back, pattern='^back$')
             ],
             name="edit_delete",
-            persistent=False,
+            persistent=True,
             allow_reentry=True
         )
         application.add_handler(edit_delete_handler)
@@ -508,15 +841,60 @@ def main() -> None:
         # Добавляем обработчик чертежей
         application.add_handler(drawings_handler)
 
+        # Поиск замены для закончившейся детали
+        application.add_handler(CallbackQueryHandler(show_substitutes, pattern='^find_substitute_\w+_\d+$'))
+
+        # Inline-поиск деталей и быстрые действия из карточки детали
+        application.add_handler(InlineQueryHandler(inline_part_search))
+        application.add_handler(CallbackQueryHandler(adjust_part_quantity, pattern='^part_qty_\w+_\d+_[+-]1$'))
+
+        # Инвентаризация: все позиции категории одним экраном, количества одним сообщением.
+        # Диалог стоит в группе -1: пока он идет, текст достается ему, даже если другой диалог
+        # оставлен в ожидании ввода, и дальше не передается. Любая другая кнопка или /start
+        # завершает инвентаризацию и обрабатывается как обычно
+        stocktake_handler = ConversationHandler(
+            entry_points=[
+                CallbackQueryHandler(stocktake_start, pattern='^stocktake[a-z]+\w+$')
+            ],
+            states={
+                States.STOCKTAKE_ENTERING_COUNTS: [
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, stocktake_counts),
+                    CallbackQueryHandler(stocktake_page, pattern='^stocktake_(next|prev)_\d+$'),
+                    CallbackQueryHandler(stocktake_done, pattern='^stocktake_done$')
+                ],
+                ConversationHandler.TIMEOUT: [
+                    TypeHandler(Update, end_stocktake)
+                ]
+            },
+            fallbacks=[
+                CallbackQueryHandler(end_stocktake, pattern='^(?!stocktake)'),
+                CommandHandler('start', end_stocktake)
+            ],
+            name="stocktake",
+            persistent=True,
+            allow_reentry=True,
+            conversation_timeout=STOCKTAKE_TIMEOUT_SECONDS or None
+        )
+        application.add_handler(stocktake_handler, group=-1)
+        logger.info("Настроен обработчик инвентаризации")
+
         # Общий обработчик кнопок
         application.add_handler(CallbackQueryHandler(button))
         application.add_error_handler(error_handler)
 
+        # Время, запросы к БД и Telegram по каждому обработчику и состоянию диалога
+        instrument_application(application)
+
         application.post_init = on_startup
         application.post_shutdown = on_shutdown
 
         logger.info("Все обработчики успешно добавлены, запускаю бота...")
-        application.run_polling()
+        if BOT_MODE == 'webhook':
+            asyncio.run(run_webhook(
+                application, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET
+            ))
+        else:
+            application.run_polling()
         logger.info("Бот успешно запущен и работает")
 
     except Exception as e:
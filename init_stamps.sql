@@ -1,16 +1,4 @@
--- Удаляем старую таблицу Stamps если она существует
-DROP TABLE IF EXISTS Stamps;
-
--- Создаем таблицу Stamps заново
-CREATE TABLE Stamps (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    name TEXT NOT NULL,
-    size REAL NOT NULL,
-    description TEXT,
-    createdAt TEXT DEFAULT (STRFTIME('%Y-%m-%d %H:%M:%S')),
-    updatedAt TEXT DEFAULT (STRFTIME('%Y-%m-%d %H:%M:%S'))
-);
-
+-- Начальный список штампов; таблицу создает python migrations.py
 -- Вставляем данные из inventory_list
 INSERT INTO Stamps (name, size, description) VALUES
 ('11.3', 11.3, 'Штамп 11.3'),
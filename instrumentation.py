@@ -0,0 +1,359 @@
+import asyncio
+import functools
+import logging
+import re
+import sqlite3
+import sys
+import time
+from contextvars import ContextVar
+import aiosqlite
+from telegram.ext import ApplicationHandlerStop, ConversationHandler
+from query_profiler import query_profiler
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм времени, секунды
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Границы корзин гистограммы выделенных блоков памяти
+BLOCKS_BUCKETS = (100, 1000, 10000, 100000, 1000000)
+
+# Виды времени обработчика: полное, в SQLite, в запросах к Telegram и в очереди отправки
+TIME_KINDS = ('wall', 'db', 'api', 'api_wait')
+
+_current_span = ContextVar('handler_span', default=None)
+
+class HandlerSpan:
+    """Счетчики одного вызова обработчика"""
+
+    __slots__ = ('db', 'db_queries', 'api', 'api_wait', 'api_calls')
+
+    def __init__(self):
+        self.db = 0.0
+        self.db_queries = 0
+        self.api = 0.0
+        self.api_wait = 0.0
+        self.api_calls = 0
+
+def add_db_time(seconds, query=True):
+    span = _current_span.get()
+    if span is not None:
+        span.db += seconds
+        span.db_queries += query
+
+def add_api_time(seconds, waited=0.0):
+    span = _current_span.get()
+    if span is not None:
+        span.api += seconds
+        span.api_wait += waited
+        span.api_calls += 1
+
+# --- Учет времени SQLite ---
+
+class TimedCursor(sqlite3.Cursor):
+    """Курсор sqlite3, относящий время запросов к текущему обработчику и к профилю запросов"""
+
+    _last_query = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            add_db_time(elapsed)
+            self._last_query = (sql, parameters, elapsed)
+            query_profiler.observe(self.connection, sql, parameters, elapsed)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            add_db_time(elapsed)
+            self._last_query = None
+            query_profiler.observe(self.connection, sql, (), elapsed)
+
+    def fetchall(self):
+        # Строки результата SQLite вычисляет при выборке, а не в execute
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            elapsed = time.perf_counter() - started
+            add_db_time(elapsed, query=False)
+            if self._last_query:
+                sql, parameters, executed = self._last_query
+                query_profiler.observe(self.connection, sql, parameters, executed, fetch_seconds=elapsed)
+
+class TimedConnection(sqlite3.Connection):
+    """Соединение sqlite3 с учетом времени запросов: sqlite3.connect(path, factory=TimedConnection)"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            add_db_time(time.perf_counter() - started, query=False)
+
+class TimedAsyncConnection(aiosqlite.Connection):
+    """Соединение aiosqlite, относящее время каждой операции (с ожиданием потока) к обработчику.
+
+    Запросы в потоке aiosqlite идут через TimedConnection и попадают в профиль
+    запросов; время обработчика считается здесь, в его собственном контексте.
+    """
+
+    async def _execute(self, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super()._execute(fn, *args, **kwargs)
+        finally:
+            add_db_time(time.perf_counter() - started)
+
+def connect_async(database, **kwargs):
+    """Замена aiosqlite.connect с учетом времени запросов"""
+    return TimedAsyncConnection(
+        lambda: sqlite3.connect(database, factory=TimedConnection, **kwargs), iter_chunk_size=64
+    )
+
+# --- Гистограммы ---
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, share):
+        """Оценка квантиля сверху: граница корзины, в которую он попал"""
+        if not self.count:
+            return 0.0
+        rank = share * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+class HandlerMetrics:
+    """Гистограммы по обработчикам с метками handler, state и action"""
+
+    def __init__(self):
+        self.times = {}
+        self.blocks = {}
+        self.db_queries = {}
+        self.api_calls = {}
+        self.errors = {}
+
+    def observe(self, labels, wall, span, blocks, failed):
+        for kind, value in zip(TIME_KINDS, (wall, span.db, span.api, span.api_wait)):
+            key = labels + (kind,)
+            histogram = self.times.get(key)
+            if histogram is None:
+                histogram = self.times[key] = Histogram(SECONDS_BUCKETS)
+            histogram.observe(value)
+        histogram = self.blocks.get(labels)
+        if histogram is None:
+            histogram = self.blocks[labels] = Histogram(BLOCKS_BUCKETS)
+        histogram.observe(max(0, blocks))
+        self.db_queries[labels] = self.db_queries.get(labels, 0) + span.db_queries
+        self.api_calls[labels] = self.api_calls.get(labels, 0) + span.api_calls
+        if failed:
+            self.errors[labels] = self.errors.get(labels, 0) + 1
+
+    def render_prometheus(self):
+        lines = [
+            '# HELP homut_handler_seconds Время обработчика: wall - полное, db - SQLite, '
+            'api - запросы к Telegram, api_wait - ожидание в очереди отправки',
+            '# TYPE homut_handler_seconds histogram',
+        ]
+        for (handler, state, action, kind), histogram in sorted(self.times.items()):
+            lines += render_histogram(
+                'homut_handler_seconds', _labels(handler, state, action, kind=kind), histogram
+            )
+        lines += [
+            '# HELP homut_handler_allocated_blocks Прирост выделенных блоков памяти за вызов '
+            '(приблизительно: параллельные обработчики влияют друг на друга)',
+            '# TYPE homut_handler_allocated_blocks histogram',
+        ]
+        for (handler, state, action), histogram in sorted(self.blocks.items()):
+            lines += render_histogram(
+                'homut_handler_allocated_blocks', _labels(handler, state, action), histogram
+            )
+        for name, help_text, values in (
+            ('homut_handler_db_queries_total', 'Запросы к SQLite', self.db_queries),
+            ('homut_handler_api_calls_total', 'Запросы к Telegram', self.api_calls),
+            ('homut_handler_errors_total', 'Вызовы, завершившиеся исключением', self.errors),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for (handler, state, action), value in sorted(values.items()):
+                lines.append(f'{name}{_labels(handler, state, action)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def format_summary(self, limit=15):
+        """Самые долгие обработчики по суммарному времени"""
+        rows = []
+        for (handler, state, action, kind), wall in self.times.items():
+            if kind != 'wall':
+                continue
+            labels = (handler, state, action)
+            db = self.times[labels + ('db',)]
+            api = self.times[labels + ('api',)]
+            rows.append((wall.sum, labels, wall, db, api))
+        rows.sort(key=lambda row: row[0], reverse=True)
+
+        lines = ["Обработчики (по суммарному времени):"]
+        for _, (handler, state, action), wall, db, api in rows[:limit]:
+            name = '/'.join(part for part in (handler, state, action) if part)
+            lines.append(
+                f"{name}: вызовов {wall.count}, среднее {wall.sum / wall.count * 1000:.0f} мс "
+                f"(БД {db.sum / wall.count * 1000:.0f}, Telegram {api.sum / wall.count * 1000:.0f}), "
+                f"p95 ≤ {wall.quantile(0.95) * 1000:.0f} мс, ошибок {self.errors.get((handler, state, action), 0)}"
+            )
+        return '\n'.join(lines)
+
+def _labels(handler, state, action, **extra):
+    labels = {'handler': handler, 'state': state, 'action': action, **extra}
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels.items()) + '}'
+
+def render_histogram(name, labels, histogram):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{labels[:-1]},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{labels[:-1]},le="+Inf"}} {histogram.count}')
+    lines.append(f'{name}_sum{labels} {histogram.sum}')
+    lines.append(f'{name}_count{labels} {histogram.count}')
+    return lines
+
+handler_metrics = HandlerMetrics()
+
+# --- Обертки обработчиков ---
+
+def _action(update):
+    """Префикс callback_data без идентификаторов: stamp_12 -> stamp"""
+    query = getattr(update, 'callback_query', None)
+    if query is None or not query.data:
+        return ''
+    return re.match(r'[A-Za-z_:]*', query.data).group().rstrip('_:')
+
+def instrument_callback(callback, state=''):
+    if getattr(callback, '__instrumented__', False):
+        return callback
+    handler_name = callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        span = HandlerSpan()
+        token = _current_span.set(span)
+        blocks = sys.getallocatedblocks()
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            # Штатное завершение: обработчик просит не передавать обновление дальше
+            raise
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            wall = time.perf_counter() - started
+            _current_span.reset(token)
+            handler_metrics.observe(
+                (handler_name, state, _action(update)), wall, span,
+                sys.getallocatedblocks() - blocks, failed,
+            )
+
+    wrapper.__instrumented__ = True
+    return wrapper
+
+def _instrument_handler(handler, state=''):
+    if isinstance(handler, ConversationHandler):
+        for inner in handler.entry_points:
+            _instrument_handler(inner, f"{handler.name}:entry")
+        for conversation_state, handlers in handler.states.items():
+            state_name = getattr(conversation_state, 'name', conversation_state)
+            for inner in handlers:
+                _instrument_handler(inner, f"{handler.name}:{state_name}")
+        for inner in handler.fallbacks:
+            _instrument_handler(inner, f"{handler.name}:fallback")
+    else:
+        handler.callback = instrument_callback(handler.callback, state)
+
+def instrument_application(application):
+    """Оборачивает все зарегистрированные обработчики и обработчики ошибок"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            _instrument_handler(handler)
+    application.error_handlers = {
+        instrument_callback(callback, 'error'): block
+        for callback, block in application.error_handlers.items()
+    }
+
+# --- Экспорт ---
+
+class MetricsServer:
+    """Отдает метрики в текстовом формате Prometheus по GET /metrics"""
+
+    def __init__(self, listen, port, collectors=()):
+        self.listen = listen
+        self.port = port
+        # Кроме метрик обработчиков: объекты с render_prometheus()
+        self.collectors = (handler_metrics, *collectors)
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.listen, self.port)
+        logger.info(f"Метрики доступны на http://{self.listen}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 10)
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split(' ')
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?', 1)[0] == '/metrics':
+                status, body = '200 OK', ''.join(
+                    collector.render_prometheus() for collector in self.collectors
+                ).encode()
+            else:
+                status, body = '404 Not Found', b''
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.TimeoutError) as e:
+            logger.debug(f"Запрос метрик прерван: {e}")
+        finally:
+            writer.close()
+
+async def log_metrics_summary():
+    if handler_metrics.times:
+        logger.info(handler_metrics.format_summary())
@@ -0,0 +1,49 @@
+import asyncio
+import importlib
+import logging
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# Модули, обработчики которых зарегистрированы заглушками
+_lazy_modules = []
+
+def lazy_callbacks(module_name, *names):
+    """Заглушки обработчиков: модуль импортируется при первом вызове любой из них.
+
+    show_balance, show_substitutes = lazy_callbacks('showballance', 'show_balance', 'show_substitutes')
+    """
+    if module_name not in _lazy_modules:
+        _lazy_modules.append(module_name)
+    callbacks = tuple(_lazy_callback(module_name, name) for name in names)
+    return callbacks if len(callbacks) > 1 else callbacks[0]
+
+def _lazy_callback(module_name, name):
+    target = None
+
+    async def callback(*args, **kwargs):
+        nonlocal target
+        if target is None:
+            target = getattr(_import(module_name), name)
+        return await target(*args, **kwargs)
+
+    callback.__name__ = callback.__qualname__ = name
+    callback.__module__ = module_name
+    return callback
+
+def _import(module_name):
+    module = sys.modules.get(module_name)
+    if module is None:
+        started = time.perf_counter()
+        module = importlib.import_module(module_name)
+        logger.info(f"Модуль {module_name} загружен за {(time.perf_counter() - started) * 1000:.0f} мс")
+    return module
+
+async def warm_up(delay):
+    """Через delay секунд после запуска подгружает в фоне модули, к которым еще не обращались,
+    чтобы первое нажатие в них не ждало импорта"""
+    await asyncio.sleep(delay)
+    for module_name in _lazy_modules:
+        if module_name not in sys.modules:
+            await asyncio.to_thread(_import, module_name)
@@ -0,0 +1,143 @@
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Обновление, которое сейчас обрабатывается: (update_id, chat_id, user_id)
+current_update = ContextVar('current_update', default=None)
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+def bind_update(update):
+    """Привязывает записи лога текущей задачи к обновлению; возвращает токен для сброса"""
+    chat = getattr(update, 'effective_chat', None)
+    user = getattr(update, 'effective_user', None)
+    return current_update.set((
+        getattr(update, 'update_id', None),
+        chat.id if chat else None,
+        user.id if user else None,
+    ))
+
+class UpdateContextFilter(logging.Filter):
+    """Добавляет к записи идентификаторы обновления; работает в потоке, который пишет в лог"""
+
+    def filter(self, record):
+        update_id, chat_id, user_id = current_update.get() or (None, None, None)
+        record.update_id = update_id
+        record.chat_id = chat_id
+        record.user_id = user_id
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю записей ниже WARNING для заданных модулей: {'change_quantity': 0.1}"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + '.'):
+                return random.random() < rate
+        return True
+
+class DeferredQueueHandler(QueueHandler):
+    """Кладет запись в очередь, откладывая форматирование до фонового потока.
+
+    В потоке обработчика только подставляются аргументы сообщения и
+    снимается текст исключения (пока оно живо); время, JSON и остальное
+    форматирование выполняет QueueListener.
+    """
+
+    def prepare(self, record):
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for field in ('update_id', 'chat_id', 'user_id'):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    """Привычный текстовый формат с номером обновления"""
+
+    def format(self, record):
+        text = super().format(record)
+        update_id = getattr(record, 'update_id', None)
+        if update_id is not None:
+            text += f" [update {update_id}]"
+        return text
+
+def parse_module_settings(value, convert):
+    """'change_quantity=WARNING,telegram=0.5' -> {'change_quantity': ..., 'telegram': ...}"""
+    settings = {}
+    for item in value.split(','):
+        name, _, setting = item.partition('=')
+        if name.strip() and setting.strip():
+            settings[name.strip()] = convert(setting.strip())
+    return settings
+
+def setup_logging(level='INFO', log_file='homut.log', file_format='json', console_format='text',
+                  module_levels=None, sampling=None):
+    """Направляет все записи через очередь в фоновый поток, который пишет в файл и на консоль.
+
+    Заменяет обработчики корневого логгера, в том числе настроенные
+    logging.basicConfig при импорте модулей. Возвращает запущенный QueueListener;
+    он останавливается (с записью оставшейся очереди) при выходе из процесса.
+    """
+    formatters = {'json': JsonFormatter(), 'text': TextFormatter(TEXT_FORMAT)}
+    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    file_handler.setFormatter(formatters[file_format])
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(formatters[console_format])
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(UpdateContextFilter())
+    if sampling:
+        queue_handler.addFilter(SamplingFilter(sampling))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    for name, module_level in (module_levels or {}).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    # При выходе дописываем все, что осталось в очереди
+    atexit.register(_stop_listener, listener)
+    return listener
+
+def _stop_listener(listener):
+    # QueueListener.stop нельзя вызывать повторно
+    if listener._thread is not None:
+        listener.stop()
@@ -0,0 +1,608 @@
+import logging
+import sqlite3
+import time
+from name_matching import NAME_KEY_TABLES, normalize_name
+from timeutil import legacy_to_epoch
+
+logger = logging.getLogger(__name__)
+
+# Таблицы деталей, между которыми хранится совместимость
+PART_TABLES = ('Punches', 'Inserts', 'Knives', 'Discs', 'Clamps', 'Disc_Parts', 'Pushers', 'Parts')
+
+# Старые записи хранили тип детали идентификатором из меню, а не именем таблицы
+LEGACY_CATEGORY_ALIASES = {
+    'cams': 'Clamps',
+    'discparts': 'Disc_Parts',
+    'stampparts': 'Parts',
+}
+
+# Сколько строк копируется одним executemany при перестройке и заполнении таблиц
+BATCH_SIZE = 5000
+
+class Migration:
+    def __init__(self, version, description, apply):
+        self.version = version
+        self.description = description
+        self.apply = apply
+
+# Шаги схемы по возрастанию версии; номер примененной версии хранится в PRAGMA user_version
+MIGRATIONS = []
+
+def migration(version, description):
+    def register(apply):
+        if MIGRATIONS and MIGRATIONS[-1].version >= version:
+            raise ValueError(f"Миграция {version} объявлена не по порядку")
+        MIGRATIONS.append(Migration(version, description, apply))
+        return apply
+    return register
+
+def get_columns(cursor, table_name):
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    return [row[1] for row in cursor.fetchall()]
+
+def get_tables(cursor):
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    return {row[0] for row in cursor.fetchall()}
+
+def add_column(cursor, table_name, column, definition):
+    """ALTER TABLE ADD COLUMN, если колонки еще нет (базы, обновленные старыми скриптами)"""
+    if column in get_columns(cursor, table_name):
+        return False
+    cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column} {definition}")
+    return True
+
+def create_all_parts_view(cursor):
+    """Все детали всех категорий одним списком"""
+    existing_tables = get_tables(cursor)
+    selects = []
+    for table_name in PART_TABLES:
+        if table_name not in existing_tables:
+            continue
+        size = 'size' if 'size' in get_columns(cursor, table_name) else 'NULL'
+        selects.append(
+            f"SELECT '{table_name}' AS category, id, stamp_id, name, {size} AS size, "
+            f"quantity, description FROM {table_name}"
+        )
+    cursor.execute("DROP VIEW IF EXISTS All_Parts")
+    cursor.execute(f"CREATE VIEW All_Parts AS {' UNION ALL '.join(selects)}")
+
+def insert_in_batches(cursor, sql, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        cursor.executemany(sql, rows[start:start + BATCH_SIZE])
+
+# --- Шаги ---
+
+@migration(1, "Таблицы штампов и деталей")
+def _base_tables(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS Stamps (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        size REAL NOT NULL,
+        description TEXT,
+        createdAt TEXT DEFAULT (STRFTIME('%Y-%m-%d %H:%M:%S')),
+        updatedAt TEXT DEFAULT (STRFTIME('%Y-%m-%d %H:%M:%S'))
+    )
+    ''')
+    # Колонки, которые есть не во всех категориях деталей
+    extra_columns = {
+        'Punches': 'type TEXT, size TEXT, image_url TEXT,',
+        'Inserts': 'type TEXT, size TEXT,',
+        'Knives': 'size TEXT,',
+        'Pushers': 'size TEXT,',
+    }
+    for table_name in PART_TABLES:
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            stamp_id INTEGER NOT NULL,
+            name TEXT NOT NULL DEFAULT '',
+            {extra_columns.get(table_name, '')}
+            quantity INTEGER NOT NULL DEFAULT 0,
+            description TEXT,
+            createdAt TEXT DEFAULT (STRFTIME('%Y-%m-%d %H:%M:%S')),
+            updatedAt TEXT DEFAULT (STRFTIME('%Y-%m-%d %H:%M:%S')),
+            last_modified TIMESTAMP,
+            FOREIGN KEY (stamp_id) REFERENCES Stamps(id)
+        )
+        ''')
+
+@migration(2, "Отметки времени createdAt/updatedAt/last_modified во всех таблицах деталей")
+def _part_timestamps(cursor):
+    # Заменяет add_last_modified.py и update_timestamps.py: отметки хранятся как есть (UTC),
+    # без повторного сдвига на +3 часа при каждом запуске. Пустые last_modified не заполняются:
+    # старые значения колонки записаны в местном времени, и миграция 6 переводит их со сдвигом,
+    # а пропуски заполняет уже переведенными createdAt/updatedAt
+    for table_name in PART_TABLES:
+        for column in ('createdAt', 'updatedAt', 'last_modified'):
+            add_column(cursor, table_name, column, 'TIMESTAMP')
+        cursor.execute(f'''
+            UPDATE {table_name}
+            SET createdAt = COALESCE(createdAt, CURRENT_TIMESTAMP),
+                updatedAt = COALESCE(updatedAt, createdAt, CURRENT_TIMESTAMP)
+            WHERE createdAt IS NULL OR updatedAt IS NULL
+        ''')
+
+@migration(3, "Чертежи: версии, хэши содержимого, проверка целостности и миниатюры")
+def _drawings(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS Drawings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        stamp_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        file_type TEXT NOT NULL,
+        file_path TEXT NOT NULL,
+        description TEXT,
+        version TEXT,
+        content_hash TEXT,
+        file_size INTEGER,
+        is_latest INTEGER NOT NULL DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (stamp_id) REFERENCES Stamps(id)
+    )
+    ''')
+    add_column(cursor, 'Drawings', 'content_hash', 'TEXT')
+    add_column(cursor, 'Drawings', 'file_size', 'INTEGER')
+
+    # Признак последней версии в цепочке (штамп, название)
+    if add_column(cursor, 'Drawings', 'is_latest', 'INTEGER NOT NULL DEFAULT 1'):
+        # Нумеруем ранее загруженные версии по порядку загрузки
+        cursor.execute('''
+            UPDATE Drawings
+            SET version = (
+                SELECT COUNT(*) FROM Drawings d2
+                WHERE d2.stamp_id = Drawings.stamp_id AND d2.name = Drawings.name AND d2.id <= Drawings.id
+            )
+            WHERE version IS NULL
+        ''')
+        cursor.execute('''
+            UPDATE Drawings
+            SET is_latest = (
+                id = (SELECT MAX(d2.id) FROM Drawings d2
+                      WHERE d2.stamp_id = Drawings.stamp_id AND d2.name = Drawings.name)
+            )
+        ''')
+
+    # Указатель на последнюю версию и цепочка версий
+    cursor.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_drawings_latest
+    ON Drawings(stamp_id, name) WHERE is_latest = 1
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_drawings_chain
+    ON Drawings(stamp_id, name)
+    ''')
+    # Поиск записи по пути файла при сверке каталога drawings/
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_drawings_file_path
+    ON Drawings(file_path)
+    ''')
+
+    # Результаты проверки целостности файлов чертежей
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS Drawing_Scrub_Results (
+        drawing_id INTEGER PRIMARY KEY,
+        file_path TEXT NOT NULL,
+        status TEXT NOT NULL,
+        details TEXT,
+        checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS Drawing_Orphan_Files (
+        file_path TEXT PRIMARY KEY,
+        file_size INTEGER,
+        found_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    # Позиция проверки, чтобы после перезапуска продолжить с того же места
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS Drawing_Scrub_State (
+        name TEXT PRIMARY KEY,
+        value TEXT
+    )
+    ''')
+    # Кэш миниатюр: одна запись на версию содержимого чертежа
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS Drawing_Thumbnails (
+        content_hash TEXT PRIMARY KEY,
+        thumbnail_path TEXT,
+        telegram_file_id TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+def resolve_category(part_type):
+    """Возвращает (таблица, имя детали) по тексту part_type вида 'Punches - Пуансон 1'"""
+    category, _, part_name = (part_type or '').partition(' - ')
+    category = category.strip()
+    for table_name in PART_TABLES:
+        if category.lower() == table_name.lower():
+            return table_name, part_name.strip() or None
+    return LEGACY_CATEGORY_ALIASES.get(category.lower()), part_name.strip() or None
+
+def _resolve_legacy_part(cursor, category, part_name, source_id, target_id):
+    """Ищет деталь по имени, сначала на исходном штампе связи"""
+    cursor.execute(f"""
+        SELECT id FROM {category}
+        WHERE name = ? AND stamp_id IN (?, ?)
+        ORDER BY stamp_id = ? DESC, id
+        LIMIT 1
+    """, (part_name, source_id, target_id, source_id))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def _convert_legacy_rows(cursor):
+    """Сворачивает пары зеркальных записей source/target в одну строку на связь"""
+    cursor.execute("""
+        SELECT source_stamp_id, target_stamp_id, part_type, part_id, notes, createdAt, updatedAt
+        FROM Parts_Compatibility
+        WHERE source_stamp_id IS NOT NULL AND target_stamp_id IS NOT NULL
+          AND source_stamp_id != target_stamp_id
+        ORDER BY id
+    """)
+    rows = cursor.fetchall()
+
+    # Зеркальные записи одной связи ищем на штампе из первой, исходной записи,
+    # иначе одноименные детали двух штампов дадут две разные связи
+    origins = {}
+    for source_id, target_id, part_type, *_ in rows:
+        origins.setdefault((frozenset((source_id, target_id)), part_type), source_id)
+
+    links = {}
+    for source_id, target_id, part_type, part_id, notes, created_at, updated_at in rows:
+        category, part_name = resolve_category(part_type)
+        if category is None:
+            category = part_type
+        elif part_id is None and part_name:
+            origin_id = origins[(frozenset((source_id, target_id)), part_type)]
+            other_id = target_id if origin_id == source_id else source_id
+            part_id = _resolve_legacy_part(cursor, category, part_name, origin_id, other_id)
+            if part_id is None:
+                # Деталь удалена или переименована - сохраняем имя в заметках, чтобы не потерять
+                notes = f"{part_name}: {notes}" if notes else part_name
+
+        stamp_a_id, stamp_b_id = sorted((source_id, target_id))
+        key = (stamp_a_id, stamp_b_id, category, part_id)
+        if key not in links:
+            links[key] = [notes, created_at, updated_at]
+        elif notes and notes != links[key][0]:
+            # Заметки могли редактироваться у любой из зеркальных записей
+            links[key][0] = f"{links[key][0]}; {notes}" if links[key][0] else notes
+    return [key + tuple(values) for key, values in links.items()]
+
+@migration(4, "Совместимость: одна строка на пару штампов и деталь, триггеры и представление All_Parts")
+def _compatibility(cursor):
+    columns = get_columns(cursor, 'Parts_Compatibility')
+    if 'stamp_a_id' not in columns:
+        rows = _convert_legacy_rows(cursor) if columns else []
+
+        # part_id ссылается на таблицу из category, целостность поддерживают триггеры ниже
+        cursor.execute('''
+        CREATE TABLE Parts_Compatibility_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category TEXT NOT NULL,
+            part_id INTEGER,
+            stamp_a_id INTEGER NOT NULL,
+            stamp_b_id INTEGER NOT NULL,
+            notes TEXT,
+            createdAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            CHECK (stamp_a_id < stamp_b_id),
+            UNIQUE (stamp_a_id, stamp_b_id, category, part_id),
+            FOREIGN KEY (stamp_a_id) REFERENCES Stamps(id) ON DELETE CASCADE,
+            FOREIGN KEY (stamp_b_id) REFERENCES Stamps(id) ON DELETE CASCADE
+        )
+        ''')
+        insert_in_batches(cursor, '''
+            INSERT INTO Parts_Compatibility_new
+            (stamp_a_id, stamp_b_id, category, part_id, notes, createdAt, updatedAt)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        if columns:
+            cursor.execute("DROP TABLE Parts_Compatibility")
+        cursor.execute("ALTER TABLE Parts_Compatibility_new RENAME TO Parts_Compatibility")
+        logger.info(f"Таблица Parts_Compatibility переведена на новую схему, связей: {len(rows)}")
+
+    # Связи штампа с любой стороны пары: UNIQUE покрывает stamp_a_id, этот индекс - stamp_b_id
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_compat_stamp_b
+    ON Parts_Compatibility(stamp_b_id, stamp_a_id, category, part_id)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_compat_part
+    ON Parts_Compatibility(category, part_id)
+    ''')
+
+    existing_tables = get_tables(cursor)
+    part_tables = [table_name for table_name in PART_TABLES if table_name in existing_tables]
+
+    # Удаление детали или штампа удаляет ее связи совместимости
+    for table_name in part_tables:
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table_name.lower()}_compat_delete
+        AFTER DELETE ON {table_name}
+        BEGIN
+            DELETE FROM Parts_Compatibility WHERE category = '{table_name}' AND part_id = OLD.id;
+        END
+        ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_stamps_compat_delete
+    AFTER DELETE ON Stamps
+    BEGIN
+        DELETE FROM Parts_Compatibility WHERE stamp_a_id = OLD.id OR stamp_b_id = OLD.id;
+    END
+    ''')
+
+    create_all_parts_view(cursor)
+
+def refresh_name_keys(cursor):
+    """Пересчитывает name_key по текущим правилам normalize_name"""
+    existing_tables = get_tables(cursor)
+    for table_name in NAME_KEY_TABLES:
+        if table_name not in existing_tables:
+            continue
+        cursor.execute(f"SELECT id, name, name_key FROM {table_name}")
+        changes = [
+            (normalize_name(name), item_id)
+            for item_id, name, name_key in cursor.fetchall()
+            if normalize_name(name) != name_key
+        ]
+        insert_in_batches(cursor, f"UPDATE {table_name} SET name_key = ? WHERE id = ?", changes)
+
+@migration(5, "Ключи имен деталей name_key с индексом (штамп, ключ)")
+def _name_keys(cursor):
+    # Бот записывает name_key при каждом изменении имени; если правила
+    # normalize_name изменятся, ключи пересчитает новая миграция
+    existing_tables = get_tables(cursor)
+    for table_name in NAME_KEY_TABLES:
+        if table_name not in existing_tables:
+            continue
+        add_column(cursor, table_name, 'name_key', 'TEXT')
+        cursor.execute(f'''
+        CREATE INDEX IF NOT EXISTS idx_{table_name.lower()}_name_key
+        ON {table_name}(stamp_id, name_key)
+        ''')
+    refresh_name_keys(cursor)
+
+# Отметки времени деталей: (колонка, сдвиг старых текстовых значений от UTC в часах).
+# createdAt/updatedAt заполнялись CURRENT_TIMESTAMP (UTC), last_modified бот писал
+# как datetime('now', '+3 hours')
+PART_TIMESTAMP_COLUMNS = (('createdAt', 0), ('updatedAt', 0), ('last_modified', 3))
+EPOCH_DEFAULT = "(CAST(STRFTIME('%s', 'now') AS INTEGER))"
+
+def _column_definition(column):
+    _, name, column_type, not_null, default, primary_key = column
+    if primary_key:
+        return f"{name} INTEGER PRIMARY KEY AUTOINCREMENT"
+    definition = f"{name} {column_type}".rstrip()
+    if not_null:
+        definition += " NOT NULL"
+    if default is not None:
+        definition += f" DEFAULT {default}"
+    return definition
+
+@migration(6, "Отметки времени деталей в секундах UTC (INTEGER) вместо текста со сдвигом +3 часа")
+def _epoch_timestamps(cursor):
+    timestamp_shifts = dict(PART_TIMESTAMP_COLUMNS)
+    existing_tables = get_tables(cursor)
+    # Представление ссылается на перестраиваемые таблицы - пересоздаем его в конце
+    cursor.execute("DROP VIEW IF EXISTS All_Parts")
+
+    for table_name in PART_TABLES:
+        if table_name not in existing_tables:
+            continue
+        cursor.execute(f"PRAGMA table_info({table_name})")
+        columns = cursor.fetchall()
+        names = [column[1] for column in columns]
+
+        # Тип колонки TEXT превратил бы числа обратно в строки, поэтому таблица
+        # перестраивается с колонками INTEGER
+        definitions = []
+        for column in columns:
+            if column[1] in timestamp_shifts:
+                default = f" DEFAULT {EPOCH_DEFAULT}" if column[1] != 'last_modified' else ''
+                definitions.append(f"{column[1]} INTEGER{default}")
+            else:
+                definitions.append(_column_definition(column))
+        definitions.append("FOREIGN KEY (stamp_id) REFERENCES Stamps(id)")
+
+        cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+            (table_name,)
+        )
+        dependents = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table_name,))
+        sequence = cursor.fetchone()
+
+        cursor.execute(f"CREATE TABLE {table_name}_new ({', '.join(definitions)})")
+        insert_sql = (
+            f"INSERT INTO {table_name}_new ({', '.join(names)}) "
+            f"VALUES ({', '.join('?' for _ in names)})"
+        )
+        positions = [(index, timestamp_shifts[name]) for index, name in enumerate(names) if name in timestamp_shifts]
+        reader = cursor.connection.execute(f"SELECT {', '.join(names)} FROM {table_name}")
+        while True:
+            rows = reader.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            converted = []
+            for row in rows:
+                row = list(row)
+                for index, shift_hours in positions:
+                    row[index] = legacy_to_epoch(row[index], shift_hours)
+                converted.append(row)
+            cursor.executemany(insert_sql, converted)
+
+        cursor.execute(f"DROP TABLE {table_name}")
+        cursor.execute(f"ALTER TABLE {table_name}_new RENAME TO {table_name}")
+        cursor.execute(f"UPDATE {table_name} SET last_modified = COALESCE(updatedAt, createdAt) WHERE last_modified IS NULL")
+        for sql in dependents:
+            cursor.execute(sql)
+        if sequence:
+            # Номера удаленных строк не выдаются повторно
+            cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (sequence[0], table_name))
+
+    create_all_parts_view(cursor)
+
+@migration(7, "Журнал изменений остатков Quantity_Ledger и подписки на ежедневную сводку")
+def _quantity_ledger(cursor):
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS Quantity_Ledger (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        category TEXT NOT NULL,
+        part_id INTEGER NOT NULL,
+        stamp_id INTEGER NOT NULL,
+        name TEXT,
+        quantity_before INTEGER,
+        quantity_after INTEGER,
+        changed_at INTEGER NOT NULL DEFAULT {EPOCH_DEFAULT}
+    )
+    ''')
+    # Сводка читает только записи за свое окно времени
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_ledger_changed_at
+    ON Quantity_Ledger(changed_at)
+    ''')
+
+    # Журнал ведут триггеры: в него попадают изменения из любого места кода.
+    # Новая деталь - quantity_before NULL, удаленная - quantity_after NULL
+    existing_tables = get_tables(cursor)
+    for table_name in PART_TABLES:
+        if table_name not in existing_tables:
+            continue
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table_name.lower()}_ledger_insert
+        AFTER INSERT ON {table_name}
+        BEGIN
+            INSERT INTO Quantity_Ledger (category, part_id, stamp_id, name, quantity_before, quantity_after)
+            VALUES ('{table_name}', NEW.id, NEW.stamp_id, NEW.name, NULL, NEW.quantity);
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table_name.lower()}_ledger_update
+        AFTER UPDATE OF quantity ON {table_name}
+        WHEN NEW.quantity IS NOT OLD.quantity
+        BEGIN
+            INSERT INTO Quantity_Ledger (category, part_id, stamp_id, name, quantity_before, quantity_after)
+            VALUES ('{table_name}', NEW.id, NEW.stamp_id, NEW.name, OLD.quantity, NEW.quantity);
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table_name.lower()}_ledger_delete
+        AFTER DELETE ON {table_name}
+        BEGIN
+            INSERT INTO Quantity_Ledger (category, part_id, stamp_id, name, quantity_before, quantity_after)
+            VALUES ('{table_name}', OLD.id, OLD.stamp_id, OLD.name, OLD.quantity, NULL);
+        END
+        ''')
+
+    cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS Digest_Subscriptions (
+        chat_id INTEGER PRIMARY KEY,
+        created_at INTEGER NOT NULL DEFAULT {EPOCH_DEFAULT}
+    )
+    ''')
+
+@migration(8, "Повторный рендер миниатюр, не построенных из-за сбоя")
+def _retry_failed_thumbnails(cursor):
+    # Раньше любой сбой (нет Pillow/PyMuPDF, упал процесс) записывался как окончательный
+    # отказ; такие записи удаляются, и миниатюра строится заново при следующем просмотре
+    cursor.execute("DELETE FROM Drawing_Thumbnails WHERE thumbnail_path IS NULL AND telegram_file_id IS NULL")
+
+@migration(9, "Пересчет name_key: строчные латинские b, h, m, t совпадают с заглавными")
+def _name_keys_casefold(cursor):
+    refresh_name_keys(cursor)
+
+@migration(10, "Отметки last_modified, заполненные миграцией 2, без лишнего сдвига на 3 часа")
+def _backfilled_last_modified(cursor):
+    # Раньше миграция 2 заполняла пустые last_modified значением updatedAt (UTC), а миграция 6
+    # сдвигала их как местное время: такие строки отстают от updatedAt ровно на сдвиг,
+    # у остальных строк такое совпадение до секунды практически исключено
+    shift_seconds = dict(PART_TIMESTAMP_COLUMNS)['last_modified'] * 3600
+    existing_tables = get_tables(cursor)
+    for table_name in PART_TABLES:
+        if table_name not in existing_tables:
+            continue
+        cursor.execute(
+            f"UPDATE {table_name} SET last_modified = updatedAt WHERE last_modified = updatedAt - ?",
+            (shift_seconds,)
+        )
+        if cursor.rowcount:
+            logger.info(f"{table_name}: исправлено отметок last_modified: {cursor.rowcount}")
+
+@migration(11, "Таблицы сохраненного состояния бота Bot_User_Data и Bot_Conversations")
+def _bot_state(cursor):
+    # Раньше таблицы создавал SQLitePersistence при каждом подключении
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS Bot_User_Data (
+        user_id INTEGER PRIMARY KEY,
+        data BLOB NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS Bot_Conversations (
+        name TEXT NOT NULL,
+        conversation_key TEXT NOT NULL,
+        state BLOB NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (name, conversation_key)
+    )
+    ''')
+    # Устаревшие записи удаляются периодически по updated_at
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bot_user_data_updated_at ON Bot_User_Data(updated_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bot_conversations_updated_at ON Bot_Conversations(updated_at)")
+
+# --- Запуск ---
+
+def get_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(path='inventory.db'):
+    """Применяет недостающие шаги схемы; каждый шаг - одна транзакция вместе с новой версией.
+
+    Возвращает список (версия, секунды) примененных шагов.
+    """
+    # Транзакциями управляем сами: BEGIN ... COMMIT вокруг каждого шага
+    conn = sqlite3.connect(path, isolation_level=None)
+    applied = []
+    try:
+        current = get_version(conn)
+        pending = [step for step in MIGRATIONS if step.version > current]
+        if not pending:
+            logger.info(f"Схема базы актуальна (версия {current})")
+            return applied
+
+        total_started = time.perf_counter()
+        for step in pending:
+            started = time.perf_counter()
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                step.apply(cursor)
+                # user_version меняется в той же транзакции: шаг применяется целиком или никак
+                cursor.execute(f"PRAGMA user_version = {step.version}")
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            elapsed = time.perf_counter() - started
+            applied.append((step.version, elapsed))
+            logger.info(f"Миграция {step.version} «{step.description}» применена за {elapsed * 1000:.0f} мс")
+
+        logger.info(
+            f"Схема обновлена с версии {current} до {pending[-1].version} "
+            f"за {(time.perf_counter() - total_started) * 1000:.0f} мс"
+        )
+        return applied
+    except Exception as e:
+        logger.error(f"Ошибка миграции схемы базы данных: {e}")
+        raise
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    migrate()
@@ -0,0 +1,124 @@
+import logging
+import unicodedata
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Таблицы деталей, в которых хранится нормализованный ключ имени
+NAME_KEY_TABLES = ('Punches', 'Inserts', 'Knives', 'Discs', 'Clamps', 'Disc_Parts', 'Pushers', 'Parts')
+
+# Латинские буквы, похожие на кириллические (в заглавном начертании), приводятся
+# к кириллице. Таблица строчная и применяется после casefold, чтобы 'B1' и 'b1'
+# давали один ключ
+HOMOGLYPHS = str.maketrans({
+    'a': 'а', 'b': 'в', 'c': 'с', 'e': 'е', 'h': 'н', 'k': 'к', 'm': 'м',
+    'o': 'о', 'p': 'р', 't': 'т', 'x': 'х', 'y': 'у',
+    'ё': 'е',
+})
+
+def normalize_name(text):
+    """Ключ для сравнения имен: без различий регистра, похожих букв и лишних пробелов"""
+    text = unicodedata.normalize('NFKC', text or '')
+    return ' '.join(text.casefold().translate(HOMOGLYPHS).split())
+
+def _trigrams(key, padded=True):
+    # Ключи дополняются пробелами, чтобы начало и конец слова тоже давали триграммы.
+    # Запрос на вхождение - нет: он может быть серединой имени
+    if padded:
+        key = f" {key} "
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+def edit_distance(a, b, limit):
+    """Расстояние Левенштейна или limit + 1, если оно больше limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+def default_max_distance(key):
+    """Допустимое число опечаток: одна в коротком имени, две в длинном"""
+    return 1 if len(key) <= 6 else 2
+
+class NameMatcher:
+    """Нечеткий поиск по нормализованным именам с отсечением кандидатов по триграммам.
+
+    Каждая правка меняет не больше трех триграмм, поэтому имя на расстоянии d
+    от запроса разделяет с ним хотя бы len(триграммы запроса) - 3d триграмм.
+    Расстояние Левенштейна считается только для прошедших этот порог.
+    """
+
+    def __init__(self, items=()):
+        self._keys = {}
+        self._postings = defaultdict(set)
+        for item_id, name in items:
+            self.add(item_id, name)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, item_id, name):
+        self.remove(item_id)
+        key = normalize_name(name)
+        self._keys[item_id] = key
+        for trigram in _trigrams(key):
+            self._postings[trigram].add(item_id)
+        return key
+
+    def remove(self, item_id):
+        key = self._keys.pop(item_id, None)
+        if key is None:
+            return
+        for trigram in _trigrams(key):
+            postings = self._postings.get(trigram)
+            if postings:
+                postings.discard(item_id)
+                if not postings:
+                    del self._postings[trigram]
+
+    def get_key(self, item_id):
+        return self._keys.get(item_id)
+
+    def containing(self, text):
+        """id, в ключе которых есть text (не короче трех символов после нормализации)"""
+        query = normalize_name(text)
+        postings = sorted((self._postings.get(trigram, set()) for trigram in _trigrams(query, padded=False)), key=len)
+        if not postings:
+            return []
+        return [item_id for item_id in set.intersection(*postings) if query in self._keys[item_id]]
+
+    def similar(self, text, max_distance=None):
+        """Список (расстояние, id) имен не дальше max_distance от text, ближайшие первыми"""
+        query = normalize_name(text)
+        if not query:
+            return []
+        if max_distance is None:
+            max_distance = default_max_distance(query)
+
+        query_trigrams = _trigrams(query)
+        # Совсем короткие имена порог не отсекает - требуем хотя бы одну общую триграмму
+        min_shared = max(1, len(query_trigrams) - 3 * max_distance)
+        shared = defaultdict(int)
+        for trigram in query_trigrams:
+            for item_id in self._postings.get(trigram, ()):
+                shared[item_id] += 1
+
+        matches = []
+        for item_id, count in shared.items():
+            if count < min_shared:
+                continue
+            distance = edit_distance(query, self._keys[item_id], max_distance)
+            if distance <= max_distance:
+                matches.append((distance, item_id))
+        matches.sort()
+        return matches
@@ -14,7 +14,10 @@ import re
 import sqlite3
 from urllib.parse import urlparse
 import validators
-from constants import States
+from constants import MAX_QUANTITY, States
+from part_search import part_search_index
+from name_matching import NameMatcher, normalize_name
+from timeutil import now_epoch
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -152,7 +155,6 @@ MAX_SIZE_LENGTH = 50
 MAX_DESCRIPTION_LENGTH = 500
 MAX_TYPE_LENGTH = 50
 MAX_URL_LENGTH = 2000
-MAX_QUANTITY = 10000
 
 NAME_PATTERN = re.compile(r"^[A-Za-zА-Яа-я0-9\s\-_,\.]+$")
 
@@ -264,6 +266,38 @@ async def handle_new_item_input(update: Update, context: ContextTypes.DEFAULT_TY
         )
         return ConversationHandler.END
 
+    # Имена сравниваются по нормализованному ключу: "Пуансон A" и "пуaнсон  А" - одна позиция.
+    # Точный дубль ищется по индексу (stamp_id, name_key)
+    name_key = normalize_name(name)
+    try:
+        async with db.execute(
+            f"SELECT name FROM {category_table} WHERE stamp_id = ? AND name_key = ? LIMIT 1",
+            (stamp_id, name_key)
+        ) as cursor:
+            duplicate = await cursor.fetchone()
+    except Exception as e:
+        logger.exception("Ошибка при проверке дубликатов: %s", e)
+        duplicate = None
+
+    if duplicate:
+        await update.message.reply_text(
+            f"Ошибка: Позиция «{duplicate[0]}» уже есть на этом штампе.",
+            reply_markup=back_button
+        )
+        return States.ADD_ENTERING_DATA
+
+    # Похожие имена нужны только для подсказки после добавления
+    try:
+        async with db.execute(
+            f"SELECT id, name FROM {category_table} WHERE stamp_id = ?",
+            (stamp_id,)
+        ) as cursor:
+            existing_names = dict(await cursor.fetchall())
+    except Exception as e:
+        logger.exception("Ошибка при поиске похожих имен: %s", e)
+        existing_names = {}
+    similar_names = [existing_names[item_id] for _, item_id in NameMatcher(existing_names.items()).similar(name_key)]
+
     try:
         # Вставляем данные в базу
         if category == 'punches':
@@ -273,8 +307,8 @@ async def handle_new_item_input(update: Update, context: ContextTypes.DEFAULT_TY
             description = data[5].strip() if len(data) > 5 else ''
 
             await db.execute(
-                "INSERT INTO Punches (stamp_id, name, quantity, type, size, image_url, description, last_modified) VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now', '+3 hours'))",
-                (stamp_id, name, quantity, type_, size, image_url, description)
+                "INSERT INTO Punches (stamp_id, name, name_key, quantity, type, size, image_url, description, last_modified) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (stamp_id, name, name_key, quantity, type_, size, image_url, description, now_epoch())
             )
             await db.commit()
             category_name = 'Пуансон'
@@ -284,8 +318,8 @@ async def handle_new_item_input(update: Update, context: ContextTypes.DEFAULT_TY
             description = data[3].strip() if len(data) > 3 else ''
 
             await db.execute(
-                "INSERT INTO Inserts (stamp_id, name, quantity, size, description, last_modified) VALUES (?, ?, ?, ?, ?, datetime('now', '+3 hours'))",
-                (stamp_id, name, quantity, size, description)
+                "INSERT INTO Inserts (stamp_id, name, name_key, quantity, size, description, last_modified) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (stamp_id, name, name_key, quantity, size, description, now_epoch())
             )
             await db.commit()
             category_name = 'Вставка'
@@ -294,8 +328,8 @@ async def handle_new_item_input(update: Update, context: ContextTypes.DEFAULT_TY
             description = data[2].strip() if len(data) > 2 else ''
 
             await db.execute(
-                "INSERT INTO Parts (stamp_id, name, quantity, description, last_modified) VALUES (?, ?, ?, ?, datetime('now', '+3 hours'))",
-                (stamp_id, name, quantity, description)
+                "INSERT INTO Parts (stamp_id, name, name_key, quantity, description, last_modified) VALUES (?, ?, ?, ?, ?, ?)",
+                (stamp_id, name, name_key, quantity, description, now_epoch())
             )
             await db.commit()
             category_name = 'Запчасть'
@@ -305,8 +339,8 @@ async def handle_new_item_input(update: Update, context: ContextTypes.DEFAULT_TY
             description = data[3].strip() if len(data) > 3 else ''
 
             await db.execute(
-                "INSERT INTO Knives (stamp_id, name, quantity, size, description, last_modified) VALUES (?, ?, ?, ?, ?, datetime('now', '+3 hours'))",
-                (stamp_id, name, quantity, size, description)
+                "INSERT INTO Knives (stamp_id, name, name_key, quantity, size, description, last_modified) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (stamp_id, name, name_key, quantity, size, description, now_epoch())
             )
             await db.commit()
             category_name = 'Нож'
@@ -315,8 +349,8 @@ async def handle_new_item_input(update: Update, context: ContextTypes.DEFAULT_TY
             description = data[2].strip() if len(data) > 2 else ''
 
             await db.execute(
-                "INSERT INTO Clamps (stamp_id, name, quantity, description, last_modified) VALUES (?, ?, ?, ?, datetime('now', '+3 hours'))",
-                (stamp_id, name, quantity, description)
+                "INSERT INTO Clamps (stamp_id, name, name_key, quantity, description, last_modified) VALUES (?, ?, ?, ?, ?, ?)",
+                (stamp_id, name, name_key, quantity, description, now_epoch())
             )
             await db.commit()
             category_name = 'Кулачок'
@@ -325,8 +359,8 @@ async def handle_new_item_input(update: Update, context: ContextTypes.DEFAULT_TY
             description = data[2].strip() if len(data) > 2 else ''
 
             await db.execute(
-                "INSERT INTO Disc_Parts (stamp_id, name, quantity, description, last_modified) VALUES (?, ?, ?, ?, datetime('now', '+3 hours'))",
-                (stamp_id, name, quantity, description)
+                "INSERT INTO Disc_Parts (stamp_id, name, name_key, quantity, description, last_modified) VALUES (?, ?, ?, ?, ?, ?)",
+                (stamp_id, name, name_key, quantity, description, now_epoch())
             )
             await db.commit()
             category_name = 'Запчасть для дискового штампа'
@@ -336,8 +370,8 @@ async def handle_new_item_input(update: Update, context: ContextTypes.DEFAULT_TY
             description = data[3].strip() if len(data) > 3 else ''
 
             await db.execute(
-                "INSERT INTO Pushers (stamp_id, name, quantity, size, description, last_modified) VALUES (?, ?, ?, ?, ?, datetime('now', '+3 hours'))",
-                (stamp_id, name, quantity, size, description)
+                "INSERT INTO Pushers (stamp_id, name, name_key, quantity, size, description, last_modified) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (stamp_id, name, name_key, quantity, size, description, now_epoch())
             )
             await db.commit()
             category_name = 'Толкатель'
@@ -348,8 +382,14 @@ async def handle_new_item_input(update: Update, context: ContextTypes.DEFAULT_TY
             )
             return ConversationHandler.END
 
+        await part_search_index.refresh_stamp(category_table, stamp_id)
+
+        message = f"✅ Новый {category_name} успешно добавлен!"
+        if similar_names:
+            # Возможна опечатка в имени уже существующей позиции
+            message += "\n\nПохожие позиции на этом штампе: " + ", ".join(similar_names)
         await update.message.reply_text(
-            f"✅ Новый {category_name} успешно добавлен!",
+            message,
             reply_markup=back_to_menu_keyboard(current_menu)
         )
         return ConversationHandler.END
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from telegram import (
+    Update,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+)
+from telegram.ext import ContextTypes
+from database import get_connection
+from constants import MAX_QUANTITY
+from showballance import CATEGORY_EMOJI
+from substitutes import invalidate_substitutes
+from name_matching import NameMatcher, normalize_name
+from timeutil import now_epoch
+
+logger = logging.getLogger(__name__)
+
+MAX_RESULTS = 20
+# Больше любого символа: конец диапазона имен с заданным префиксом
+PREFIX_END = '\U0010ffff'
+# Результаты зависят от остатков, поэтому Telegram не должен кэшировать их надолго
+INLINE_CACHE_SECONDS = 5
+
+class PartSearchIndex:
+    """Индекс всех деталей всех штампов для поиска по мере ввода.
+
+    Короткие запросы (1-2 символа) ищутся по началу названия в отсортированном
+    списке, длинные - пересечением множеств триграмм с проверкой подстроки.
+    Если по подстроке ничего нет, запрос считается опечаткой и ищутся близкие названия.
+    """
+
+    def __init__(self):
+        # (category, id) -> запись детали
+        self._parts = {}
+        self._matcher = NameMatcher()
+        self._sorted_names = []
+
+    def load(self):
+        """Полностью перестраивает индекс из представления All_Parts"""
+        rows = self._fetch_parts()
+        self._parts = {}
+        self._matcher = NameMatcher()
+        for row in rows:
+            self._add(row)
+        self._sorted_names = sorted((part['key'], key) for key, part in self._parts.items())
+        logger.info(f"Индекс поиска деталей построен: {len(self._parts)} деталей")
+
+    @staticmethod
+    def _fetch_parts(where="", params=()):
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT p.category, p.id, p.name, p.stamp_id, s.name, p.quantity, p.size, p.description
+                FROM All_Parts p
+                JOIN Stamps s ON s.id = p.stamp_id
+                {where}
+            """, params)
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def _add(self, row):
+        category, part_id, name, stamp_id, stamp_name, quantity, size, description = row
+        key = (category, part_id)
+        part = {
+            'category': category,
+            'id': part_id,
+            'name': name,
+            'key': normalize_name(name),
+            'stamp_id': stamp_id,
+            'stamp_name': stamp_name,
+            'quantity': quantity or 0,
+            'size': size,
+            'description': description,
+        }
+        self._parts[key] = part
+        self._matcher.add(key, name)
+        return part
+
+    def _remove(self, key):
+        part = self._parts.pop(key, None)
+        if not part:
+            return
+        self._matcher.remove(key)
+        index = bisect_left(self._sorted_names, (part['key'], key))
+        if index < len(self._sorted_names) and self._sorted_names[index] == (part['key'], key):
+            del self._sorted_names[index]
+
+    def _insert(self, row):
+        part = self._add(row)
+        entry = (part['key'], (part['category'], part['id']))
+        self._sorted_names.insert(bisect_left(self._sorted_names, entry), entry)
+
+    async def refresh_part(self, category, part_id):
+        """Перечитывает одну деталь после изменения или удаления"""
+        rows = await asyncio.to_thread(self._fetch_parts, "WHERE p.category = ? AND p.id = ?", (category, part_id))
+        self._remove((category, part_id))
+        for row in rows:
+            self._insert(row)
+
+    async def refresh_stamp(self, category, stamp_id):
+        """Перечитывает детали категории на штампе (после добавления или изменения по имени)"""
+        # Чтение - в отдельном потоке, сам индекс меняется только в цикле событий
+        rows = await asyncio.to_thread(self._fetch_parts, "WHERE p.category = ? AND p.stamp_id = ?", (category, stamp_id))
+        for key in [key for key, part in self._parts.items()
+                    if part['category'] == category and part['stamp_id'] == stamp_id]:
+            self._remove(key)
+        for row in rows:
+            self._insert(row)
+
+    def get(self, category, part_id):
+        return self._parts.get((category, part_id))
+
+    def search(self, text, limit=MAX_RESULTS):
+        """Детали, в названии которых есть text; сначала совпадения с начала названия"""
+        query = normalize_name(text)
+        if not query:
+            return []
+
+        if len(query) < 3:
+            start = bisect_left(self._sorted_names, (query,))
+            end = bisect_left(self._sorted_names, (query + PREFIX_END,))
+            keys = [key for _, key in self._sorted_names[start:end]]
+        else:
+            keys = self._matcher.containing(query)
+            if not keys:
+                return [self._parts[key] for _, key in self._matcher.similar(query)[:limit]]
+
+        parts = [self._parts[key] for key in keys]
+        parts.sort(key=lambda part: (not part['key'].startswith(query), -part['quantity'], part['key']))
+        return parts[:limit]
+
+part_search_index = PartSearchIndex()
+
+def format_part_card(part):
+    """Текст карточки детали для результата поиска"""
+    emoji = CATEGORY_EMOJI.get(part['category'], '📦')
+    text = f"{emoji} {part['name']}\nШтамп: {part['stamp_name']}\nОстаток: {part['quantity']}"
+    if part['size']:
+        text += f"\nРазмер: {part['size']}"
+    if part['description']:
+        text += f"\nОписание: {part['description']}"
+    return text
+
+def get_part_actions_keyboard(part):
+    """Быстрые действия с деталью прямо из карточки"""
+    suffix = f"{part['category']}_{part['id']}"
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("➖1", callback_data=f"part_qty_{suffix}_-1"),
+            InlineKeyboardButton("➕1", callback_data=f"part_qty_{suffix}_+1"),
+        ],
+        [InlineKeyboardButton("🔁 Найти замену", callback_data=f"find_substitute_{suffix}")],
+    ])
+
+async def inline_part_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Поиск деталей по всем штампам в inline-режиме (@бот запрос)"""
+    inline_query = update.inline_query
+    started = time.perf_counter()
+    parts = part_search_index.search(inline_query.query)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.debug(f"Inline-поиск «{inline_query.query}»: {len(parts)} за {elapsed_ms:.1f} мс")
+
+    results = [
+        InlineQueryResultArticle(
+            id=f"{part['category']}_{part['id']}",
+            title=f"{CATEGORY_EMOJI.get(part['category'], '📦')} {part['name']}",
+            description=f"{part['stamp_name']} · остаток {part['quantity']}",
+            input_message_content=InputTextMessageContent(format_part_card(part)),
+            reply_markup=get_part_actions_keyboard(part),
+        )
+        for part in parts
+    ]
+    await inline_query.answer(results, cache_time=INLINE_CACHE_SECONDS)
+
+async def adjust_part_quantity(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Кнопки ➖1/➕1 в карточке детали"""
+    query = update.callback_query
+    category, part_id, delta = query.data[len('part_qty_'):].rsplit('_', 2)
+    part_id, delta = int(part_id), int(delta)
+
+    if category not in CATEGORY_EMOJI:
+        await query.answer("Неизвестная категория.")
+        return
+
+    db = context.application.db
+    try:
+        await db.execute(
+            f"""
+            UPDATE {category}
+            SET quantity = MIN(MAX(quantity + ?, 0), ?),
+                last_modified = ?
+            WHERE id = ?
+            """,
+            (delta, MAX_QUANTITY, now_epoch(), part_id),
+        )
+        await db.commit()
+    except Exception as e:
+        logger.exception("Ошибка при изменении количества из карточки: %s", e)
+        await query.answer("Ошибка при обновлении данных.")
+        return
+
+    invalidate_substitutes()
+    await part_search_index.refresh_part(category, part_id)
+    part = part_search_index.get(category, part_id)
+    if not part:
+        await query.answer("Деталь не найдена.")
+        return
+
+    await query.answer(f"Остаток: {part['quantity']}")
+    # Карточка может быть отправлена через inline-режим - тогда у запроса нет message
+    await query.edit_message_text(format_part_card(part), reply_markup=get_part_actions_keyboard(part))
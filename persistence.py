@@ -0,0 +1,268 @@
+import asyncio
+import hashlib
+import json
+import logging
+import pickle
+import sqlite3
+import time
+import zlib
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'inventory.db'
+# Данные меньше этого размера не сжимаются: zlib на них только добавляет заголовок
+COMPRESS_MIN_BYTES = 512
+# Пауза перед записью, чтобы изменения одного цикла сохранения ушли одной транзакцией
+FLUSH_DELAY_SECONDS = 0.5
+
+def _dump(value):
+    data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(data) >= COMPRESS_MIN_BYTES:
+        return b'z' + zlib.compress(data)
+    return b'p' + data
+
+def _load(blob):
+    data = bytes(blob)
+    if data[:1] == b'z':
+        return pickle.loads(zlib.decompress(data[1:]))
+    return pickle.loads(data[1:])
+
+class SQLitePersistence(BasePersistence):
+    """Хранение состояний диалогов и user_data в SQLite с отложенной записью.
+
+    Приложение раз в update_interval секунд передает сюда данные тех
+    пользователей, от которых были обновления. Здесь они сериализуются и
+    сравниваются с уже записанными: неизменившиеся отбрасываются, остальные
+    копятся в буфере и пишутся одной транзакцией в отдельном потоке.
+    user_data и состояния диалогов, не менявшиеся дольше user_data_ttl_days,
+    удаляются при запуске и затем периодически (expire). Таблицы создает миграция.
+    """
+
+    def __init__(self, path=DB_PATH, update_interval=60, user_data_ttl_days=30):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = path
+        self.user_data_ttl = user_data_ttl_days * 24 * 60 * 60
+        # Хэши записанных данных: по ним отсекаются повторные записи без изменений
+        self._user_data_digests = {}
+        self._conversation_digests = {}
+        # Буфер отложенной записи: ключ -> сериализованные данные (None - удалить)
+        self._pending_user_data = {}
+        self._pending_conversations = {}
+        self._flush_task = None
+        self._write_lock = asyncio.Lock()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _delete_expired(self):
+        """Удаляет устаревшие записи; возвращает (id пользователей, [(имя диалога, ключ)])"""
+        cutoff = time.time() - self.user_data_ttl
+        conn = self._connect()
+        try:
+            with conn:
+                user_ids = [row[0] for row in conn.execute(
+                    "SELECT user_id FROM Bot_User_Data WHERE updated_at < ?", (cutoff,)
+                )]
+                conversations = [tuple(row) for row in conn.execute(
+                    "SELECT name, conversation_key FROM Bot_Conversations WHERE updated_at < ?", (cutoff,)
+                )]
+                conn.execute("DELETE FROM Bot_User_Data WHERE updated_at < ?", (cutoff,))
+                conn.execute("DELETE FROM Bot_Conversations WHERE updated_at < ?", (cutoff,))
+        finally:
+            conn.close()
+        if user_ids or conversations:
+            logger.info(f"Удалены устаревшие user_data: {len(user_ids)}, диалогов: {len(conversations)}")
+        return user_ids, conversations
+
+    def _read_user_data(self):
+        self._delete_expired()
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT user_id, data FROM Bot_User_Data").fetchall()
+        finally:
+            conn.close()
+
+    def _read_conversations(self, name):
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT conversation_key, state FROM Bot_Conversations WHERE name = ?",
+                (name,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+    def _write(self, user_data, conversations):
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    """
+                    INSERT INTO Bot_User_Data (user_id, data, updated_at) VALUES (?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+                    """,
+                    [(user_id, blob, now) for user_id, blob in user_data.items() if blob is not None]
+                )
+                conn.executemany(
+                    "DELETE FROM Bot_User_Data WHERE user_id = ?",
+                    [(user_id,) for user_id, blob in user_data.items() if blob is None]
+                )
+                conn.executemany(
+                    """
+                    INSERT INTO Bot_Conversations (name, conversation_key, state, updated_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(name, conversation_key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+                    """,
+                    [(name, key, blob, now) for (name, key), blob in conversations.items() if blob is not None]
+                )
+                conn.executemany(
+                    "DELETE FROM Bot_Conversations WHERE name = ? AND conversation_key = ?",
+                    [(name, key) for (name, key), blob in conversations.items() if blob is None]
+                )
+        finally:
+            conn.close()
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(FLUSH_DELAY_SECONDS)
+        await self._flush_pending()
+
+    async def _flush_pending(self):
+        async with self._write_lock:
+            user_data, self._pending_user_data = self._pending_user_data, {}
+            conversations, self._pending_conversations = self._pending_conversations, {}
+            if not user_data and not conversations:
+                return
+            try:
+                await asyncio.to_thread(self._write, user_data, conversations)
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении состояния бота: {e}")
+                # Не теряем изменения: следующая запись повторит их, если не придут более новые
+                for user_id, blob in user_data.items():
+                    self._pending_user_data.setdefault(user_id, blob)
+                for key, blob in conversations.items():
+                    self._pending_conversations.setdefault(key, blob)
+                return
+            logger.debug(f"Состояние бота сохранено: user_data {len(user_data)}, диалогов {len(conversations)}")
+
+    async def expire(self, run_blocking=asyncio.to_thread):
+        """Удаляет из базы данные, не менявшиеся дольше срока хранения.
+
+        Возвращает (id пользователей, [(имя диалога, ключ диалога)]), чтобы
+        приложение убрало их и из памяти. Сначала дописывается буфер: свежие
+        изменения не должны выглядеть устаревшими.
+        """
+        await self._flush_pending()
+        async with self._write_lock:
+            user_ids, conversations = await run_blocking(self._delete_expired)
+        # Изменения, пришедшие после сброса буфера, запишутся заново - такие данные не устарели
+        user_ids = [user_id for user_id in user_ids if user_id not in self._pending_user_data]
+        conversations = [key for key in conversations if key not in self._pending_conversations]
+        for user_id in user_ids:
+            self._user_data_digests.pop(user_id, None)
+        for key in conversations:
+            self._conversation_digests.pop(key, None)
+        return user_ids, [(name, tuple(json.loads(key))) for name, key in conversations]
+
+    async def get_user_data(self):
+        rows = await asyncio.to_thread(self._read_user_data)
+        user_data = {}
+        for user_id, blob in rows:
+            try:
+                user_data[user_id] = _load(blob)
+            except Exception as e:
+                logger.warning(f"Не удалось прочитать user_data пользователя {user_id}: {e}")
+                continue
+            self._user_data_digests[user_id] = hashlib.blake2b(bytes(blob), digest_size=16).digest()
+        logger.info(f"Загружены user_data пользователей: {len(user_data)}")
+        return user_data
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        conversations = {}
+        for key, blob in await asyncio.to_thread(self._read_conversations, name):
+            try:
+                conversations[tuple(json.loads(key))] = _load(blob)
+            except Exception as e:
+                logger.warning(f"Не удалось прочитать состояние диалога {name} {key}: {e}")
+                continue
+            self._conversation_digests[(name, key)] = hashlib.blake2b(bytes(blob), digest_size=16).digest()
+        logger.info(f"Загружены незавершенные диалоги {name}: {len(conversations)}")
+        return conversations
+
+    async def update_user_data(self, user_id, data):
+        if not data:
+            await self.drop_user_data(user_id)
+            return
+        try:
+            blob = _dump(data)
+        except Exception as e:
+            logger.warning(f"user_data пользователя {user_id} не сериализуется и не будет сохранен: {e}")
+            return
+        digest = hashlib.blake2b(blob, digest_size=16).digest()
+        if self._user_data_digests.get(user_id) == digest:
+            return
+        self._user_data_digests[user_id] = digest
+        self._pending_user_data[user_id] = blob
+        self._schedule_flush()
+
+    async def update_conversation(self, name, key, new_state):
+        conversation_key = json.dumps(list(key))
+        # Завершенный диалог (None) удаляется, а не хранится
+        blob = _dump(new_state) if new_state is not None else None
+        digest = hashlib.blake2b(blob, digest_size=16).digest() if blob is not None else None
+        if self._conversation_digests.get((name, conversation_key)) == digest:
+            return
+        self._conversation_digests[(name, conversation_key)] = digest
+        self._pending_conversations[(name, conversation_key)] = blob
+        self._schedule_flush()
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def drop_user_data(self, user_id):
+        if user_id not in self._user_data_digests and user_id not in self._pending_user_data:
+            return
+        self._user_data_digests.pop(user_id, None)
+        self._pending_user_data[user_id] = None
+        self._schedule_flush()
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        """Вызывается приложением при остановке: дописывает буфер"""
+        if self._flush_task and not self._flush_task.done():
+            await self._flush_task
+        await self._flush_pending()
+        logger.info("Состояние бота сохранено перед остановкой.")
@@ -0,0 +1,218 @@
+import logging
+from bisect import bisect_left
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+from database import get_connection
+from name_matching import normalize_name
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 8
+# Больше любого символа: конец диапазона имен с заданным префиксом
+PREFIX_END = '\U0010ffff'
+
+PICKER_STAMPS = 'stamps'
+PICKER_PARTS = 'parts'
+
+class Catalog:
+    """Список (id, name, label), отсортированный по нормализованному имени.
+
+    Отсортированные ключи служат индексом по префиксу: имена с заданным
+    началом занимают непрерывный диапазон, который находится двоичным поиском.
+    Страницы строятся по ключу (после/до id), а не по смещению.
+    """
+
+    def __init__(self, items):
+        self.items = sorted(items, key=lambda item: (normalize_name(item[1]), item[0]))
+        self.keys = [(normalize_name(name), item_id) for item_id, name, _ in self.items]
+        self.positions = {item[0]: index for index, item in enumerate(self.items)}
+
+    def __len__(self):
+        return len(self.items)
+
+    def prefix_range(self, prefix):
+        prefix = normalize_name(prefix)
+        if not prefix:
+            return 0, len(self.items)
+        return bisect_left(self.keys, (prefix,)), bisect_left(self.keys, (prefix + PREFIX_END,))
+
+    def page(self, prefix='', after_id=None, before_id=None, exclude=(), size=PAGE_SIZE):
+        """Возвращает (элементы страницы, есть ли предыдущая, есть ли следующая)"""
+        start, end = self.prefix_range(prefix)
+        visible = lambda index: self.items[index][0] not in exclude
+
+        page = []
+        if before_id in self.positions:
+            index = min(self.positions[before_id], end) - 1
+            while index >= start and len(page) < size:
+                if visible(index):
+                    page.append(index)
+                index -= 1
+            page.reverse()
+        else:
+            index = self.positions[after_id] + 1 if after_id in self.positions else start
+            index = max(index, start)
+            while index < end and len(page) < size:
+                if visible(index):
+                    page.append(index)
+                index += 1
+
+        if not page:
+            return [], False, False
+        has_prev = any(visible(index) for index in range(start, page[0]))
+        has_next = any(visible(index) for index in range(page[-1] + 1, end))
+        return [self.items[index] for index in page], has_prev, has_next
+
+    def count(self, prefix='', exclude=()):
+        start, end = self.prefix_range(prefix)
+        return sum(1 for item in self.items[start:end] if item[0] not in exclude)
+
+_stamp_catalog = None
+
+def get_stamp_catalog():
+    """Каталог штампов, загружается один раз за запуск бота.
+    Бот не меняет таблицу Stamps: она заполняется вручную (init_stamps.sql),
+    поэтому после ее изменения бота нужно перезапустить"""
+    global _stamp_catalog
+    if _stamp_catalog is None:
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, name FROM Stamps")
+            _stamp_catalog = Catalog([(stamp_id, name, name) for stamp_id, name in cursor.fetchall()])
+        finally:
+            conn.close()
+        logger.info(f"Загружен каталог штампов: {len(_stamp_catalog)}")
+    return _stamp_catalog
+
+def get_part_catalog(table_name, stamp_id):
+    """Каталог деталей одной категории одного штампа"""
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"PRAGMA table_info({table_name})")
+        columns = [row[1] for row in cursor.fetchall()]
+        size = 'size' if 'size' in columns else 'NULL'
+        cursor.execute(
+            f"SELECT id, name, {size}, description FROM {table_name} WHERE stamp_id = ?",
+            (stamp_id,)
+        )
+        items = []
+        for part_id, name, part_size, description in cursor.fetchall():
+            label = name
+            if part_size:
+                label += f" ({part_size})"
+            if description:
+                label += f" - {description}"
+            items.append((part_id, name, label))
+    finally:
+        conn.close()
+    return Catalog(items)
+
+def _get_catalog(picker):
+    if picker['source'] == PICKER_STAMPS:
+        return get_stamp_catalog()
+    _, table_name, stamp_id = picker['source']
+    return get_part_catalog(table_name, stamp_id)
+
+def _render_picker(picker, after_id=None, before_id=None):
+    """Текст и клавиатура текущей страницы выбора"""
+    catalog = _get_catalog(picker)
+    exclude = set(picker['exclude'])
+    items, has_prev, has_next = catalog.page(picker['filter'], after_id, before_id, exclude)
+
+    keyboard = [
+        [InlineKeyboardButton(label, callback_data=f"{picker['item_prefix']}{item_id}")]
+        for item_id, _, label in items
+    ]
+
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton("◀️", callback_data=f"picker_prev_{items[0][0]}"))
+    if has_next:
+        navigation.append(InlineKeyboardButton("▶️", callback_data=f"picker_next_{items[-1][0]}"))
+    if navigation:
+        keyboard.append(navigation)
+
+    text = picker['text']
+    if picker['filter']:
+        keyboard.append([InlineKeyboardButton(
+            f"✖️ Сбросить фильтр «{picker['filter']}»", callback_data="picker_clear"
+        )])
+        found = catalog.count(picker['filter'], exclude)
+        text += f"\n\nНайдено по «{picker['filter']}»: {found}" if found else f"\n\nПо «{picker['filter']}» ничего не найдено."
+    elif has_prev or has_next:
+        text += "\n\nНапишите начало названия, чтобы отфильтровать список."
+
+    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data=picker['back'])])
+    return text, InlineKeyboardMarkup(keyboard)
+
+def _get_picker(context, flow):
+    pickers = context.user_data.get('picker') or {}
+    # Старый формат - один выбор на все диалоги: неизвестно, какому диалогу он принадлежит
+    if 'state' in pickers:
+        return None
+    return pickers.get(flow)
+
+async def open_picker(query, context, state, text, item_prefix, back_callback,
+                      source=PICKER_STAMPS, exclude=(), *, flow):
+    """Показывает первую страницу выбора штампа или детали.
+
+    Выбранный элемент приходит как callback_data = item_prefix + id. Выбор хранится
+    в user_data['picker'][flow] отдельно для каждого диалога (flow - имя диалога),
+    чтобы брошенный в одном диалоге список не продолжился в другом.
+    """
+    picker = {
+        'state': state,
+        'text': text,
+        'item_prefix': item_prefix,
+        'back': back_callback,
+        'source': source,
+        'exclude': list(exclude),
+        'filter': '',
+    }
+    pickers = context.user_data.get('picker')
+    if not pickers or 'state' in pickers:
+        pickers = context.user_data['picker'] = {}
+    pickers[flow] = picker
+
+    text, reply_markup = _render_picker(picker)
+    await query.message.edit_text(text, reply_markup=reply_markup)
+    return state
+
+async def handle_picker_page(update: Update, context: ContextTypes.DEFAULT_TYPE, flow):
+    """Листание страниц и сброс фильтра"""
+    query = update.callback_query
+    await query.answer()
+
+    picker = _get_picker(context, flow)
+    if not picker:
+        await query.message.edit_text("Список устарел, откройте его заново.")
+        return None
+
+    after_id = before_id = None
+    if query.data == 'picker_clear':
+        picker['filter'] = ''
+    else:
+        _, direction, item_id = query.data.split('_')
+        if direction == 'next':
+            after_id = int(item_id)
+        else:
+            before_id = int(item_id)
+
+    text, reply_markup = _render_picker(picker, after_id, before_id)
+    await query.message.edit_text(text, reply_markup=reply_markup)
+    return picker['state']
+
+async def handle_picker_filter(update: Update, context: ContextTypes.DEFAULT_TYPE, flow):
+    """Фильтрация списка по началу названия, введенному текстом"""
+    picker = _get_picker(context, flow)
+    if not picker:
+        return None
+
+    picker['filter'] = ' '.join(update.message.text.split())
+    logger.info(f"Фильтр выбора: {picker['filter']}")
+
+    text, reply_markup = _render_picker(picker)
+    await update.message.reply_text(text, reply_markup=reply_markup)
+    return picker['state']
@@ -0,0 +1,143 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Сколько различных текстов запросов помнить с готовым отпечатком
+FINGERPRINT_CACHE_SIZE = 2048
+# План одного и того же медленного запроса пишется в лог не чаще, чем раз в столько секунд
+PLAN_LOG_INTERVAL_SECONDS = 300
+# Для каких запросов имеет смысл EXPLAIN QUERY PLAN
+EXPLAINABLE = ('select', 'with', 'insert', 'update', 'delete', 'replace')
+
+_COMMENT = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'(?:\?\d*|:\w+|@\w+|\$\w+)')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+def fingerprint(sql):
+    """Нормализует запрос: литералы и параметры -> ?, списки IN (?, ?, ...) -> (?+), пробелы схлопываются"""
+    text = _COMMENT.sub(' ', sql)
+    text = _STRING.sub('?', text)
+    text = _NUMBER.sub('?', text)
+    text = _PLACEHOLDER.sub('?', text)
+    text = _IN_LIST.sub('(?+)', text)
+    return _WHITESPACE.sub(' ', text).strip().rstrip(';').lower()
+
+class QueryStats:
+    __slots__ = ('fingerprint', 'count', 'total', 'max', 'slow', 'plan_logged_at')
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+        self.plan_logged_at = 0.0
+
+class QueryProfiler:
+    """Счетчики и время по отпечаткам запросов, журнал медленных запросов с планом.
+
+    Вызывается из TimedCursor (instrumentation.py) для запросов через
+    get_connection() и через aiosqlite, поэтому может работать из разных
+    потоков одновременно.
+    """
+
+    def __init__(self, slow_query_ms=100):
+        self.slow_threshold = slow_query_ms / 1000
+        self._stats = {}
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def _stats_for(self, sql):
+        key = self._fingerprints.get(sql)
+        if key is None:
+            key = fingerprint(sql)
+            if len(self._fingerprints) >= FINGERPRINT_CACHE_SIZE:
+                self._fingerprints.clear()
+            self._fingerprints[sql] = key
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = QueryStats(key)
+        return stats
+
+    def observe(self, connection, sql, parameters, seconds, fetch_seconds=None):
+        """Учитывает выполнение запроса; fetch_seconds - догоняющий учет выборки строк того же выполнения"""
+        with self._lock:
+            stats = self._stats_for(sql)
+            if fetch_seconds is None:
+                stats.count += 1
+                stats.total += seconds
+                elapsed = seconds
+                already_slow = False
+            else:
+                stats.total += fetch_seconds
+                elapsed = seconds + fetch_seconds
+                already_slow = seconds > self.slow_threshold
+            stats.max = max(stats.max, elapsed)
+            if elapsed <= self.slow_threshold or already_slow:
+                return
+            stats.slow += 1
+            now = time.monotonic()
+            log_plan = now - stats.plan_logged_at > PLAN_LOG_INTERVAL_SECONDS
+            if log_plan:
+                stats.plan_logged_at = now
+
+        message = f"Медленный запрос {elapsed * 1000:.0f} мс: {stats.fingerprint}"
+        if log_plan:
+            message += "\n" + self.explain(connection, sql, parameters)
+        logger.warning(message)
+
+    @staticmethod
+    def explain(connection, sql, parameters):
+        if not sql.lstrip().lower().startswith(EXPLAINABLE):
+            return "(план не строится для этого типа запроса)"
+        try:
+            cursor = sqlite3.Connection.cursor(connection)
+            rows = cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+        except sqlite3.Error as e:
+            return f"(не удалось получить план: {e})"
+        depth = {0: 0}
+        lines = []
+        for node_id, parent_id, _, detail in rows:
+            depth[node_id] = depth.get(parent_id, 0) + 1
+            lines.append(f"{'  ' * depth[node_id]}{detail}")
+        return '\n'.join(lines)
+
+    def top(self, limit=10, key='total'):
+        with self._lock:
+            stats = list(self._stats.values())
+        return sorted(stats, key=lambda item: getattr(item, key), reverse=True)[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.started = time.time()
+
+    def format_report(self, limit=10, max_query_length=200):
+        """Топ запросов по суммарному времени"""
+        top = self.top(limit)
+        if not top:
+            return "Запросов к базе пока не было."
+        minutes = (time.time() - self.started) / 60
+        lines = [f"🗄 Запросы к базе за {minutes:.0f} мин (по суммарному времени):"]
+        for index, stats in enumerate(top, 1):
+            query = stats.fingerprint
+            if len(query) > max_query_length:
+                query = query[:max_query_length] + '…'
+            lines.append(
+                f"\n{index}. {query}\n"
+                f"   вызовов {stats.count}, всего {stats.total * 1000:.0f} мс, "
+                f"среднее {stats.total / max(stats.count, 1) * 1000:.1f} мс, "
+                f"максимум {stats.max * 1000:.0f} мс, медленных {stats.slow}"
+            )
+        return '\n'.join(lines)
+
+# Порог медленного запроса задается при запуске бота (SLOW_QUERY_MS)
+query_profiler = QueryProfiler()
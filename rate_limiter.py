@@ -0,0 +1,226 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from instrumentation import add_api_time
+
+logger = logging.getLogger(__name__)
+
+# Полосы приоритета: меньшее число обслуживается раньше
+LANE_INTERACTIVE = 0
+LANE_NORMAL = 1
+LANE_BULK = 2
+
+LANE_NAMES = {
+    LANE_INTERACTIVE: 'ответы на кнопки',
+    LANE_NORMAL: 'сообщения',
+    LANE_BULK: 'файлы и рассылки',
+}
+
+# Ответы на нажатия и правки сообщений пользователь ждет прямо сейчас
+INTERACTIVE_ENDPOINTS = {
+    'answerCallbackQuery', 'answerInlineQuery',
+    'editMessageText', 'editMessageReplyMarkup', 'editMessageCaption',
+}
+BULK_ENDPOINTS = {
+    'sendDocument', 'sendPhoto', 'sendMediaGroup', 'sendVideo', 'sendAudio',
+}
+
+# Ограничения Telegram: около 30 сообщений в секунду всего,
+# не чаще раза в секунду в личный чат и 20 в минуту в группу
+GLOBAL_RATE = 30
+PRIVATE_CHAT_RATE = 1
+GROUP_CHAT_RATE = 20 / 60
+CHAT_BURST = 3
+
+DELAY_SAMPLES = 1000
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Сколько ждать до следующего токена"""
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+class PriorityRateLimiter(BaseRateLimiter):
+    """Очередь исходящих запросов к Bot API с лимитами и полосами приоритета.
+
+    Запрос ждет токен в общей корзине и в корзине своего чата. Свободный
+    токен достается ожидающему из самой приоритетной полосы, а внутри
+    полосы - пришедшему раньше; чат, исчерпавший свой лимит, не задерживает
+    запросы в другие чаты. При RetryAfter все отправки приостанавливаются
+    на указанное время, и запрос повторяется.
+
+    Полосу можно задать явно: bot.send_message(..., rate_limit_args={'lane': LANE_BULK}).
+    """
+
+    def __init__(self, global_rate=GLOBAL_RATE, max_retries=2):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.max_retries = max_retries
+        self._chat_buckets = {}
+        # Ожидающие: [(полоса, номер, chat_id, future, время постановки)]
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._paused_until = 0.0
+        self._dispatcher = None
+        self.retry_after_count = 0
+        self.sent = {lane: 0 for lane in LANE_NAMES}
+        self._delays = {lane: deque(maxlen=DELAY_SAMPLES) for lane in LANE_NAMES}
+
+    async def initialize(self):
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+    @staticmethod
+    def _lane(endpoint, rate_limit_args):
+        if isinstance(rate_limit_args, dict) and rate_limit_args.get('lane') in LANE_NAMES:
+            return rate_limit_args['lane']
+        if endpoint in INTERACTIVE_ENDPOINTS:
+            return LANE_INTERACTIVE
+        if endpoint in BULK_ENDPOINTS:
+            return LANE_BULK
+        return LANE_NORMAL
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            bucket = TokenBucket(GROUP_CHAT_RATE if is_group else PRIVATE_CHAT_RATE, CHAT_BURST)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        lane = self._lane(endpoint, rate_limit_args)
+        chat_id = data.get('chat_id')
+        for attempt in range(self.max_retries + 1):
+            queued = time.perf_counter()
+            await self._acquire(lane, chat_id)
+            started = time.perf_counter()
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                retry_after = retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+                self.retry_after_count += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                self._wakeup.set()
+                logger.warning(f"Telegram просит подождать {retry_after} с ({endpoint}), попытка {attempt + 1}")
+                if attempt == self.max_retries:
+                    raise
+            finally:
+                add_api_time(time.perf_counter() - started, started - queued)
+
+    async def _acquire(self, lane, chat_id):
+        if self._dispatcher is None:
+            await self.initialize()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((lane, next(self._sequence), chat_id, future, time.monotonic()))
+        self._wakeup.set()
+        await future
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            next_delay = None
+
+            if now < self._paused_until:
+                next_delay = self._paused_until - now
+            else:
+                next_delay = self._grant(now)
+
+            if len(self._chat_buckets) > 1000:
+                self._drop_idle_buckets(now)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), next_delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _grant(self, now):
+        """Выдает токены ожидающим; возвращает, через сколько проверить снова"""
+        self.global_bucket.refill(now)
+        next_delay = None
+        self._waiters.sort(key=lambda waiter: waiter[:2])
+        remaining = []
+        for index, waiter in enumerate(self._waiters):
+            lane, _, chat_id, future, queued_at = waiter
+            if future.done():
+                continue
+            if self.global_bucket.tokens < 1:
+                next_delay = self.global_bucket.delay()
+                remaining.extend(self._waiters[index:])
+                break
+
+            bucket = self._chat_bucket(chat_id) if chat_id is not None else None
+            if bucket:
+                bucket.refill(now)
+                if bucket.tokens < 1:
+                    delay = bucket.delay()
+                    next_delay = delay if next_delay is None else min(next_delay, delay)
+                    remaining.append(waiter)
+                    continue
+                bucket.tokens -= 1
+
+            self.global_bucket.tokens -= 1
+            self.sent[lane] += 1
+            self._delays[lane].append(now - queued_at)
+            future.set_result(None)
+        self._waiters = [waiter for waiter in remaining if not waiter[3].done()]
+        return next_delay
+
+    def _drop_idle_buckets(self, now):
+        for chat_id, bucket in list(self._chat_buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity:
+                del self._chat_buckets[chat_id]
+
+    def get_stats(self):
+        """Очередь и задержки по полосам"""
+        stats = {'paused': max(0.0, self._paused_until - time.monotonic()), 'retry_after': self.retry_after_count, 'lanes': {}}
+        for lane in LANE_NAMES:
+            delays = sorted(self._delays[lane])
+            stats['lanes'][lane] = {
+                'queued': sum(1 for waiter in self._waiters if waiter[0] == lane and not waiter[3].done()),
+                'sent': self.sent[lane],
+                'delay_p95': delays[min(len(delays) - 1, int(len(delays) * 0.95))] if delays else 0.0,
+                'delay_max': delays[-1] if delays else 0.0,
+            }
+        return stats
+
+def format_rate_limiter_stats(stats):
+    """Текст отчета об исходящей очереди для администратора"""
+    text = "📤 Исходящие запросы\n\n"
+    for lane, lane_stats in stats['lanes'].items():
+        text += (
+            f"{LANE_NAMES[lane]}: в очереди {lane_stats['queued']}, отправлено {lane_stats['sent']}, "
+            f"задержка 95% {lane_stats['delay_p95'] * 1000:.0f} мс, "
+            f"максимум {lane_stats['delay_max'] * 1000:.0f} мс\n"
+        )
+    text += f"Ответов RetryAfter: {stats['retry_after']}"
+    if stats['paused']:
+        text += f"\nОтправка приостановлена еще на {stats['paused']:.0f} с"
+    return text
@@ -0,0 +1,230 @@
+import asyncio
+import functools
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from database import get_connection
+from instrumentation import Histogram, render_histogram
+from migrations import PART_TABLES
+
+logger = logging.getLogger(__name__)
+
+# Фоновые задачи идут от секунд (контрольная точка WAL) до часов (проверка чертежей)
+JOB_SECONDS_BUCKETS = (0.01, 0.1, 1, 10, 60, 300, 1800, 3600)
+
+class JobMetrics:
+    """Время, ошибки и пропуски фоновых задач"""
+
+    def __init__(self):
+        self.times = {}
+        self.waits = {}
+        self.failures = {}
+        self.skipped = {}
+        self.last_finished = {}
+
+    def observe(self, name, seconds, waited, failed):
+        for values, value in ((self.times, seconds), (self.waits, waited)):
+            histogram = values.get(name)
+            if histogram is None:
+                histogram = values[name] = Histogram(JOB_SECONDS_BUCKETS)
+            histogram.observe(value)
+        if failed:
+            self.failures[name] = self.failures.get(name, 0) + 1
+        self.last_finished[name] = time.time()
+
+    def skip(self, name):
+        self.skipped[name] = self.skipped.get(name, 0) + 1
+
+    def render_prometheus(self):
+        lines = [
+            '# HELP homut_job_seconds Время выполнения фоновой задачи',
+            '# TYPE homut_job_seconds histogram',
+        ]
+        for name, histogram in sorted(self.times.items()):
+            lines += render_histogram('homut_job_seconds', f'{{job="{name}"}}', histogram)
+        lines += [
+            '# HELP homut_job_wait_seconds Ожидание свободного места в бюджете фоновых задач',
+            '# TYPE homut_job_wait_seconds histogram',
+        ]
+        for name, histogram in sorted(self.waits.items()):
+            lines += render_histogram('homut_job_wait_seconds', f'{{job="{name}"}}', histogram)
+        for metric, help_text, values in (
+            ('homut_job_failures_total', 'Запуски, завершившиеся исключением', self.failures),
+            ('homut_job_skipped_total', 'Запуски, пропущенные из-за еще идущего предыдущего', self.skipped),
+        ):
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+            for name, value in sorted(values.items()):
+                lines.append(f'{metric}{{job="{name}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def format_report(self):
+        if not self.times and not self.skipped:
+            return "Фоновые задачи еще не запускались."
+        lines = ["Фоновые задачи:"]
+        for name in sorted(set(self.times) | set(self.skipped)):
+            histogram = self.times.get(name)
+            line = f"{name}:"
+            if histogram:
+                ago = time.time() - self.last_finished[name]
+                line += (
+                    f" запусков {histogram.count}, среднее {histogram.sum / histogram.count:.2f} с, "
+                    f"последний {ago / 60:.0f} мин назад"
+                )
+            line += f", ошибок {self.failures.get(name, 0)}, пропущено {self.skipped.get(name, 0)}"
+            lines.append(line)
+        return '\n'.join(lines)
+
+class JobScheduler:
+    """Периодические задачи обслуживания поверх JobQueue приложения.
+
+    Задачи запускаются со случайным сдвигом (jitter), чтобы не совпадать друг
+    с другом и с пиками нагрузки; новый запуск задачи пропускается, пока идет
+    предыдущий. У задач свой бюджет: не больше max_concurrent одновременно и
+    отдельный пул потоков для блокирующей работы, поэтому они не занимают
+    пул asyncio.to_thread, которым пользуются обработчики обновлений.
+    """
+
+    def __init__(self, application, max_concurrent=1, jitter=0.1):
+        self.application = application
+        self.jitter = jitter
+        self.metrics = JobMetrics()
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='job')
+        self._running = {}
+
+    def add_job(self, name, callback, interval, first=None):
+        """Запускает корутину callback() каждые interval секунд; первый раз - через first секунд"""
+        jitter = interval * self.jitter
+        first = interval if first is None else first
+        self.application.job_queue.run_repeating(
+            self._run_job, interval=interval, first=first + random.uniform(0, jitter), name=name, data=callback,
+            # Пропуск повторного запуска делает _run_job, а APScheduler только сдвигает время
+            job_kwargs={'jitter': jitter, 'max_instances': 2, 'coalesce': True, 'misfire_grace_time': None},
+        )
+
+    def add_daily(self, name, callback, at):
+        """Запускает корутину callback() каждый день во время at (datetime.time с часовым поясом)"""
+        self.application.job_queue.run_daily(self._run_job, at, name=name, data=callback)
+
+    def add_once(self, name, callback, when):
+        self.application.job_queue.run_once(self._run_job, when, name=name, data=callback)
+
+    async def run_blocking(self, func, *args):
+        """Блокирующая работа задачи в пуле потоков задач"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    async def _run_job(self, context):
+        name = context.job.name
+        if name in self._running:
+            self.metrics.skip(name)
+            logger.warning(f"Задача {name} пропущена: предыдущий запуск еще не завершен")
+            return
+
+        self._running[name] = asyncio.current_task()
+        queued = time.perf_counter()
+        try:
+            async with self._semaphore:
+                started = time.perf_counter()
+                failed = False
+                try:
+                    await context.job.data()
+                except Exception as e:
+                    failed = True
+                    logger.error(f"Ошибка в фоновой задаче {name}: {e}", exc_info=True)
+                finally:
+                    self.metrics.observe(name, time.perf_counter() - started, started - queued, failed)
+                logger.debug(f"Задача {name} выполнена за {time.perf_counter() - started:.2f} с")
+        finally:
+            self._running.pop(name, None)
+
+    async def shutdown(self):
+        """Прерывает идущие задачи: JobQueue при остановке их не отменяет (Job.run защищен shield)"""
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+# --- Задачи обслуживания ---
+
+def journal_mode():
+    conn = get_connection()
+    try:
+        return conn.execute("PRAGMA journal_mode").fetchone()[0].lower()
+    finally:
+        conn.close()
+
+def _optimize():
+    conn = get_connection()
+    try:
+        # Ограничение выборки держит ANALYZE коротким и на большой базе
+        conn.execute("PRAGMA analysis_limit = 1000")
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+        conn.commit()
+    finally:
+        conn.close()
+
+async def optimize_database(scheduler):
+    """Обновляет статистику планировщика запросов SQLite"""
+    await scheduler.run_blocking(_optimize)
+
+def _checkpoint():
+    conn = get_connection()
+    try:
+        return conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+    finally:
+        conn.close()
+
+async def checkpoint_wal(scheduler):
+    """Переносит WAL в основной файл, не дожидаясь читателей"""
+    busy, wal_pages, moved = await scheduler.run_blocking(_checkpoint)
+    logger.debug(f"Контрольная точка WAL: страниц {wal_pages}, перенесено {moved}, занято {busy}")
+
+def _hot_stamps(limit):
+    """Штампы с самыми свежими изменениями остатков"""
+    conn = get_connection()
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        selects = ' UNION ALL '.join(
+            f"SELECT stamp_id, last_modified FROM {table_name}" for table_name in PART_TABLES if table_name in tables
+        )
+        rows = conn.execute(f"""
+            SELECT stamp_id FROM ({selects})
+            GROUP BY stamp_id
+            ORDER BY MAX(last_modified) DESC
+            LIMIT ?
+        """, (limit,)).fetchall()
+        return [row[0] for row in rows]
+    finally:
+        conn.close()
+
+def _warm_substitutes(out_of_stock):
+    # Кэш замен заполняется для закончившихся деталей - их открывают чаще всего
+    from substitutes import find_substitutes
+    for table_name, part_id in out_of_stock:
+        find_substitutes(table_name, part_id)
+
+async def warm_hot_stamps(scheduler, limit):
+    """После перезапуска читает остатки самых активных штампов соединением бота,
+    чтобы их страницы уже были в кэше SQLite, и заполняет кэш замен"""
+    stamp_ids = await scheduler.run_blocking(_hot_stamps, limit)
+    if not stamp_ids:
+        return
+    db = scheduler.application.db
+    placeholders = ', '.join('?' for _ in stamp_ids)
+    out_of_stock = []
+    for table_name in PART_TABLES:
+        try:
+            async with db.execute(f"SELECT * FROM {table_name} WHERE stamp_id IN ({placeholders})", stamp_ids) as cursor:
+                names = [description[0] for description in cursor.description]
+                for row in await cursor.fetchall():
+                    data = dict(zip(names, row))
+                    if (data.get('quantity') or 0) <= 0:
+                        out_of_stock.append((table_name, data['id']))
+        except Exception as e:
+            logger.debug(f"Прогрев {table_name} пропущен: {e}")
+    await scheduler.run_blocking(_warm_substitutes, out_of_stock)
+    logger.info(f"Прогреты остатки штампов {stamp_ids}, замен для закончившихся деталей: {len(out_of_stock)}")
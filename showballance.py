@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.constants import ParseMode
@@ -6,6 +7,8 @@ from menu import menu
 from database import get_stamp_id_by_action
 from menu import process_main_menu_action
 from menu import back_to_menu_keyboard
+from substitutes import find_substitutes, format_substitutes
+from timeutil import format_epoch
 
 logger = logging.getLogger(__name__)
 
@@ -71,13 +74,13 @@ async def show_balance(query, context, action, current_menu):
 
         select_columns = base_columns + [col for col in optional_columns if col in column_names]
 
-        # Add timestamp columns if they exist
+        # Отметки времени хранятся в секундах UTC и переводятся в местное время при выводе
         if 'createdAt' in column_names:
-            select_columns.append("datetime(createdAt, '+3 hours') as created_at")
+            select_columns.append("createdAt as created_at")
         if 'updatedAt' in column_names:
-            select_columns.append("datetime(updatedAt, '+3 hours') as updated_at")
+            select_columns.append("updatedAt as updated_at")
         if 'last_modified' in column_names:
-            select_columns.append("datetime(last_modified, '+3 hours') as last_modified")
+            select_columns.append("last_modified")
 
         query_text = f"""
             SELECT {', '.join(select_columns)}
@@ -119,25 +122,59 @@ async def show_balance(query, context, action, current_menu):
 
             # Add timestamp information
             if 'created_at' in data:
-                message += f"└ Создано: {data['created_at'] or '(данные отсутствуют)'}\n"
+                message += f"└ Создано: {format_epoch(data['created_at']) or '(данные отсутствуют)'}\n"
             if 'updated_at' in data:
-                message += f"└ Обновлено: {data['updated_at'] or '(данные отсутствуют)'}\n"
+                message += f"└ Обновлено: {format_epoch(data['updated_at']) or '(данные отсутствуют)'}\n"
             if 'last_modified' in data:
-                message += f"└ Последнее изменение: {data['last_modified'] or '(данные отсутствуют)'}\n"
+                message += f"└ Последнее изменение: {format_epoch(data['last_modified']) or '(данные отсутствуют)'}\n"
 
             message += "\n"
 
     change_quantity_action = action.replace('showbalance', 'changequantity')
 
-    keyboard = InlineKeyboardMarkup(
-        [
-            [InlineKeyboardButton("Изменить количество", callback_data=change_quantity_action)],
-            [InlineKeyboardButton("Назад", callback_data='back')],
-        ]
-    )
+    buttons = [[InlineKeyboardButton("Изменить количество", callback_data=change_quantity_action)]]
+    if rows:
+        buttons.append([InlineKeyboardButton(
+            "📝 Инвентаризация", callback_data=action.replace('showbalance', 'stocktake')
+        )])
+    # Для закончившихся деталей предлагаем найти замену на других штампах
+    for row in rows:
+        if (row[2] or 0) <= 0:
+            buttons.append([InlineKeyboardButton(
+                f"🔁 Замена: {row[1]}", callback_data=f"find_substitute_{table}_{row[0]}"
+            )])
+    buttons.append([InlineKeyboardButton("Назад", callback_data='back')])
+    keyboard = InlineKeyboardMarkup(buttons)
 
     await query.message.reply_text(
         message, 
         reply_markup=keyboard,
         parse_mode=ParseMode.HTML
-    )
\ No newline at end of file
+    )
+
+async def show_substitutes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Показывает совместимые детали с других штампов, которые есть в наличии"""
+    query = update.callback_query
+    await query.answer()
+
+    table, part_id = query.data[len('find_substitute_'):].rsplit('_', 1)
+    if table not in CATEGORY_EMOJI:
+        logger.warning(f"Неизвестная категория в запросе замены: {table}")
+        return
+
+    try:
+        result = await asyncio.to_thread(find_substitutes, table, int(part_id))
+    except Exception as e:
+        logger.exception("Ошибка при поиске замены: %s", e)
+        result = None
+
+    if result is None:
+        message = "Деталь не найдена. Возможно, она была удалена."
+    else:
+        message = format_substitutes(result)
+
+    # Из карточки, отправленной через inline-режим, запрос приходит без message
+    if query.message:
+        await query.message.reply_text(message)
+    else:
+        await query.edit_message_text(message)
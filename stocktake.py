@@ -0,0 +1,317 @@
+import asyncio
+import functools
+import html
+import logging
+import re
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import ParseMode
+from telegram.ext import ApplicationHandlerStop, ContextTypes, ConversationHandler
+from database import get_connection, get_stamp_id_by_action
+from menu import menu, get_menu_keyboard, back_to_menu_keyboard
+from name_matching import NameMatcher, normalize_name
+from part_search import part_search_index
+from pickers import Catalog
+from showballance import CATEGORY_EMOJI, show_balance
+from substitutes import invalidate_substitutes
+from timeutil import now_epoch
+from constants import MAX_QUANTITY, States
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_TABLES = {
+    'punches': 'Punches',
+    'inserts': 'Inserts',
+    'stampparts': 'Parts',
+    'knives': 'Knives',
+    'cams': 'Clamps',
+    'discparts': 'Disc_Parts',
+    'pushers': 'Pushers',
+}
+
+# Строк на странице списка: весь экран помещается в одно сообщение
+PAGE_SIZE = 25
+MAX_REPORT_LINES = 30
+MAX_SUGGESTIONS = 3
+
+# «Название=12» до запятой, точки с запятой или конца строки
+ENTRY_PATTERN = re.compile(r'\s*(?P<name>[^=]+?)\s*=\s*(?P<count>[^,;\s]*)\s*(?:[,;]|$)')
+
+def parse_counts(text):
+    """Разбирает «А=12, Б=7» или по одной позиции в строке.
+
+    Возвращает ([(имя, количество как текст)], [ошибки]).
+    """
+    entries = []
+    errors = []
+    for line in text.splitlines():
+        position = 0
+        while line[position:].strip():
+            match = ENTRY_PATTERN.match(line, position)
+            if not match:
+                errors.append(f"не разобрано «{_shorten(line[position:].strip())}» - нужно «название=количество»")
+                break
+            entries.append((match['name'], match['count']))
+            position = match.end()
+    return entries, errors
+
+def _shorten(text, limit=40):
+    # Ошибки повторяют ввод; длинный ввод не должен раздувать ответ сверх лимита Telegram
+    return text if len(text) <= limit else text[:limit] + '…'
+
+def resolve_counts(entries, items):
+    """Сопоставляет введенные имена с позициями категории.
+
+    items - [(id, имя, количество)]. Возвращает ({id: новое количество}, [ошибки]);
+    опечатки не исправляются молча, а попадают в ошибки с подсказкой.
+    """
+    by_key = {}
+    for item_id, name, _ in items:
+        by_key.setdefault(normalize_name(name), []).append(item_id)
+    names = {item_id: name for item_id, name, _ in items}
+    matcher = None
+
+    counts = {}
+    errors = []
+    for name, count in entries:
+        found = by_key.get(normalize_name(name), [])
+        if not found:
+            if matcher is None:
+                matcher = NameMatcher((item_id, item_name) for item_id, item_name, _ in items)
+            suggestions = [names[item_id] for _, item_id in matcher.similar(name)[:MAX_SUGGESTIONS]]
+            error = f"«{_shorten(name)}» не найдена"
+            if suggestions:
+                error += f", возможно: {', '.join(suggestions)}"
+            errors.append(error)
+            continue
+        if len(found) > 1:
+            errors.append(f"«{_shorten(name)}»: несколько позиций с таким названием, измените их по одной")
+            continue
+        # Длина проверяется до int(): очень длинную строку цифр int() не примет
+        if not (count.isascii() and count.isdigit() and len(count.lstrip('0')) <= len(str(MAX_QUANTITY))
+                and int(count) <= MAX_QUANTITY):
+            errors.append(f"«{_shorten(name)}»: количество должно быть числом от 0 до {MAX_QUANTITY}, а не «{_shorten(count)}»")
+            continue
+        if found[0] in counts:
+            errors.append(f"«{_shorten(name)}» указана дважды")
+            continue
+        counts[found[0]] = int(count)
+    return counts, errors
+
+def _stop_other_handlers(callback):
+    """Диалог инвентаризации стоит в группе -1, раньше остальных диалогов: его кнопки
+    и количества не должны доходить до основной группы, где их перехватил бы диалог,
+    оставленный в ожидании текста"""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        raise ApplicationHandlerStop(await callback(update, context))
+    return wrapper
+
+def _active_stocktake(context):
+    """Данные идущей инвентаризации или None, если ее нет или она заброшена.
+
+    Таймаут диалога не переживает перезапуск бота, поэтому срок проверяется
+    и по времени последнего действия, сохраненному в user_data.
+    """
+    from config import STOCKTAKE_TIMEOUT_SECONDS
+
+    stocktake = context.user_data.get('stocktake')
+    if not stocktake:
+        return None
+    if STOCKTAKE_TIMEOUT_SECONDS and now_epoch() - stocktake.get('updated_at', 0) > STOCKTAKE_TIMEOUT_SECONDS:
+        context.user_data.pop('stocktake', None)
+        return None
+    stocktake['updated_at'] = now_epoch()
+    return stocktake
+
+async def _fetch_items(db, table, stamp_id):
+    async with db.execute(f"SELECT id, name, quantity FROM {table} WHERE stamp_id = ?", (stamp_id,)) as cursor:
+        return [(item_id, name, quantity or 0) for item_id, name, quantity in await cursor.fetchall()]
+
+def apply_counts(table, stamp_id, counts):
+    """Записывает новые количества одной транзакцией; возвращает [(имя, было, стало)].
+
+    Запись идет через отдельное соединение с BEGIN IMMEDIATE: общее соединение
+    бота используют параллельные обработчики других чатов, и commit или rollback
+    на нем затронул бы и их незавершенные изменения. Остатки "было" читаются
+    внутри той же транзакции. Позиции с неизменным количеством не трогаются;
+    записи в Quantity_Ledger делают триггеры в той же транзакции.
+    """
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(f"SELECT id, name, quantity FROM {table} WHERE stamp_id = ?", (stamp_id,))
+        changes = [
+            (item_id, name, quantity, counts[item_id])
+            for item_id, name, quantity in cursor.fetchall()
+            if item_id in counts and counts[item_id] != quantity
+        ]
+        modified = now_epoch()
+        cursor.executemany(
+            f"UPDATE {table} SET quantity = ?, last_modified = ? WHERE id = ? AND stamp_id = ?",
+            [(after, modified, item_id, stamp_id) for item_id, _, _, after in changes],
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return [(name, before, after) for _, name, before, after in changes]
+
+def _render_page(stocktake, items, current_menu, after_id=None, before_id=None):
+    """Текст и клавиатура страницы; запоминает ее начало для повторного показа"""
+    catalog = Catalog([(item_id, name, f"{name}: {quantity}") for item_id, name, quantity in items])
+    page, has_prev, has_next = catalog.page(after_id=after_id, before_id=before_id, size=PAGE_SIZE)
+    if not page:
+        page, has_prev, has_next = catalog.page(size=PAGE_SIZE)
+    first = catalog.positions[page[0][0]]
+    stocktake['after_id'] = catalog.items[first - 1][0] if first else None
+
+    title = menu.get(current_menu, {}).get('text', stocktake['table'])
+    text = (
+        f"📝 <b>Инвентаризация: {CATEGORY_EMOJI.get(stocktake['table'], '📦')} {html.escape(title)}</b>\n\n"
+        "Отправьте пересчитанные количества одним сообщением: «Название=12, Другое=7» "
+        "или по одной позиции в строке. Сохраняется все сразу и только если все строки верны.\n\n"
+    )
+    text += '\n'.join(html.escape(label) for _, _, label in page)
+    if has_prev or has_next:
+        text += f"\n\nПозиции {first + 1}-{first + len(page)} из {len(catalog)}"
+
+    keyboard = []
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton("◀️", callback_data=f"stocktake_prev_{page[0][0]}"))
+    if has_next:
+        navigation.append(InlineKeyboardButton("▶️", callback_data=f"stocktake_next_{page[-1][0]}"))
+    if navigation:
+        keyboard.append(navigation)
+    keyboard.append([InlineKeyboardButton("✅ Готово", callback_data='stocktake_done')])
+    return text, InlineKeyboardMarkup(keyboard)
+
+@_stop_other_handlers
+async def stocktake_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> States:
+    """Экран инвентаризации: все позиции категории штампа с текущими остатками"""
+    query = update.callback_query
+    await query.answer()
+    current_menu = context.user_data.get('current_menu', 'main_menu')
+
+    match = re.match(r'^stocktake([a-z]+)([\w_]+)$', query.data)
+    table = CATEGORY_TABLES.get(match.group(1)) if match else None
+    stamp_id = await get_stamp_id_by_action(query.data) if table else None
+    if not stamp_id:
+        logger.warning(f"Не удалось начать инвентаризацию: {query.data}")
+        await query.message.reply_text("Не удалось определить штамп.", reply_markup=back_to_menu_keyboard(current_menu))
+        return ConversationHandler.END
+
+    items = await _fetch_items(context.application.db, table, stamp_id)
+    if not items:
+        await query.message.reply_text("Нет позиций для инвентаризации.", reply_markup=back_to_menu_keyboard(current_menu))
+        return ConversationHandler.END
+
+    stocktake = {
+        'table': table,
+        'stamp_id': stamp_id,
+        'balance_action': query.data.replace('stocktake', 'showbalance', 1),
+        'after_id': None,
+        'updated_at': now_epoch(),
+    }
+    context.user_data['stocktake'] = stocktake
+    logger.info(f"Инвентаризация {table} штампа {stamp_id}: позиций {len(items)}")
+
+    text, reply_markup = _render_page(stocktake, items, current_menu)
+    await query.message.reply_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+    return States.STOCKTAKE_ENTERING_COUNTS
+
+@_stop_other_handlers
+async def stocktake_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> States:
+    query = update.callback_query
+    await query.answer()
+    stocktake = _active_stocktake(context)
+    if not stocktake:
+        await query.message.edit_text("Инвентаризация устарела, откройте ее заново.")
+        return ConversationHandler.END
+
+    _, direction, item_id = query.data.split('_')
+    items = await _fetch_items(context.application.db, stocktake['table'], stocktake['stamp_id'])
+    text, reply_markup = _render_page(
+        stocktake, items, context.user_data.get('current_menu', 'main_menu'),
+        after_id=int(item_id) if direction == 'next' else None,
+        before_id=int(item_id) if direction == 'prev' else None,
+    )
+    await query.message.edit_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+    return States.STOCKTAKE_ENTERING_COUNTS
+
+@_stop_other_handlers
+async def stocktake_counts(update: Update, context: ContextTypes.DEFAULT_TYPE) -> States:
+    """Проверяет все введенные количества и сохраняет их одной транзакцией"""
+    stocktake = _active_stocktake(context)
+    if not stocktake:
+        await update.message.reply_text("Инвентаризация устарела, откройте ее заново.")
+        return ConversationHandler.END
+
+    db = context.application.db
+    table, stamp_id = stocktake['table'], stocktake['stamp_id']
+    items = await _fetch_items(db, table, stamp_id)
+    entries, errors = parse_counts(update.message.text)
+    counts, resolve_errors = resolve_counts(entries, items)
+    errors += resolve_errors
+    if not entries and not errors:
+        errors.append("нет ни одной позиции - нужно «название=количество»")
+
+    if errors:
+        message = "Ничего не сохранено, исправьте и отправьте сообщение заново:\n"
+        message += '\n'.join(f"• {error}" for error in errors[:MAX_REPORT_LINES])
+        if len(errors) > MAX_REPORT_LINES:
+            message += f"\n… и еще ошибок: {len(errors) - MAX_REPORT_LINES}"
+        await update.message.reply_text(message)
+        return States.STOCKTAKE_ENTERING_COUNTS
+
+    try:
+        changes = await asyncio.to_thread(apply_counts, table, stamp_id, counts)
+    except Exception as e:
+        logger.exception(f"Ошибка при сохранении инвентаризации {table} штампа {stamp_id}: {e}")
+        await update.message.reply_text("Ошибка при сохранении, ничего не изменено. Попробуйте еще раз.")
+        return States.STOCKTAKE_ENTERING_COUNTS
+    logger.info(f"Инвентаризация {table} штампа {stamp_id}: проверено {len(counts)}, изменено {len(changes)}")
+    if changes:
+        invalidate_substitutes()
+        await part_search_index.refresh_stamp(table, stamp_id)
+
+    message = f"Сохранено. Проверено позиций: {len(counts)}, изменено: {len(changes)}"
+    for name, before, after in changes[:MAX_REPORT_LINES]:
+        message += f"\n• {name}: {before} → {after}"
+    if len(changes) > MAX_REPORT_LINES:
+        message += f"\n… и еще {len(changes) - MAX_REPORT_LINES}"
+    await update.message.reply_text(message)
+
+    # Список с обновленными остатками - на той же странице
+    items = await _fetch_items(db, table, stamp_id)
+    text, reply_markup = _render_page(
+        stocktake, items, context.user_data.get('current_menu', 'main_menu'), after_id=stocktake['after_id']
+    )
+    await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+    return States.STOCKTAKE_ENTERING_COUNTS
+
+@_stop_other_handlers
+async def stocktake_done(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    stocktake = context.user_data.pop('stocktake', None)
+    current_menu = context.user_data.get('current_menu', 'main_menu')
+    if stocktake:
+        await show_balance(query, context, stocktake['balance_action'], current_menu)
+    else:
+        await query.message.reply_text(menu['main_menu']['text'], reply_markup=get_menu_keyboard('main_menu'))
+    return ConversationHandler.END
+
+async def end_stocktake(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Завершает инвентаризацию: таймаут или переход к другому действию.
+
+    Сохраненные сообщения остаются в базе. Обновление дальше обрабатывают
+    основные обработчики: кнопка или /start выполняют свое действие.
+    """
+    stocktake = context.user_data.pop('stocktake', None)
+    if stocktake:
+        logger.info(f"Инвентаризация {stocktake['table']} штампа {stocktake['stamp_id']} завершена без кнопки «Готово»")
+    return ConversationHandler.END
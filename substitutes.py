@@ -0,0 +1,101 @@
+import logging
+from database import get_connection
+from compatibility_graph import compatibility_graph
+
+logger = logging.getLogger(__name__)
+
+MAX_SUBSTITUTES = 10
+
+# (category, part_id) -> (версия графа, результат поиска)
+_cache = {}
+
+def invalidate_substitutes():
+    """Сбрасывает кэш после изменения остатков.
+
+    Изменения совместимости сбрасывают кэш сами через версию графа.
+    """
+    _cache.clear()
+
+def _collect_candidates(category, part_id, stamp_id):
+    """Ищет в графе детали той же категории с других штампов, подходящие на stamp_id.
+
+    Возвращает (part_id -> (прямая связь, заметки), stamp_id -> (прямая связь, заметки)):
+    конкретные детали и штампы, все детали категории которых подходят по связи на уровне категории.
+    """
+    parts, stamps = {}, {}
+    for key, other_id, direct, notes in compatibility_graph.compatible_with_stamp(stamp_id):
+        key_category, key_part_id = key
+        if key_category != category:
+            continue
+        if key_part_id is None:
+            stamps[other_id] = (direct, notes)
+        elif key_part_id != part_id and compatibility_graph.get_owner(key) == other_id:
+            parts[key_part_id] = (direct, notes)
+    return parts, stamps
+
+def find_substitutes(category, part_id):
+    """Возвращает деталь и ее замены в наличии, отсортированные по остатку.
+
+    Результат: (name, stamp_name, quantity, [(id, name, stamp_name, quantity, direct, notes), ...])
+    или None, если деталь не найдена.
+    """
+    cached = _cache.get((category, part_id))
+    if cached and cached[0] == compatibility_graph.version:
+        return cached[1]
+
+    version = compatibility_graph.version
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT p.name, p.stamp_id, s.name, p.quantity
+            FROM {category} p
+            JOIN Stamps s ON s.id = p.stamp_id
+            WHERE p.id = ?
+        """, (part_id,))
+        part = cursor.fetchone()
+        if not part:
+            return None
+        name, stamp_id, stamp_name, quantity = part
+
+        linked_parts, linked_stamps = _collect_candidates(category, part_id, stamp_id)
+        candidates = []
+        if linked_parts or linked_stamps:
+            part_placeholders = ', '.join('?' for _ in linked_parts) or 'NULL'
+            stamp_placeholders = ', '.join('?' for _ in linked_stamps) or 'NULL'
+            # Остатки всех кандидатов одним запросом, сразу по убыванию количества
+            cursor.execute(f"""
+                SELECT p.id, p.name, p.stamp_id, s.name, p.quantity
+                FROM {category} p
+                JOIN Stamps s ON s.id = p.stamp_id
+                WHERE p.quantity > 0
+                  AND (p.id IN ({part_placeholders}) OR p.stamp_id IN ({stamp_placeholders}))
+                ORDER BY p.quantity DESC, s.name, p.name
+                LIMIT ?
+            """, (*linked_parts, *linked_stamps, MAX_SUBSTITUTES))
+            for candidate_id, candidate_name, candidate_stamp_id, candidate_stamp, candidate_quantity in cursor.fetchall():
+                direct, notes = linked_parts.get(candidate_id) or linked_stamps[candidate_stamp_id]
+                candidates.append((candidate_id, candidate_name, candidate_stamp, candidate_quantity, direct, notes))
+    finally:
+        conn.close()
+
+    result = (name, stamp_name, quantity, candidates)
+    _cache[(category, part_id)] = (version, result)
+    logger.info(f"Поиск замены для {category} {part_id}: найдено {len(candidates)}")
+    return result
+
+def format_substitutes(result):
+    """Текст ответа с заменами для одной детали"""
+    name, stamp_name, quantity, candidates = result
+    message = f"🔁 Замена для «{name}» (штамп {stamp_name}, остаток {quantity})\n\n"
+    if not candidates:
+        return message + "Совместимых деталей в наличии на других штампах нет."
+
+    for _, candidate_name, candidate_stamp, candidate_quantity, direct, notes in candidates:
+        message += f"• {candidate_name} — {candidate_stamp}: {candidate_quantity} шт."
+        if not direct:
+            message += " ⛓ через цепочку"
+        if notes:
+            message += f" ({notes})"
+        message += "\n"
+    return message
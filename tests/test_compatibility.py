@@ -0,0 +1,37 @@
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import compatibility
+from compatibility_graph import CompatibilityGraph
+
+
+def _stamps_db():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE Stamps (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.executemany("INSERT INTO Stamps VALUES (?, ?)", [(1, '14.0'), (3, '16.0')])
+    return conn
+
+
+def test_same_named_parts_with_and_without_notes(monkeypatch):
+    graph = CompatibilityGraph()
+    # Две одноименные детали разных штампов: поля совпадают до заметок
+    graph.add_link(('Punches', 1), 1, 3, owner=1, label='Punches - П-10')
+    graph.add_link(('Punches', 2), 1, 3, owner=3, label='Punches - П-10', notes='после доработки')
+    monkeypatch.setattr(compatibility, 'compatibility_graph', graph)
+    monkeypatch.setattr(compatibility, 'get_connection', _stamps_db)
+
+    query = SimpleNamespace(data='check_stamp_1', answer=AsyncMock(), message=SimpleNamespace(edit_text=AsyncMock()))
+    update = SimpleNamespace(callback_query=query)
+
+    asyncio.run(compatibility.show_compatible_parts(update, SimpleNamespace(user_data={})))
+
+    text = query.message.edit_text.call_args.args[0]
+    assert 'Совместимые детали для штампа 14.0' in text
+    assert text.index('• Punches - П-10\n') < text.index('• Punches - П-10 (после доработки)')
+
+
+def test_sort_key_orders_missing_notes_first():
+    items = [('16.0', 'Punches - П-10', True, 'после доработки'), ('16.0', 'Punches - П-10', True, None)]
+    assert sorted(items, key=compatibility._compatibility_sort_key)[0][3] is None
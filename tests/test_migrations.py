@@ -0,0 +1,58 @@
+import sqlite3
+
+import migrations
+
+
+def _legacy_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE Stamps (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, size TEXT, description TEXT)")
+    conn.execute('''
+        CREATE TABLE Punches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, stamp_id INTEGER, name TEXT, quantity INTEGER,
+            type TEXT, size TEXT, image_url TEXT, description TEXT,
+            createdAt TIMESTAMP, updatedAt TIMESTAMP, last_modified TIMESTAMP
+        )
+    ''')
+    conn.execute("INSERT INTO Stamps (name) VALUES ('14.0')")
+    # Пустой last_modified и last_modified, записанный ботом в местном времени (+3 часа)
+    conn.executemany(
+        "INSERT INTO Punches (stamp_id, name, quantity, createdAt, updatedAt, last_modified) VALUES (1, ?, 1, ?, ?, ?)",
+        [
+            ('П-1', '2025-01-01 10:00:00', '2025-01-01 10:00:00', None),
+            ('П-2', '2025-01-01 10:00:00', '2025-01-01 10:00:00', '2025-01-01 13:00:00'),
+        ]
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_backfilled_last_modified_is_not_shifted(tmp_path):
+    path = str(tmp_path / 'inventory.db')
+    _legacy_db(path)
+
+    migrations.migrate(path)
+
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT name, updatedAt, last_modified FROM Punches ORDER BY name").fetchall()
+    conn.close()
+    assert rows == [('П-1', 1735725600, 1735725600), ('П-2', 1735725600, 1735725600)]
+
+
+def test_double_shifted_rows_are_repaired(tmp_path):
+    path = str(tmp_path / 'inventory.db')
+    _legacy_db(path)
+    migrations.migrate(path)
+
+    # База, обновленная старой миграцией 6: заполненная отметка отстает на 3 часа
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE Punches SET last_modified = updatedAt - 10800 WHERE name = 'П-1'")
+    conn.execute("PRAGMA user_version = 9")
+    conn.commit()
+    conn.close()
+
+    migrations.migrate(path)
+
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT updatedAt, last_modified FROM Punches").fetchall()
+    conn.close()
+    assert all(updated == modified for updated, modified in rows)
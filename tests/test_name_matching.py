@@ -0,0 +1,28 @@
+import pytest
+
+from name_matching import NameMatcher, normalize_name
+
+
+@pytest.mark.parametrize('upper, lower', [
+    ('B1', 'b1'),
+    ('HM-12', 'hm-12'),
+    ('T-5', 't-5'),
+    ('MB 40', 'mb 40'),
+])
+def test_case_variants_share_key(upper, lower):
+    assert normalize_name(upper) == normalize_name(lower)
+
+
+@pytest.mark.parametrize('latin, cyrillic', [
+    ('b1', 'В1'),
+    ('hm-12', 'НМ-12'),
+    ('t-5', 'т-5'),
+    ('Ёж', 'ЕЖ'),
+])
+def test_latin_homoglyphs_match_cyrillic(latin, cyrillic):
+    assert normalize_name(latin) == normalize_name(cyrillic)
+
+
+def test_matcher_finds_lowercase_variant():
+    matcher = NameMatcher([(1, 'HM-12'), (2, 'КН-7')])
+    assert matcher.similar('hm-12')[0] == (0, 1)
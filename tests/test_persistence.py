@@ -0,0 +1,53 @@
+import asyncio
+import sqlite3
+
+import migrations
+from persistence import SQLitePersistence
+
+
+def _persistence(tmp_path):
+    path = str(tmp_path / 'inventory.db')
+    migrations.migrate(path)
+    return path, SQLitePersistence(path=path, user_data_ttl_days=30)
+
+
+def _age_rows(path, seconds):
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("UPDATE Bot_User_Data SET updated_at = updated_at - ?", (seconds,))
+        conn.execute("UPDATE Bot_Conversations SET updated_at = updated_at - ?", (seconds,))
+    conn.close()
+
+
+def test_expire_removes_stale_state_while_running(tmp_path):
+    path, persistence = _persistence(tmp_path)
+
+    async def scenario():
+        await persistence.update_user_data(1, {'menu_path': ['main_menu']})
+        await persistence.update_conversation('add_item', (10, 1), 'STATE')
+        await persistence.flush()
+        _age_rows(path, 31 * 24 * 60 * 60)
+        # Пользователь 2 только что изменил данные, они еще в буфере
+        await persistence.update_user_data(2, {'menu_path': ['main_menu']})
+        return await persistence.expire()
+
+    user_ids, conversations = asyncio.run(scenario())
+
+    assert user_ids == [1]
+    assert conversations == [('add_item', (10, 1))]
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT user_id FROM Bot_User_Data").fetchall() == [(2,)]
+    assert conn.execute("SELECT COUNT(*) FROM Bot_Conversations").fetchone() == (0,)
+    conn.close()
+
+
+def test_fresh_state_is_kept(tmp_path):
+    path, persistence = _persistence(tmp_path)
+
+    async def scenario():
+        await persistence.update_user_data(1, {'menu_path': ['main_menu']})
+        await persistence.flush()
+        return await persistence.expire()
+
+    assert asyncio.run(scenario()) == ([], [])
+    assert asyncio.run(persistence.get_user_data()) == {1: {'menu_path': ['main_menu']}}
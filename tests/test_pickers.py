@@ -0,0 +1,32 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pickers
+
+
+def _message():
+    return SimpleNamespace(text='п', edit_text=AsyncMock(), reply_text=AsyncMock())
+
+
+def test_picker_state_is_kept_per_conversation(monkeypatch):
+    catalog = pickers.Catalog([(stamp_id, f"Штамп {stamp_id}", f"Штамп {stamp_id}") for stamp_id in range(1, 40)])
+    monkeypatch.setattr(pickers, 'get_stamp_catalog', lambda: catalog)
+    context = SimpleNamespace(user_data={})
+    query = SimpleNamespace(message=_message(), answer=AsyncMock())
+
+    asyncio.run(pickers.open_picker(query, context, 'DRAWINGS_STATE', "Выберите штамп", "view_", "back", flow='drawings'))
+
+    # Текст в другом диалоге не попадает в брошенный выбор чертежей
+    update = SimpleNamespace(message=_message())
+    assert asyncio.run(pickers.handle_picker_filter(update, context, 'compatibility')) is None
+    update.message.reply_text.assert_not_called()
+
+    assert asyncio.run(pickers.handle_picker_filter(update, context, 'drawings')) == 'DRAWINGS_STATE'
+    assert context.user_data['picker']['drawings']['filter'] == 'п'
+
+
+def test_legacy_shared_picker_is_ignored():
+    context = SimpleNamespace(user_data={'picker': {'state': 'OLD', 'filter': ''}})
+    update = SimpleNamespace(message=_message())
+    assert asyncio.run(pickers.handle_picker_filter(update, context, 'drawings')) is None
@@ -0,0 +1,33 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from telegram.ext import ApplicationHandlerStop, ConversationHandler
+
+import stocktake
+from constants import MAX_QUANTITY
+
+
+ITEMS = [(1, 'П-10', 3), (2, 'П-12', 0)]
+
+
+def test_resolve_counts_rejects_quantity_above_limit():
+    entries, errors = stocktake.parse_counts(f"п-10=7, П-12={MAX_QUANTITY + 1}")
+    counts, resolve_errors = stocktake.resolve_counts(entries, ITEMS)
+    assert not errors
+    assert counts == {1: 7}
+    assert len(resolve_errors) == 1 and 'П-12' in resolve_errors[0]
+
+
+def test_expired_stocktake_answers_instead_of_dropping_text():
+    message = SimpleNamespace(text='П-10=7', reply_text=AsyncMock())
+    update = SimpleNamespace(message=message)
+    context = SimpleNamespace(user_data={'stocktake': {'table': 'Punches', 'stamp_id': 1, 'updated_at': 0}})
+
+    with pytest.raises(ApplicationHandlerStop) as stop:
+        asyncio.run(stocktake.stocktake_counts(update, context))
+
+    assert stop.value.state == ConversationHandler.END
+    assert 'stocktake' not in context.user_data
+    assert 'откройте ее заново' in message.reply_text.call_args.args[0]
@@ -0,0 +1,62 @@
+import logging
+import time
+from datetime import datetime, time as day_time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+DISPLAY_FORMAT = '%d.%m.%Y %H:%M'
+
+# Часовой пояс для вывода; загружается один раз при первом форматировании
+_display_zone = None
+
+def now_epoch():
+    """Текущее время для записи в базу: секунды UTC с 1970 года"""
+    return int(time.time())
+
+def display_zone():
+    global _display_zone
+    if _display_zone is None:
+        from config import TIMEZONE
+        try:
+            _display_zone = ZoneInfo(TIMEZONE)
+        except (ZoneInfoNotFoundError, ValueError):
+            logger.error(f"Часовой пояс {TIMEZONE} не найден, время выводится в UTC")
+            _display_zone = timezone.utc
+    return _display_zone
+
+def format_epoch(value, fmt=DISPLAY_FORMAT):
+    """Секунды UTC из базы -> строка в часовом поясе TIMEZONE; None для пустых значений"""
+    if value is None:
+        return None
+    return datetime.fromtimestamp(int(value), display_zone()).strftime(fmt)
+
+def day_window(days_ago=1):
+    """Границы суток в часовом поясе TIMEZONE: (начало, конец) в секундах UTC и дата"""
+    zone = display_zone()
+    day = datetime.now(zone).date() - timedelta(days=days_ago)
+    start = datetime.combine(day, day_time.min, zone)
+    end = datetime.combine(day + timedelta(days=1), day_time.min, zone)
+    return int(start.timestamp()), int(end.timestamp()), day
+
+def legacy_to_epoch(value, shift_hours=0):
+    """Переводит отметку старого формата в секунды UTC.
+
+    Текст без смещения ('2025-02-22 15:30:00') считается записанным со сдвигом
+    shift_hours от UTC; текст со смещением ('...+03:00') переводится по нему;
+    числа уже являются секундами. Нераспознанные значения дают None.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip()
+    if text.isdigit():
+        return int(text)
+    try:
+        moment = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone(timedelta(hours=shift_hours)))
+    return int(moment.timestamp())
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from telegram.ext import BaseUpdateProcessor
+from logging_setup import bind_update, current_update
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних ожиданий хранится для перцентилей
+WAIT_SAMPLES = 1000
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка внутри чата.
+
+    Обновления разных чатов обрабатываются одновременно (не больше
+    max_concurrent_updates), обновления одного чата - строго по очереди.
+    Очередь чата выстраивается до захвата общего слота, поэтому медленный
+    чат со многими обновлениями не занимает слоты, ожидая сам себя.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        # Ключ чата -> [блокировка, число обновлений в очереди и в работе]
+        self._chat_locks = {}
+        self.waiting = 0
+        self.running = 0
+        self.max_waiting = 0
+        self.processed = 0
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+
+    @staticmethod
+    def _chat_key(update):
+        # Inline-запросы приходят без чата - упорядочиваем их по пользователю
+        if getattr(update, 'effective_chat', None):
+            return ('chat', update.effective_chat.id)
+        if getattr(update, 'effective_user', None):
+            return ('user', update.effective_user.id)
+        return None
+
+    async def process_update(self, update, coroutine):
+        # Все записи лога, сделанные при обработке, получают номер этого обновления
+        log_token = bind_update(update)
+        key = self._chat_key(update)
+        queued_at = time.monotonic()
+        state = {'started': False}
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+
+        entry = None
+        if key is not None:
+            entry = self._chat_locks.setdefault(key, [asyncio.Lock(), 0])
+            entry[1] += 1
+        try:
+            if entry is None:
+                await super().process_update(update, self._measured(coroutine, queued_at, state))
+            else:
+                async with entry[0]:
+                    # Общий лимит одновременных обновлений - семафор базового класса
+                    await super().process_update(update, self._measured(coroutine, queued_at, state))
+        finally:
+            if not state['started']:
+                self.waiting -= 1
+            self.processed += 1
+            if entry is not None:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._chat_locks[key]
+            current_update.reset(log_token)
+
+    async def _measured(self, coroutine, queued_at, state):
+        wait = time.monotonic() - queued_at
+        state['started'] = True
+        self.waiting -= 1
+        self.running += 1
+        self._waits.append(wait)
+        if wait > 1:
+            logger.info(f"Обновление ждало очереди {wait:.2f} с")
+        try:
+            await coroutine
+        finally:
+            self.running -= 1
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def get_stats(self):
+        """Снимок метрик очереди обновлений"""
+        waits = sorted(self._waits)
+        percentile = lambda share: waits[min(len(waits) - 1, int(len(waits) * share))] if waits else 0.0
+        return {
+            'max_concurrent': self.max_concurrent_updates,
+            'running': self.running,
+            'waiting': self.waiting,
+            'max_waiting': self.max_waiting,
+            'active_chats': len(self._chat_locks),
+            'processed': self.processed,
+            'wait_p50': percentile(0.5),
+            'wait_p95': percentile(0.95),
+            'wait_max': waits[-1] if waits else 0.0,
+        }
+
+def format_update_stats(stats):
+    """Текст отчета о нагрузке для администратора"""
+    return (
+        "📊 Обработка обновлений\n\n"
+        f"Одновременно: {stats['running']} из {stats['max_concurrent']}\n"
+        f"Ожидают: {stats['waiting']} (максимум {stats['max_waiting']})\n"
+        f"Чатов с обновлениями в работе: {stats['active_chats']}\n"
+        f"Обработано: {stats['processed']}\n"
+        f"Ожидание в очереди: медиана {stats['wait_p50'] * 1000:.0f} мс, "
+        f"95% {stats['wait_p95'] * 1000:.0f} мс, максимум {stats['wait_max'] * 1000:.0f} мс"
+    )
@@ -0,0 +1,167 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+MAX_BODY_BYTES = 1024 * 1024
+# Telegram держит соединение открытым между обновлениями; простаивающие закрываем
+KEEPALIVE_TIMEOUT_SECONDS = 75
+
+STATUS_TEXT = {
+    200: 'OK',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+}
+
+class WebhookServer:
+    """Минимальный HTTP-сервер для приема обновлений от Telegram.
+
+    Принимает только POST на url_path с верным секретом в заголовке
+    X-Telegram-Bot-Api-Secret-Token и кладет обновление прямо в очередь
+    приложения. Соединения keep-alive: Telegram отправляет следующие
+    обновления по тому же соединению без нового рукопожатия.
+    """
+
+    def __init__(self, application, listen, port, url_path, secret_token):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.url_path = url_path
+        self.secret_token = secret_token.encode()
+        self._server = None
+        # writer -> задача, обслуживающая соединение
+        self._connections = {}
+        self.received = 0
+        self.rejected = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.listen, self.port)
+        logger.info(f"Webhook-сервер слушает {self.listen}:{self.port}{self.url_path}")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            # Простаивающие keep-alive соединения иначе держали бы остановку до таймаута
+            for writer in list(self._connections):
+                writer.close()
+            await asyncio.gather(*self._connections.values(), return_exceptions=True)
+            await self._server.wait_closed()
+            logger.info("Webhook-сервер остановлен.")
+
+    async def _handle_connection(self, reader, writer):
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT_SECONDS)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                keep_alive = await self._handle_request(request_line, reader, writer)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+            logger.debug(f"Соединение webhook прервано: {e}")
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def _handle_request(self, request_line, reader, writer):
+        """Обрабатывает один запрос; возвращает, можно ли читать следующий из соединения"""
+        method, path, version = request_line.decode('latin-1').strip().split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+        length = int(headers.get('content-length', 0))
+        if length > MAX_BODY_BYTES:
+            await self._respond(writer, 413, keep_alive=False)
+            return False
+        body = await reader.readexactly(length) if length else b''
+
+        if path.split('?', 1)[0] != self.url_path:
+            status = 404
+        elif method != 'POST':
+            status = 405
+        elif not hmac.compare_digest(headers.get(SECRET_HEADER, '').encode(), self.secret_token):
+            status = 403
+        else:
+            status = await self._enqueue(body)
+
+        if status != 200:
+            self.rejected += 1
+            logger.warning(f"Отклонен запрос webhook {method} {path}: {status}")
+        await self._respond(writer, status, keep_alive)
+        return keep_alive
+
+    async def _enqueue(self, body):
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except Exception as e:
+            logger.warning(f"Некорректное обновление в webhook: {e}")
+            return 400
+        if update is None:
+            return 400
+        await self.application.update_queue.put(update)
+        self.received += 1
+        return 200
+
+    @staticmethod
+    async def _respond(writer, status, keep_alive):
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+            "Content-Length: 0\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n".encode('latin-1')
+        )
+        await writer.drain()
+
+async def run_webhook(application, listen, port, url_path, webhook_url, secret_token):
+    """Запускает бота в режиме webhook вместо run_polling.
+
+    Повторяет жизненный цикл run_polling: post_init, обработка обновлений
+    до SIGINT/SIGTERM, post_shutdown. Webhook при остановке не удаляется,
+    чтобы обновления копились у Telegram до следующего запуска.
+    """
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    server = WebhookServer(application, listen, port, url_path, secret_token)
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    try:
+        await application.start()
+        await server.start()
+        await application.bot.set_webhook(
+            url=webhook_url,
+            secret_token=secret_token,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        logger.info(f"Webhook установлен: {webhook_url}")
+
+        await stop_event.wait()
+        logger.info(f"Остановка webhook: принято {server.received}, отклонено {server.rejected}")
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)